@@ -23,6 +23,9 @@ from utils.telegram_utils import set_webhook, get_bot_token_and_url
 from utils.config_utils import load_config
 from utils.subscription_utils import get_user_status, limit_enforcer, community_channel_limit_enforcer, get_community_status, admin_channel_limit_enforcer
 from utils import db_utils
+from utils import answer_cache
+from utils import persona_compiler
+from utils import async_answer
 import time
 import requests
 import redis
@@ -129,6 +132,9 @@ app.register_blueprint(youtube_comments_bp)
 from routes_google_reviews import google_reviews_bp
 app.register_blueprint(google_reviews_bp)
 
+# The reranker is warmed per Gunicorn worker by the post_worker_init hook in gunicorn.conf.py,
+# so scripts that import app don't load the model.
+
 # --- PWA Routes for Android Wrapper (Bubblewrap TWA) ---
 @app.route('/manifest.json')
 def serve_manifest():
@@ -1621,7 +1627,7 @@ def stream_answer():
         videos = channel_data.get('videos') or []
         video_ids = {v['video_id'] for v in videos if v and 'video_id' in v}
             
-    stream = answer_question_stream(
+    stream_kwargs = dict(
         question_for_prompt=final_question_with_history, 
         question_for_search=question, 
         channel_data=channel_data, 
@@ -1632,6 +1638,10 @@ def stream_answer():
         active_community_id=active_community_id,
         user_status=user_status
     )
+    # --- PERFORMANCE: Under asgi.py the LLM stream runs on the event loop instead of pinning this thread ---
+    if async_answer.can_handoff(request):
+        return async_answer.handoff_response(stream_kwargs)
+    stream = answer_question_stream(**stream_kwargs)
     return Response(stream, mimetype='text/event-stream')
 
 
@@ -1965,6 +1975,9 @@ def update_chatbot_settings(chatbot_id):
         supabase.table('channels').update(update_data).eq('id', chatbot_id).execute()
         
         # Clear cache
+        if any(field in update_data for field in answer_cache.PERSONA_FIELDS):
+            answer_cache.invalidate_channel(chatbot_id)
+            persona_compiler.recompile(chatbot_id, supabase)
         if redis_client:
             active_community_id = session.get('active_community_id')
             cache_key = f"user_visible_channels:{user_id}:community:{active_community_id or 'none'}"
@@ -2029,6 +2042,8 @@ def regenerate_persona_api(chatbot_id):
             return jsonify({'status': 'error', 'message': 'Failed to extract persona due to an LLM error.'}), 500
             
         supabase.table('channels').update(update_data).eq('id', chatbot_id).execute()
+        answer_cache.invalidate_channel(chatbot_id)
+        persona_compiler.recompile(chatbot_id, supabase)
         
         # Include updated data in response
         return jsonify({
@@ -2364,6 +2379,7 @@ def delete_chatbot_source(chatbot_id, source_id):
 
         # Delete the source itself
         supabase.table('data_sources').delete().eq('id', source_id).execute()
+        answer_cache.invalidate_channel(chatbot_id)
 
         logger.info(f"Deleted data source {source_id} for chatbot {chatbot_id}")
         return jsonify({'status': 'success', 'message': 'Data source deleted successfully'})
@@ -2950,7 +2966,7 @@ def widget_get_channel(channel_name):
         return jsonify({'success': False, 'error': 'Server error'})
 
 def generate_widget_answer(channel_id, question):
-    from utils.qa_utils import answer_question_stream
+    from utils import answer_api
     import json as _json
     import re
     
@@ -2962,31 +2978,19 @@ def generate_widget_answer(channel_id, question):
     channel_data = channel_res.data[0]
     prompt_q = question
     
-    response_text = ""
-    sources = []
     actions = []
     conversation_state = {'flow_id': None, 'flow_node_id': None, 'flow_variables': {}}
     
-    for chunk in answer_question_stream(
+    result = answer_api.answer(
         question_for_prompt=prompt_q,
         question_for_search=question,
         channel_data=channel_data,
         user_id=channel_data.get('creator_id'),
         is_manager=False,
         integration_source='embed'
-    ):
-        if chunk.startswith('data: '):
-            data_str = chunk.replace('data: ', '').strip()
-            if data_str == "[DONE]":
-                break
-            try:
-                parsed_data = json.loads(data_str)
-                if parsed_data.get('answer'):
-                    response_text += parsed_data['answer']
-                if parsed_data.get('sources'):
-                    sources = parsed_data['sources']
-            except json.JSONDecodeError:
-                continue
+    )
+    response_text = result.text
+    sources = result.sources
                 
     # Extract flow trigger marker if present
     actions = []
@@ -2995,10 +2999,8 @@ def generate_widget_answer(channel_id, question):
         trigger_flow_marker = trigger_match.group(1)
         response_text = re.sub(r'\[TRIGGER_FLOW:\s*".*?"\]', '', response_text).strip()
         try:
-            target_flow = None
-            flow_res_by_name = supabase_admin.table('channel_flows').select('id, flow_data').eq('channel_id', channel_data['id']).ilike('name', trigger_flow_marker).limit(1).execute()
-            if flow_res_by_name.data:
-                target_flow = {'flow_id': flow_res_by_name.data[0]['id'], **flow_res_by_name.data[0]['flow_data']}
+            from utils import flow_registry
+            target_flow = flow_registry.resolve_trigger(channel_data['id'], trigger_flow_marker)
             
             if target_flow:
                 from utils.flow_runner import run_flow
@@ -3076,9 +3078,9 @@ def widget_ask_question():
         if flow_id and flow_node_id:
             try:
                 # Ensure the active flow belongs to this channel (avoid cross-channel flow bleed)
-                target_flow_res = supabase_admin.table('channel_flows').select('id, flow_data').eq('id', flow_id).eq('channel_id', channel_id).limit(1).execute()
-                if target_flow_res.data:
-                    target_flow = {'flow_id': target_flow_res.data[0]['id'], **target_flow_res.data[0]['flow_data']}
+                from utils import flow_registry
+                target_flow = flow_registry.get_flow_by_id(channel_id, flow_id)
+                if target_flow:
                     from utils.flow_runner import run_flow, _match_button, _match_list_row
                     
                     # Load nodes to check the current node's buttons
@@ -0,0 +1,75 @@
+"""
+ASGI entry point for the web app.
+
+    gunicorn --worker-class uvicorn.workers.UvicornWorker asgi:application
+
+Every route is still served by Flask, on a2wsgi's thread pool (ASGI_WSGI_THREADS).
+/stream_answer only does its auth/limit/history work there and hands the LLM
+stream back to the event loop (see utils/async_answer.py), so long generations
+no longer hold a thread each. `gunicorn app:app` keeps working unchanged; the
+route simply streams on its thread as before.
+"""
+
+import os
+
+from a2wsgi import WSGIMiddleware
+from dotenv import load_dotenv
+
+from app import app
+from utils import async_answer
+
+load_dotenv()
+
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+
+_CAPABLE_HEADER = async_answer.CAPABLE_HEADER.lower().encode()
+_HANDOFF_HEADER = async_answer.HANDOFF_HEADER.lower().encode()
+
+
+class AsyncStreamHandoff:
+    """Runs the Flask app and takes over responses that carry an X-Async-Stream token."""
+
+    def __init__(self, wsgi_app, workers: int):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+
+        headers = [(k, v) for k, v in scope.get('headers', []) if k != _CAPABLE_HEADER]
+        headers.append((_CAPABLE_HEADER, async_answer.CAPABLE_SECRET.encode()))
+        scope = dict(scope, headers=headers)
+
+        handoff = {}
+
+        async def intercept(message):
+            if message['type'] == 'http.response.start':
+                token = next((v for k, v in message.get('headers', []) if k.lower() == _HANDOFF_HEADER), None)
+                if token is not None:
+                    handoff['token'] = token.decode()
+                    handoff['start'] = dict(message, headers=[
+                        (k, v) for k, v in message.get('headers', [])
+                        if k.lower() not in (_HANDOFF_HEADER, b'content-length')
+                    ])
+                    return
+            elif handoff and message['type'] == 'http.response.body':
+                return  # the placeholder's empty body
+            await send(message)
+
+        await self.wsgi(scope, receive, intercept)
+        if not handoff:
+            return
+
+        stream_kwargs = async_answer.claim_handoff(handoff['token'])
+        await send(handoff['start'])
+        if stream_kwargs is not None:
+            stream = async_answer.answer_question_stream_async(**stream_kwargs)
+            try:
+                async for frame in stream:
+                    await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+            finally:
+                await stream.aclose()
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+application = AsyncStreamHandoff(app, workers=ASGI_WSGI_THREADS)
@@ -0,0 +1,140 @@
+# In benchmark_reranker.py
+"""
+Benchmarks the PyTorch cross-encoder against the int8 ONNX export.
+
+Reports per-request latency (p50/p95/p99 for a CHUNKS_TO_RERANK-sized request),
+throughput in pairs/second, resident memory after loading, and ranking
+agreement (Spearman rho and top-k overlap) between the two backends.
+
+Usage:
+    python benchmark_reranker.py                       # synthetic pairs
+    python benchmark_reranker.py --channel-id 42       # real chunks from the embeddings table
+    python benchmark_reranker.py --requests 100 --pairs 55 --top-k 5
+"""
+import argparse
+import os
+import random
+import resource
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+SAMPLE_QUERIES = [
+    "what is your latest video about",
+    "how do I get started with investing",
+    "what camera do you use",
+    "do you offer refunds",
+    "what are your opening hours",
+    "how much does the premium plan cost",
+    "can you recommend a beginner workout",
+    "what is the best way to grow on youtube",
+]
+
+SAMPLE_SENTENCES = [
+    "In this video I walk through my full morning routine and the habits that changed my productivity.",
+    "Our store is open from 9am to 8pm Monday to Saturday and closed on Sundays.",
+    "The premium plan costs 18 dollars a month and includes unlimited questions.",
+    "I shoot everything on a Sony A7 IV with a 24-70mm lens and a shotgun mic.",
+    "Refunds are available within 14 days of purchase if the product is unused.",
+    "The single most important thing for growth is consistency and good thumbnails.",
+    "Index funds are the simplest way for beginners to start investing for the long term.",
+    "A beginner workout should focus on compound lifts three times a week.",
+    "We ship worldwide and orders usually arrive within five to seven business days.",
+    "Today we're reviewing the new phone and comparing its battery life to last year's model.",
+]
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _synthetic_passages(count: int) -> list:
+    rng = random.Random(7)
+    return [" ".join(rng.sample(SAMPLE_SENTENCES, 4)) for _ in range(count)]
+
+
+def _load_passages(channel_id: int, count: int) -> list:
+    from utils.supabase_client import get_supabase_admin_client
+    resp = get_supabase_admin_client().table('embeddings').select('metadata').eq('channel_id', channel_id).limit(count).execute()
+    return [row['metadata'].get('chunk_text', '') for row in (resp.data or []) if row.get('metadata')]
+
+
+def _rankdata(values: np.ndarray) -> np.ndarray:
+    ranks = np.empty(len(values), dtype='float64')
+    ranks[np.argsort(values)] = np.arange(len(values))
+    return ranks
+
+
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    if len(a) < 2:
+        return 1.0
+    return float(np.corrcoef(_rankdata(a), _rankdata(b))[0, 1])
+
+
+def _benchmark(name: str, model, requests: list, batch_size: int) -> dict:
+    model.predict(requests[0][:2])  # warm-up
+    latencies, all_scores = [], []
+    start = time.perf_counter()
+    for pairs in requests:
+        t0 = time.perf_counter()
+        scores = model.predict(pairs, batch_size=batch_size)
+        latencies.append(time.perf_counter() - t0)
+        all_scores.append(np.asarray(scores, dtype='float32'))
+    total = time.perf_counter() - start
+    total_pairs = sum(len(pairs) for pairs in requests)
+    latencies_ms = np.array(latencies) * 1000
+    print(f"\n--- {name} ---")
+    print(f"  p50 latency:   {np.percentile(latencies_ms, 50):8.2f} ms")
+    print(f"  p95 latency:   {np.percentile(latencies_ms, 95):8.2f} ms")
+    print(f"  p99 latency:   {np.percentile(latencies_ms, 99):8.2f} ms")
+    print(f"  throughput:    {total_pairs / total:8.1f} pairs/s")
+    print(f"  max RSS so far:{_rss_mb():8.1f} MB")
+    return {'scores': all_scores}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the PyTorch and ONNX int8 rerankers.")
+    parser.add_argument('--requests', type=int, default=50, help="Number of rerank requests to time.")
+    parser.add_argument('--pairs', type=int, default=int(os.environ.get('CHUNKS_TO_RERANK', 55)), help="Pairs per request.")
+    parser.add_argument('--top-k', type=int, default=int(os.environ.get('TOP_K', 5)), help="k for top-k overlap.")
+    parser.add_argument('--batch-size', type=int, default=64, help="predict() batch size.")
+    parser.add_argument('--channel-id', type=int, default=None, help="Sample real chunks from this channel.")
+    parser.add_argument('--onnx-dir', default=None, help="ONNX model directory (defaults to RERANK_ONNX_MODEL_DIR).")
+    args = parser.parse_args()
+
+    passages = _load_passages(args.channel_id, 500) if args.channel_id else _synthetic_passages(500)
+    if not passages:
+        raise SystemExit("No passages available to benchmark with.")
+    rng = random.Random(11)
+    requests = [
+        [[SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)], rng.choice(passages)] for _ in range(args.pairs)]
+        for i in range(args.requests)
+    ]
+    print(f"Benchmarking {args.requests} requests x {args.pairs} pairs (baseline RSS {_rss_mb():.1f} MB)")
+
+    from utils.onnx_reranker import OnnxCrossEncoder, DEFAULT_ONNX_MODEL_DIR
+    onnx_model = OnnxCrossEncoder(args.onnx_dir or DEFAULT_ONNX_MODEL_DIR)
+    print(f"ONNX model loaded from {onnx_model.model_path} (RSS {_rss_mb():.1f} MB)")
+    onnx_result = _benchmark('ONNX int8', onnx_model, requests, args.batch_size)
+
+    # Torch is loaded second so the ONNX RSS figure above is not inflated by it.
+    from sentence_transformers import CrossEncoder
+    torch_model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+    print(f"\nPyTorch model loaded (RSS {_rss_mb():.1f} MB)")
+    torch_result = _benchmark('PyTorch', torch_model, requests, args.batch_size)
+
+    rhos, overlaps = [], []
+    for torch_scores, onnx_scores in zip(torch_result['scores'], onnx_result['scores']):
+        rhos.append(_spearman(torch_scores, onnx_scores))
+        k = min(args.top_k, len(torch_scores))
+        top_torch = set(np.argsort(-torch_scores)[:k])
+        top_onnx = set(np.argsort(-onnx_scores)[:k])
+        overlaps.append(len(top_torch & top_onnx) / k if k else 1.0)
+
+    print("\n--- Ranking agreement (ONNX vs PyTorch) ---")
+    print(f"  mean Spearman rho:   {np.mean(rhos):.4f}")
+    print(f"  min Spearman rho:    {np.min(rhos):.4f}")
+    print(f"  mean top-{args.top_k} overlap: {np.mean(overlaps):.4f}")
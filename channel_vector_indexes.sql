@@ -0,0 +1,246 @@
+-- ============================================================================
+-- YoppyChat AI — Tenancy-aware vector indexes
+--
+-- Run this in the Supabase SQL Editor (after lean_match_embeddings.sql).
+--
+-- performance_indexes.sql builds ONE global HNSW index on embeddings. Every
+-- chat query filters on channel_id (and video_id for YouTube bots), and with a
+-- global HNSW graph those filters are applied after the graph scan: small
+-- channels lose recall, and big ones fall back to slow scans as the table grows.
+--
+-- Strategy:
+--   * Large tenants (>= VECTOR_INDEX_MIN_ROWS chunks) get their own partial
+--     HNSW index `WHERE channel_id = <id>`, registered in channel_vector_indexes.
+--   * Small tenants use an exact scan over their own rows via the
+--     (channel_id, video_id) B-tree — fast at that size and 100% recall.
+--   * match_embeddings / match_embeddings_lean route each query accordingly.
+--
+-- Partial indexes are created by utils/vector_index_utils.py (queued after
+-- ingest) or manually with `python manage_vector_indexes.py`.
+--
+-- Requires pgvector >= 0.8 for hnsw.iterative_scan on the partial-index path;
+-- on older versions the setting is skipped (filtered HNSW scans may then return
+-- fewer than match_count rows).
+--
+-- The index-management functions are SECURITY DEFINER and are granted to
+-- service_role only; clients cannot call them through PostgREST.
+-- ============================================================================
+
+-- 1. Registry of channels that have a dedicated partial HNSW index
+CREATE TABLE IF NOT EXISTS public.channel_vector_indexes (
+    channel_id BIGINT PRIMARY KEY REFERENCES public.channels(id) ON DELETE CASCADE,
+    index_name TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_embeddings_channel_video
+ON public.embeddings (channel_id, video_id);
+
+-- 2. Per-channel sizes, for the index tooling
+CREATE OR REPLACE FUNCTION public.get_channel_embedding_counts(p_min_rows bigint DEFAULT 0)
+RETURNS TABLE (channel_id bigint, row_count bigint, has_index boolean)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT e.channel_id, COUNT(*)::bigint, bool_or(cvi.channel_id IS NOT NULL)
+  FROM public.embeddings e
+  LEFT JOIN public.channel_vector_indexes cvi ON cvi.channel_id = e.channel_id
+  GROUP BY e.channel_id
+  HAVING COUNT(*) >= p_min_rows
+  ORDER BY 2 DESC;
+END;
+$$;
+
+-- 3. Create a channel's partial HNSW index once it crosses the threshold.
+--    Returns 'exists', 'below_threshold' or 'created'.
+--    NOTE: this builds the index non-concurrently (functions can't run
+--    CREATE INDEX CONCURRENTLY). For very large channels prefer the DSN path in
+--    vector_index_utils.py, which builds it CONCURRENTLY.
+CREATE OR REPLACE FUNCTION public.ensure_channel_hnsw_index(p_channel_id bigint, p_min_rows bigint DEFAULT 20000)
+RETURNS text
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_count bigint;
+  v_index text := format('idx_embeddings_hnsw_ch_%s', p_channel_id);
+  -- Server-side floor: never build a (blocking) index for a tiny channel,
+  -- whatever threshold the caller passes.
+  v_min_rows bigint := GREATEST(COALESCE(p_min_rows, 20000), 1000);
+BEGIN
+  IF EXISTS (SELECT 1 FROM public.channel_vector_indexes cvi WHERE cvi.channel_id = p_channel_id) THEN
+    RETURN 'exists';
+  END IF;
+
+  SELECT COUNT(*) INTO v_count FROM public.embeddings e WHERE e.channel_id = p_channel_id;
+  IF v_count < v_min_rows THEN
+    RETURN 'below_threshold';
+  END IF;
+
+  EXECUTE format(
+    'CREATE INDEX IF NOT EXISTS %I ON public.embeddings USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64) WHERE channel_id = %s',
+    v_index, p_channel_id
+  );
+  INSERT INTO public.channel_vector_indexes (channel_id, index_name, row_count)
+  VALUES (p_channel_id, v_index, v_count)
+  ON CONFLICT (channel_id) DO UPDATE SET row_count = EXCLUDED.row_count;
+  RETURN 'created';
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.drop_channel_hnsw_index(p_channel_id bigint)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_index text;
+BEGIN
+  SELECT cvi.index_name INTO v_index FROM public.channel_vector_indexes cvi WHERE cvi.channel_id = p_channel_id;
+  IF v_index IS NOT NULL THEN
+    EXECUTE format('DROP INDEX IF EXISTS public.%I', v_index);
+    DELETE FROM public.channel_vector_indexes cvi WHERE cvi.channel_id = p_channel_id;
+  END IF;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.ensure_channel_hnsw_index(bigint, bigint) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.drop_channel_hnsw_index(bigint) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.ensure_channel_hnsw_index(bigint, bigint) TO service_role;
+GRANT EXECUTE ON FUNCTION public.drop_channel_hnsw_index(bigint) TO service_role;
+
+-- hnsw.iterative_scan only exists from pgvector 0.8; older versions reserve
+-- the hnsw.* prefix and reject the unknown setting, so check before setting it.
+CREATE OR REPLACE FUNCTION public.vector_supports_iterative_scan()
+RETURNS boolean
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT COALESCE(
+    (SELECT string_to_array(split_part(extversion, '-', 1), '.')::int[] >= ARRAY[0, 8]
+     FROM pg_extension WHERE extname = 'vector'),
+    false
+  );
+$$;
+
+-- 4. Routed similarity search (full metadata)
+CREATE OR REPLACE FUNCTION public.match_embeddings (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  p_video_ids text[] DEFAULT NULL,
+  p_channel_id bigint DEFAULT NULL
+)
+RETURNS TABLE (
+  id bigint,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_channel_id IS NOT NULL AND EXISTS (SELECT 1 FROM public.channel_vector_indexes cvi WHERE cvi.channel_id = p_channel_id) THEN
+    -- Large tenant: a literal channel_id lets the planner match the partial HNSW index.
+    IF public.vector_supports_iterative_scan() THEN
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    END IF;
+    RETURN QUERY EXECUTE format($q$
+      SELECT e.id, e.metadata, 1 - (e.embedding <=> $1) AS similarity
+      FROM public.embeddings e
+      WHERE e.channel_id = %s
+        AND ($2::text[] IS NULL OR e.video_id = ANY($2))
+        AND 1 - (e.embedding <=> $1) > $3
+      ORDER BY e.embedding <=> $1
+      LIMIT $4
+    $q$, p_channel_id)
+    USING query_embedding, p_video_ids, match_threshold, match_count;
+  ELSIF p_channel_id IS NOT NULL THEN
+    -- Small tenant: exact scan over the channel's rows. Ordering by the similarity
+    -- expression keeps the planner off the global HNSW index (post-filter recall loss).
+    RETURN QUERY
+    SELECT e.id, e.metadata, 1 - (e.embedding <=> query_embedding) AS similarity
+    FROM public.embeddings e
+    WHERE e.channel_id = p_channel_id
+      AND (p_video_ids IS NULL OR e.video_id = ANY(p_video_ids))
+      AND 1 - (e.embedding <=> query_embedding) > match_threshold
+    ORDER BY similarity DESC
+    LIMIT match_count;
+  ELSE
+    -- No tenant filter: global HNSW index.
+    RETURN QUERY
+    SELECT e.id, e.metadata, 1 - (e.embedding <=> query_embedding) AS similarity
+    FROM public.embeddings e
+    WHERE (p_video_ids IS NULL OR e.video_id = ANY(p_video_ids))
+      AND 1 - (e.embedding <=> query_embedding) > match_threshold
+    ORDER BY e.embedding <=> query_embedding
+    LIMIT match_count;
+  END IF;
+END;
+$$;
+
+-- 5. Routed similarity search (lean payload)
+CREATE OR REPLACE FUNCTION public.match_embeddings_lean (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  p_video_ids text[] DEFAULT NULL,
+  p_channel_id bigint DEFAULT NULL
+)
+RETURNS TABLE (
+  id bigint,
+  video_id text,
+  source_id bigint,
+  source_type text,
+  chunk_index int,
+  chunk_text text,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF p_channel_id IS NOT NULL AND EXISTS (SELECT 1 FROM public.channel_vector_indexes cvi WHERE cvi.channel_id = p_channel_id) THEN
+    IF public.vector_supports_iterative_scan() THEN
+      PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    END IF;
+    RETURN QUERY EXECUTE format($q$
+      SELECT e.id, e.video_id, e.source_id, e.metadata->>'source_type',
+             NULLIF(e.metadata->>'chunk_index', '')::int, e.metadata->>'chunk_text',
+             1 - (e.embedding <=> $1) AS similarity
+      FROM public.embeddings e
+      WHERE e.channel_id = %s
+        AND ($2::text[] IS NULL OR e.video_id = ANY($2))
+        AND 1 - (e.embedding <=> $1) > $3
+      ORDER BY e.embedding <=> $1
+      LIMIT $4
+    $q$, p_channel_id)
+    USING query_embedding, p_video_ids, match_threshold, match_count;
+  ELSIF p_channel_id IS NOT NULL THEN
+    RETURN QUERY
+    SELECT e.id, e.video_id, e.source_id, e.metadata->>'source_type',
+           NULLIF(e.metadata->>'chunk_index', '')::int, e.metadata->>'chunk_text',
+           1 - (e.embedding <=> query_embedding) AS similarity
+    FROM public.embeddings e
+    WHERE e.channel_id = p_channel_id
+      AND (p_video_ids IS NULL OR e.video_id = ANY(p_video_ids))
+      AND 1 - (e.embedding <=> query_embedding) > match_threshold
+    ORDER BY similarity DESC
+    LIMIT match_count;
+  ELSE
+    RETURN QUERY
+    SELECT e.id, e.video_id, e.source_id, e.metadata->>'source_type',
+           NULLIF(e.metadata->>'chunk_index', '')::int, e.metadata->>'chunk_text',
+           1 - (e.embedding <=> query_embedding) AS similarity
+    FROM public.embeddings e
+    WHERE (p_video_ids IS NULL OR e.video_id = ANY(p_video_ids))
+      AND 1 - (e.embedding <=> query_embedding) > match_threshold
+    ORDER BY e.embedding <=> query_embedding
+    LIMIT match_count;
+  END IF;
+END;
+$$;
+
+ANALYZE public.embeddings;
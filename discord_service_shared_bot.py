@@ -3,11 +3,10 @@ from discord import app_commands
 from discord.ext import commands
 import logging
 from typing import List
-import json
 
 # --- Local Utils ---
 from utils import db_utils
-from utils.qa_utils import answer_question_stream
+from utils import answer_api
 from utils.history_utils import get_chat_history_for_service
 
 # --- Setup ---
@@ -120,7 +119,7 @@ class SharedYoppyBot(commands.Bot):
             sources = []
             
             try:
-                stream = answer_question_stream(
+                result = answer_api.answer(
                     question_for_prompt=final_question_with_history,
                     question_for_search=question,
                     channel_data=channel_data,
@@ -131,23 +130,11 @@ class SharedYoppyBot(commands.Bot):
                     integration_source='discord'
                 )
 
-                for chunk in stream:
-                    if chunk.startswith('data: '):
-                        data_str = chunk.replace('data: ', '').strip()
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            data = json.loads(data_str)
-                            if data.get('error') == 'QUERY_LIMIT_REACHED':
-                                log.warning(f"Credit limit reached for discord server {server_id}. Message: {data.get('message')}")
-                                full_answer = "LIMIT_REACHED"
-                                break
-                            if data.get('answer'):
-                                full_answer += data['answer']
-                            if data.get('sources'):
-                                sources = data['sources']
-                        except json.JSONDecodeError:
-                            continue
+                if result.limit_reached:
+                    log.warning(f"Credit limit reached for discord server {server_id}. Message: {result.message}")
+                    full_answer = "LIMIT_REACHED"
+                else:
+                    full_answer, sources = result.text, result.sources
                 
                 if full_answer:
                     if conversation_id not in self.history_cache:
@@ -0,0 +1,23 @@
+# In export_onnx_reranker.py
+"""
+One-off script to export the reranker to an int8-quantized ONNX model.
+
+Usage:
+    python export_onnx_reranker.py [--output models/ms-marco-MiniLM-L-6-v2-onnx-int8]
+
+Then set RERANK_BACKEND=onnx (and RERANK_ONNX_MODEL_DIR if you used a different path).
+"""
+import argparse
+from dotenv import load_dotenv
+load_dotenv()
+
+from utils.onnx_reranker import export_quantized_model, DEFAULT_ONNX_MODEL_DIR, CROSS_ENCODER_MODEL_NAME
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the cross-encoder reranker to int8 ONNX.")
+    parser.add_argument('--output', default=DEFAULT_ONNX_MODEL_DIR, help="Directory to write the ONNX model and tokenizer to.")
+    parser.add_argument('--model', default=CROSS_ENCODER_MODEL_NAME, help="Hugging Face model to export.")
+    args = parser.parse_args()
+
+    path = export_quantized_model(args.output, args.model)
+    print(f"✅ Quantized ONNX reranker written to {path}")
@@ -0,0 +1,14 @@
+# In gunicorn.conf.py
+"""
+Gunicorn server hooks. Gunicorn reads ./gunicorn.conf.py from the working
+directory by default, so the Dockerfile CMD and `gunicorn app:app` both use it.
+"""
+
+import os
+
+
+def post_worker_init(worker):
+    """Loads the reranker once per worker after the app is imported, instead of on the first question."""
+    if os.environ.get('RERANK_WARM_START', 'true').lower() == 'true':
+        from utils.qa_utils import warm_up_reranker
+        warm_up_reranker()
@@ -0,0 +1,117 @@
+-- ============================================================================
+-- YoppyChat AI — Hybrid lexical + vector retrieval
+--
+-- Run this in the Supabase SQL Editor (after channel_vector_indexes.sql).
+--
+-- Product names, SKUs and phone numbers in WhatsApp exports and PDFs are often
+-- missed by cosine search at MATCH_THRESHOLD 0.4. match_embeddings_hybrid adds
+-- a full-text leg over the chunk text and merges both candidate lists with
+-- reciprocal rank fusion (RRF) in a single round trip:
+--
+--     rrf_score = 1 / (k + vector_rank) + 1 / (k + lexical_rank)
+--
+-- The 'simple' text search config is used on purpose: no stemming or stopword
+-- removal, so SKUs, numbers and non-English text are indexed verbatim. The
+-- client strips question stopwords before calling (see qa_utils.py).
+--
+-- The GIN index is keyed on (channel_id, chunk_tsv) via btree_gin, so the
+-- lexical leg only visits the asking channel's postings. Common words that
+-- survive the client's stopword list can still match much of a large channel,
+-- so at most p_lexical_candidates matches are scored with ts_rank_cd before
+-- the top p_lexical_count are kept.
+--
+-- NOTE: adding a STORED generated column rewrites the embeddings table.
+-- Run it in a quiet window on large databases.
+-- ============================================================================
+
+-- 1. Generated tsvector over chunk text + channel-scoped GIN index
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE public.embeddings
+ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+GENERATED ALWAYS AS (to_tsvector('simple', coalesce(metadata->>'chunk_text', ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_embeddings_channel_chunk_tsv
+ON public.embeddings USING gin (channel_id, chunk_tsv);
+
+-- Superseded by the channel-scoped index above
+DROP INDEX IF EXISTS public.idx_embeddings_chunk_tsv;
+
+-- 2. Hybrid search: routed vector leg (match_embeddings_lean) + lexical leg, fused with RRF
+-- The signature and output columns changed (p_lexical_candidates, lexical_score), so drop the old version first.
+DROP FUNCTION IF EXISTS public.match_embeddings_hybrid(vector, text, float, int, text[], bigint, int, int);
+
+CREATE OR REPLACE FUNCTION public.match_embeddings_hybrid (
+  query_embedding vector(1536),
+  query_text text,
+  match_threshold float,
+  match_count int,
+  p_video_ids text[] DEFAULT NULL,
+  p_channel_id bigint DEFAULT NULL,
+  p_lexical_count int DEFAULT 20,
+  p_rrf_k int DEFAULT 60,
+  p_lexical_candidates int DEFAULT 1000
+)
+RETURNS TABLE (
+  id bigint,
+  video_id text,
+  source_id bigint,
+  source_type text,
+  chunk_index int,
+  chunk_text text,
+  similarity float,
+  lexical_score float,
+  rrf_score float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_tsquery tsquery;
+BEGIN
+  -- OR together the query's lexemes: a chunk matching any of the specific terms is a candidate.
+  SELECT to_tsquery('simple', string_agg(quote_literal(t.lexeme), ' | '))
+  INTO v_tsquery
+  FROM unnest(to_tsvector('simple', coalesce(query_text, ''))) AS t
+  WHERE position(E'\\' IN t.lexeme) = 0;
+
+  RETURN QUERY
+  WITH vector_leg AS (
+    SELECT v.id, row_number() OVER (ORDER BY v.similarity DESC) AS rnk
+    FROM public.match_embeddings_lean(query_embedding, match_threshold, match_count, p_video_ids, p_channel_id) v
+  ),
+  lexical_leg AS (
+    SELECT l.id, l.score, row_number() OVER (ORDER BY l.score DESC) AS rnk
+    FROM (
+      SELECT c.id, ts_rank_cd(c.chunk_tsv, v_tsquery)::float AS score
+      FROM (
+        -- Bound the rows ranked per query; the index only returns this channel's matches
+        SELECT e.id, e.chunk_tsv
+        FROM public.embeddings e
+        WHERE v_tsquery IS NOT NULL
+          AND e.chunk_tsv @@ v_tsquery
+          AND (p_channel_id IS NULL OR e.channel_id = p_channel_id)
+          AND (p_video_ids IS NULL OR e.video_id = ANY(p_video_ids))
+        LIMIT p_lexical_candidates
+      ) c
+      ORDER BY score DESC
+      LIMIT p_lexical_count
+    ) l
+  ),
+  fused AS (
+    SELECT COALESCE(vl.id, ll.id) AS id,
+           ll.score AS lexical_score,
+           COALESCE(1.0 / (p_rrf_k + vl.rnk), 0) + COALESCE(1.0 / (p_rrf_k + ll.rnk), 0) AS score
+    FROM vector_leg vl
+    FULL OUTER JOIN lexical_leg ll ON ll.id = vl.id
+  )
+  SELECT e.id, e.video_id, e.source_id, e.metadata->>'source_type',
+         NULLIF(e.metadata->>'chunk_index', '')::int, e.metadata->>'chunk_text',
+         1 - (e.embedding <=> query_embedding) AS similarity,
+         f.lexical_score,
+         f.score::float
+  FROM fused f
+  JOIN public.embeddings e ON e.id = f.id
+  ORDER BY f.score DESC
+  LIMIT match_count;
+END;
+$$;
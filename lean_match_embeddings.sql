@@ -0,0 +1,87 @@
+-- ============================================================================
+-- YoppyChat AI — Lean retrieval RPCs
+--
+-- Run this in the Supabase SQL Editor.
+--
+-- match_embeddings returns the whole `metadata` jsonb for every match, which
+-- for YouTube chunks includes full_description, video_description and
+-- chunk_preview. With match_count = 50 that ships the full video description
+-- 50 times per question. match_embeddings_lean returns only what
+-- answer_question_stream needs per chunk; per-video citation fields are
+-- resolved (and cached) client-side through get_video_citations.
+-- ============================================================================
+
+-- 1. Lean similarity search
+CREATE OR REPLACE FUNCTION public.match_embeddings_lean (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  p_video_ids text[] DEFAULT NULL,
+  p_channel_id bigint DEFAULT NULL
+)
+RETURNS TABLE (
+  id bigint,
+  video_id text,
+  source_id bigint,
+  source_type text,
+  chunk_index int,
+  chunk_text text,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    embeddings.id,
+    embeddings.video_id,
+    embeddings.source_id,
+    embeddings.metadata->>'source_type',
+    NULLIF(embeddings.metadata->>'chunk_index', '')::int,
+    embeddings.metadata->>'chunk_text',
+    1 - (embeddings.embedding <=> query_embedding) AS similarity
+  FROM embeddings
+  WHERE
+    (p_video_ids IS NULL OR embeddings.video_id = ANY(p_video_ids))
+    AND (p_channel_id IS NULL OR embeddings.channel_id = p_channel_id)
+    AND 1 - (embeddings.embedding <=> query_embedding) > match_threshold
+  -- Order by the raw distance expression so the HNSW index can serve the scan.
+  ORDER BY embeddings.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+-- 2. One citation row per (source_id, video_id): title, url and date are
+--    identical for every chunk of a video / page / chat block.
+CREATE OR REPLACE FUNCTION public.get_video_citations (
+  p_channel_id bigint,
+  p_video_ids text[]
+)
+RETURNS TABLE (
+  video_id text,
+  source_id bigint,
+  title text,
+  url text,
+  upload_date text
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT DISTINCT ON (embeddings.source_id, embeddings.video_id)
+    embeddings.video_id,
+    embeddings.source_id,
+    COALESCE(embeddings.metadata->>'video_title', embeddings.metadata->>'title'),
+    COALESCE(embeddings.metadata->>'video_url', embeddings.metadata->>'url'),
+    COALESCE(embeddings.metadata->>'upload_date', embeddings.metadata->>'date')
+  FROM embeddings
+  WHERE
+    embeddings.video_id = ANY(p_video_ids)
+    AND (p_channel_id IS NULL OR embeddings.channel_id = p_channel_id)
+  ORDER BY embeddings.source_id, embeddings.video_id, embeddings.id;
+END;
+$$;
+
+-- 3. Helps get_video_citations find the first chunk of each video quickly.
+CREATE INDEX IF NOT EXISTS idx_embeddings_channel_video
+ON public.embeddings (channel_id, video_id);
@@ -0,0 +1,57 @@
+# In manage_vector_indexes.py
+"""
+Manage per-channel partial HNSW indexes (see channel_vector_indexes.sql).
+
+Usage:
+    python manage_vector_indexes.py status                 # channel sizes and index state
+    python manage_vector_indexes.py ensure                 # index every channel over the threshold
+    python manage_vector_indexes.py ensure --channel-id 42
+    python manage_vector_indexes.py drop --channel-id 42
+    python manage_vector_indexes.py ensure --threshold 5000 --dry-run
+
+Requires pgvector >= 0.8 for hnsw.iterative_scan on indexed channels (older
+versions still work, without iterative scans). The ensure_channel_hnsw_index
+RPC enforces a floor of 1000 rows whatever --threshold is passed.
+"""
+import argparse
+from dotenv import load_dotenv
+load_dotenv()
+
+from utils.vector_index_utils import (
+    VECTOR_INDEX_MIN_ROWS,
+    ensure_channel_vector_index,
+    drop_channel_vector_index,
+    get_channel_index_status,
+)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage per-channel partial HNSW indexes.")
+    parser.add_argument('command', choices=['status', 'ensure', 'drop'])
+    parser.add_argument('--channel-id', type=int, default=None)
+    parser.add_argument('--threshold', type=int, default=VECTOR_INDEX_MIN_ROWS, help="Minimum chunks before a channel gets its own index.")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would be indexed.")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        rows = get_channel_index_status()
+        print(f"{'channel_id':>10}  {'rows':>10}  indexed")
+        for row in rows:
+            marker = 'yes' if row['has_index'] else ('DUE' if row['row_count'] >= args.threshold else 'no')
+            print(f"{row['channel_id']:>10}  {row['row_count']:>10}  {marker}")
+
+    elif args.command == 'ensure':
+        if args.channel_id:
+            candidates = [args.channel_id]
+        else:
+            candidates = [row['channel_id'] for row in get_channel_index_status(args.threshold) if not row['has_index']]
+        print(f"{len(candidates)} channel(s) at or above {args.threshold} chunks without a dedicated index.")
+        for channel_id in candidates:
+            if args.dry_run:
+                print(f"  would index channel {channel_id}")
+                continue
+            print(f"  channel {channel_id}: {ensure_channel_vector_index(channel_id, args.threshold)}")
+
+    elif args.command == 'drop':
+        if not args.channel_id:
+            parser.error("drop requires --channel-id")
+        print("✅ Dropped" if drop_channel_vector_index(args.channel_id) else "❌ Failed")
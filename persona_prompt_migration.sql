@@ -0,0 +1,17 @@
+-- ============================================================================
+-- YoppyChat AI — Precompiled persona prompts
+--
+-- Run this in the Supabase SQL Editor.
+--
+-- utils/persona_compiler.py compiles each channel's persona (soul, speaking
+-- style, anti-patterns, rules) into a fixed system-prompt prefix whenever the
+-- channel's persona fields change, and stores it here. answer_question_stream
+-- puts it first in every prompt, so providers can serve it from their prompt
+-- cache. persona_prompt_key is "<bot_type>:v<version>:<persona fingerprint>";
+-- rows with a missing or outdated key are compiled in process instead, so
+-- this can be applied before or after the code is deployed.
+-- ============================================================================
+
+ALTER TABLE public.channels
+  ADD COLUMN IF NOT EXISTS persona_prompt text,
+  ADD COLUMN IF NOT EXISTS persona_prompt_key text;
@@ -9,6 +9,8 @@ load_dotenv()
 
 from utils.supabase_client import get_supabase_admin_client
 from utils.qa_utils import extract_speaking_style, extract_creator_soul
+from utils import answer_cache
+from utils import persona_compiler
 
 # --- CONFIG ---
 CHANNEL_ID = 2  # Dan Martell's channel
@@ -73,6 +75,8 @@ if speaking_style or creator_soul:
         update_data['creator_soul'] = creator_soul
     
     supabase.table('channels').update(update_data).eq('id', CHANNEL_ID).execute()
+    answer_cache.invalidate_channel(CHANNEL_ID)
+    persona_compiler.recompile(CHANNEL_ID, supabase)
     print(f"\n🎉 Database updated for channel {CHANNEL_ID}!")
     print(f"   - speaking_style: {'Updated' if speaking_style else 'Skipped'}")
     print(f"   - creator_soul: {'Updated' if creator_soul else 'Skipped'}")
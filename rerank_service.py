@@ -0,0 +1,49 @@
+# In rerank_service.py
+"""
+Standalone local rerank service.
+
+Loads the Cross-Encoder once and serves score requests from every Gunicorn
+thread, Huey worker and the Discord service through one shared micro-batcher,
+so concurrent requests are scored as a few large padded batches instead of
+many small ones competing for the same cores.
+
+Usage:
+    RERANK_SERVICE_ADDRESS=127.0.0.1:6011 RERANK_SERVICE_AUTHKEY=<secret> python rerank_service.py
+
+Workers pick it up automatically when RERANK_SERVICE_ADDRESS is set, and fall
+back to in-process scoring if the service is unreachable.
+"""
+
+import os
+import sys
+import logging
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+from utils import rerank_utils
+from utils.qa_utils import _get_cross_encoder, _predict_cross_encoder_batch
+
+METRICS_LOG_INTERVAL_SECONDS = int(os.environ.get('RERANK_METRICS_LOG_INTERVAL', 60))
+
+
+def _log_metrics(batcher: rerank_utils.RerankBatcher):
+    while True:
+        time.sleep(METRICS_LOG_INTERVAL_SECONDS)
+        log.info(f"Rerank metrics: {batcher.get_metrics()}")
+
+
+if __name__ == '__main__':
+    address = rerank_utils.RERANK_SERVICE_ADDRESS or '127.0.0.1:6011'
+
+    if _get_cross_encoder() == 'failed_to_load':
+        log.error("Cross-Encoder could not be loaded. Rerank service is not starting.")
+        sys.exit(1)
+
+    batcher = rerank_utils.RerankBatcher(_predict_cross_encoder_batch)
+    threading.Thread(target=_log_metrics, args=(batcher,), daemon=True).start()
+    rerank_utils.serve(batcher, address)
@@ -11,6 +11,7 @@ from flask import Blueprint, request, jsonify, render_template, session, redirec
 from functools import wraps
 from utils.supabase_client import get_supabase_admin_client
 from utils.local_flow_store import save_flow_local, load_flow_local, delete_flow_local
+from utils import flow_registry, answer_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -127,6 +128,8 @@ def save_flow(chatbot_id):
     ok = save_flow_local(chatbot_id, flow_data)
     if not ok:
         return jsonify({'status': 'error', 'message': 'Failed to save flow to local storage. Check server disk permissions.'}), 500
+    flow_registry.invalidate(chatbot_id)
+    answer_cache.invalidate_channel(chatbot_id)
 
     # 2. Save/update lightweight metadata in Supabase (no flow_data column)
     try:
@@ -143,6 +146,8 @@ def save_flow(chatbot_id):
             }).execute()
             if res.data:
                 flow_id = res.data[0]['id']
+        flow_registry.invalidate(chatbot_id)
+        answer_cache.invalidate_channel(chatbot_id)
 
         return jsonify({'status': 'ok', 'flow_id': flow_id})
     except Exception as e:
@@ -169,6 +174,8 @@ def activate_flow(chatbot_id):
 
     if activate and flow_id:
         supabase.table('channel_flows').update({'is_active': True}).eq('id', flow_id).execute()
+    flow_registry.invalidate(chatbot_id)
+    answer_cache.invalidate_channel(chatbot_id)
 
     return jsonify({'status': 'ok', 'active': activate})
 
@@ -6,6 +6,7 @@ from werkzeug.utils import secure_filename
 from flask import Blueprint, request, jsonify, render_template, session, redirect, url_for, flash
 from functools import wraps
 from utils.supabase_client import get_supabase_admin_client
+from utils import provider_clients
 
 google_reviews_bp = Blueprint('google_reviews', __name__)
 
@@ -78,8 +79,7 @@ def _gr_generate_fast(prompt: str, llm_provider: str, llm_model: str, api_key: s
     """
     try:
         if llm_provider == 'gemini':
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
+            genai = provider_clients.configure_gemini(api_key)
             model = genai.GenerativeModel(llm_model)
 
             # Thinking models (e.g. gemini-3-flash-preview) consume hidden reasoning
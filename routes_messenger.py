@@ -9,13 +9,12 @@ import logging
 import os
 import hmac
 import hashlib
-import json as _json
 import re
 import requests
 import threading
 
 from utils.supabase_client import get_supabase_admin_client
-from utils.qa_utils import answer_question_stream
+from utils import answer_api
 from utils.history_utils import save_chat_history, append_service_history
 
 logger = logging.getLogger(__name__)
@@ -176,32 +175,20 @@ def _handle_messenger_message(app_obj, sender_psid, recipient_page_id, message_t
             response_text = ""
 
             try:
-                all_chunks = list(answer_question_stream(
+                result = answer_api.answer(
                     question_for_prompt=message_text,
                     question_for_search=message_text,
                     channel_data=channel,
                     user_id=user_id,
                     integration_source='messenger',
                     conversation_id=f"messenger_{sender_psid}"
-                ))
+                )
+                if result.limit_reached:
+                    response_text = "Sorry, this chatbot has reached its query limit."
+                elif not result.timed_out:
+                    response_text = result.text
             except Exception as stream_err:
                 logger.warning(f"[MESSENGER BG] Error calling AI: {stream_err}", exc_info=True)
-                all_chunks = []
-
-            for chunk in all_chunks:
-                if chunk.startswith('data: '):
-                    data_str = chunk.replace('data: ', '').strip()
-                    if data_str == "[DONE]":
-                        break
-                    try:
-                        parsed_data = _json.loads(data_str)
-                        if parsed_data.get('error') == 'QUERY_LIMIT_REACHED':
-                            response_text = "Sorry, this chatbot has reached its query limit."
-                            break
-                        if parsed_data.get('answer'):
-                            response_text += parsed_data['answer']
-                    except _json.JSONDecodeError:
-                        continue
 
             # Remove any embedded marker tokens before sending
             response_text = re.sub(r'\[LEAD_COMPLETE:\s*\{.*?\}\]', '', response_text, flags=re.DOTALL).strip()
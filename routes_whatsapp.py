@@ -27,7 +27,9 @@ from utils.whatsapp_api import (
     send_whatsapp_cta_url
 )
 from utils.flow_runner import get_active_flow, run_flow
-from utils.qa_utils import answer_question_stream
+from utils import flow_registry
+from utils import provider_clients
+from utils import answer_api
 from utils.crypto import encrypt_token, decrypt_token
 from utils import db_utils
 from postgrest.exceptions import APIError as PostgrestAPIError
@@ -441,11 +443,11 @@ def _handle_whatsapp_message(
             image_mime_type = media_data.get('mime_type')
             logger.info(f"Successfully downloaded image {parsed['media_id']} for {from_phone}")
 
-    # Get AI response — materialize the full stream before processing
+    # Get AI response — bounded by ANSWER_TIMEOUT so a stuck provider can't hold this thread
     response_text = ""
 
     try:
-        all_chunks = list(answer_question_stream(
+        result = answer_api.answer(
             question_for_prompt=final_question,
             question_for_search=message_text,
             channel_data=channel_data,
@@ -455,27 +457,14 @@ def _handle_whatsapp_message(
             image_mime_type=image_mime_type,
             integration_source='whatsapp',
             conversation_id=f"whatsapp_{from_phone}"
-        ))
+        )
+        # A limit error or a truncated (timed-out) answer sends nothing, as before.
+        if result.complete:
+            response_text = result.text
+        elif result.timed_out:
+            logger.error(f"[WhatsApp BG] AI answer timed out for {from_phone}")
     except Exception as stream_err:
-        logger.error(f"[WhatsApp BG] Error materializing AI stream: {stream_err}", exc_info=True)
-        all_chunks = []
-
-    print(f"[WhatsApp BG] Received {len(all_chunks)} SSE chunks from AI stream")
-
-    for chunk in all_chunks:
-        if chunk.startswith('data: '):
-            data_str = chunk.replace('data: ', '').strip()
-            if data_str == "[DONE]":
-                break
-            try:
-                parsed_data = _json.loads(data_str)
-                if parsed_data.get('error') == 'QUERY_LIMIT_REACHED':
-                    response_text = ""
-                    break
-                if parsed_data.get('answer'):
-                    response_text += parsed_data['answer']
-            except _json.JSONDecodeError:
-                continue
+        logger.error(f"[WhatsApp BG] Error getting AI answer: {stream_err}", exc_info=True)
 
     print(f"[WhatsApp BG] Final response length: {len(response_text)} chars")
     print(f"[WhatsApp BG] Response preview: {response_text[:300]}...")
@@ -500,20 +489,8 @@ def _handle_whatsapp_message(
     # ── AI Flow Trigger Execution ─────────────────────────────────────────
     if trigger_flow_marker:
         # User requested to trigger a flow
-        target_flow = None
-        # Try to find a flow by name first
-        flow_res_by_name = supabase.table('channel_flows').select('id, flow_data').eq('channel_id', channel_data['id']).ilike('name', trigger_flow_marker).limit(1).execute()
-        
-        if flow_res_by_name.data:
-            target_flow = {'flow_id': flow_res_by_name.data[0]['id'], **flow_res_by_name.data[0]['flow_data']}
-        else:
-            # Maybe they passed the actual UUID
-            try:
-                flow_res_by_id = supabase.table('channel_flows').select('id, flow_data').eq('channel_id', channel_data['id']).eq('id', trigger_flow_marker).limit(1).execute()
-                if flow_res_by_id.data:
-                    target_flow = {'flow_id': flow_res_by_id.data[0]['id'], **flow_res_by_id.data[0]['flow_data']}
-            except Exception:
-                pass
+        # Resolve by name first, then by id (cached per channel by the flow registry)
+        target_flow = flow_registry.resolve_trigger(channel_data['id'], trigger_flow_marker)
 
         if target_flow:
             logger.info(f"AI triggered flow: {trigger_flow_marker}")
@@ -699,8 +676,7 @@ def _call_llm_for_buttons(prompt: str) -> str:
     try:
         if provider == 'gemini':
             api_key = os.environ.get('GEMINI_API_KEY2') or os.environ.get('GEMINI_API_KEY', '')
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
+            genai = provider_clients.configure_gemini(api_key)
             gemini_model = genai.GenerativeModel(model)
             response = gemini_model.generate_content(
                 prompt,
@@ -712,14 +688,13 @@ def _call_llm_for_buttons(prompt: str) -> str:
             return response.text.strip() if response.text else ''
 
         elif provider in ('openai', 'groq'):
-            import openai
             if provider == 'groq':
                 api_key = os.environ.get('GROQ_API_KEY', '')
                 base_url = 'https://api.groq.com/openai/v1'
             else:
                 api_key = os.environ.get('OPENAI_API_KEY', '')
                 base_url = os.environ.get('OPENAI_API_BASE_URL') or None
-            client = openai.OpenAI(api_key=api_key, base_url=base_url)
+            client = provider_clients.get_openai_client(api_key, base_url)
             completion = client.chat.completions.create(
                 model=model,
                 messages=[{'role': 'user', 'content': prompt}],
@@ -730,8 +705,7 @@ def _call_llm_for_buttons(prompt: str) -> str:
 
         elif provider == 'ollama':
             ollama_url = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
-            import requests as _req
-            resp = _req.post(
+            resp = provider_clients.get_http_session().post(
                 f"{ollama_url}/api/chat",
                 json={"model": model, "messages": [{"role": "user", "content": prompt}], "stream": False},
                 timeout=15
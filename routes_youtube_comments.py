@@ -7,13 +7,12 @@ from flask import Blueprint, request, jsonify, render_template, session, redirec
 from functools import wraps
 import logging
 import os
-import json
 import requests
 import threading
 import re
 
 from utils.supabase_client import get_supabase_admin_client
-from utils.qa_utils import answer_question_stream
+from utils import answer_api
 from utils.history_utils import save_chat_history
 
 logger = logging.getLogger(__name__)
@@ -273,26 +272,14 @@ def generate_reply():
     )
 
     try:
-        response_text = ""
-        all_chunks = list(answer_question_stream(
+        response_text = answer_api.answer(
             question_for_prompt=prompt,
             question_for_search=comment_text,
             channel_data=channel,
             user_id=str(user_id),
             integration_source='youtube_comments',
             conversation_id=f"ytcomment_{channel_id}_preview"
-        ))
-        for chunk in all_chunks:
-            if chunk.startswith('data: '):
-                data_str = chunk.replace('data: ', '').strip()
-                if data_str == "[DONE]":
-                    break
-                try:
-                    parsed = json.loads(data_str)
-                    if parsed.get('answer'):
-                        response_text += parsed['answer']
-                except json.JSONDecodeError:
-                    continue
+        ).text
 
         # Strip marker tokens
         response_text = re.sub(r'\[LEAD_COMPLETE:\s*\{.*?\}\]', '', response_text, flags=re.DOTALL).strip()
@@ -42,6 +42,13 @@ accesslog = "-"
 errorlog  = "-"
 loglevel  = "info"
 proc_name = "yoppychat"
+
+
+def post_worker_init(worker):
+    # Load the reranker once per worker instead of on the first question
+    if os.environ.get('RERANK_WARM_START', 'true').lower() == 'true':
+        from utils.qa_utils import warm_up_reranker
+        warm_up_reranker()
 """
         
         run_file(client, '/root/t5/gunicorn.conf.py', gunicorn_conf)
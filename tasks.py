@@ -5,7 +5,7 @@ import json
 import redis
 from postgrest.exceptions import APIError
 from huey import SqliteHuey, RedisHuey
-from huey.exceptions import TaskException
+from huey.exceptions import TaskException, TaskLockedException
 from utils.youtube_utils import (
     get_transcripts_from_channel, # <-- Use the robust function for new channels
     get_transcripts_from_urls,    # <-- Use the targeted function for syncing
@@ -13,17 +13,23 @@ from utils.youtube_utils import (
 )
 from utils.discord_utils import update_bot_profile
 import asyncio
-from utils.embed_utils import create_and_store_embeddings
+from utils.ingest_pipeline import IngestPipeline
+from utils import ingest_pipeline
 from utils.supabase_client import get_supabase_admin_client
 from utils.telegram_utils import send_message, create_channel_keyboard
 from utils.config_utils import load_config
-from utils.qa_utils import answer_question_stream, extract_topics_from_text, generate_channel_summary, extract_speaking_style, extract_creator_soul
+from utils.qa_utils import extract_topics_from_text, generate_channel_summary, extract_speaking_style, extract_creator_soul
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import logging
 from utils.history_utils import save_chat_history
+from utils import answer_api
 from utils.history_utils import get_chat_history_for_service, append_service_history
 from utils import db_utils
+from utils import answer_cache
+from utils import persona_compiler
+from utils import video_summaries
+from utils import rate_limiter
 from flask import Flask, render_template
 from flask_mail import Message
 from extensions import mail
@@ -50,6 +56,13 @@ except Exception as e:
     redis_client = None
     print(f"Could not connect to Redis for progress updates: {e}. Progress feature will be disabled.")
 
+@huey.on_startup()
+def warm_up_worker():
+    """Loads the reranker once per Huey worker so integration answers don't pay the model load."""
+    if os.environ.get('RERANK_WARM_START', 'true').lower() == 'true':
+        from utils.qa_utils import warm_up_reranker
+        warm_up_reranker()
+
 # --- Helper function ---
 def update_task_progress(task_id, status, progress, message):
     """Updates the progress of a task in Redis."""
@@ -59,6 +72,16 @@ def update_task_progress(task_id, status, progress, message):
     redis_client.set(f"task_progress:{task_id}", progress_data, ex=3600)
 
 
+def indexing_progress(task_id, status, low, high):
+    """IngestPipeline progress callback: maps stored/total chunks onto [low, high] without going backwards."""
+    reported = {'pct': low}
+    def report(stats):
+        if stats['chunks']:
+            reported['pct'] = max(reported['pct'], low + int((high - low) * stats['written'] / stats['chunks']))
+        update_task_progress(task_id, status, reported['pct'], f"Building AI knowledge base: {ingest_pipeline.describe(stats)}...")
+    return report
+
+
 # --- REFACTORED process_channel_task ---
 def create_task_app():
     """
@@ -80,6 +103,7 @@ def create_task_app():
 
 
 @huey.task(context=True)
+@rate_limiter.bulk_lane()
 def process_channel_task(channel_id, task=None):
     """
     [MODIFIED] The email sending logic is now isolated and reliably retrieves
@@ -108,6 +132,15 @@ def process_channel_task(channel_id, task=None):
         
         update_task_progress(task_id, 'processing', 10, 'Scanning for long-form videos...')
         
+        # Transcripts are chunked, embedded and stored as they download (see utils/ingest_pipeline.py)
+        report_indexing = indexing_progress(task_id, 'processing', 65, 85)
+        def pipeline_progress(stats):
+            # progress_callback reports while transcripts download; this covers storing the rest
+            if stats['closed']:
+                report_indexing(stats)
+
+        pipeline = IngestPipeline(user_id_who_submitted, channel_id, progress_callback=pipeline_progress)
+
         # Define a callback to update progress during the long-running transcription process
         def progress_callback(msg):
             pct = 10
@@ -118,32 +151,37 @@ def process_channel_task(channel_id, task=None):
                      parts = msg.split(':')[1].strip().split(' videos')[0].split('/')
                      current = int(parts[0])
                      total = int(parts[1])
-                     pct = 10 + int((current / total) * 65)
+                     pct = 10 + int((current / total) * 55)
                  except:
                      pct = 30 
+                 msg = f"{msg} ({ingest_pipeline.describe(pipeline.stats)})"
             update_task_progress(task_id, 'processing', pct, msg)
 
         # --- Determine whether the user submitted a single video or a full channel ---
         from utils.youtube_utils import is_youtube_video_url as _is_video_url
         _is_single_video = _is_video_url(channel_url)
 
-        if _is_single_video:
-            # Single video URL: just fetch that one video's transcript
-            print(f"--- [TASK] Detected single video URL — processing only this video: {channel_url} ---")
-            update_task_progress(task_id, 'processing', 20, 'Fetching transcript for the video...')
-            transcripts = get_transcripts_from_urls(youtube_api, [channel_url])
-            thumbnail = ''
-            subs = 0
-            skipped_videos = []
-        else:
-            # Channel URL: fetch the 10 latest long-form videos only
-            print(f"--- [TASK] Detected channel URL — fetching up to 10 latest videos from: {channel_url} ---")
-            transcripts, thumbnail, subs, skipped_videos = get_transcripts_from_channel(
-                youtube_api,
-                channel_url,
-                target_video_count=10,
-                progress_callback=progress_callback
-            )
+        with pipeline:
+            if _is_single_video:
+                # Single video URL: just fetch that one video's transcript
+                print(f"--- [TASK] Detected single video URL — processing only this video: {channel_url} ---")
+                update_task_progress(task_id, 'processing', 20, 'Fetching transcript for the video...')
+                transcripts = get_transcripts_from_urls(youtube_api, [channel_url], on_transcript=pipeline.put)
+                thumbnail = ''
+                subs = 0
+                skipped_videos = []
+            else:
+                # Channel URL: fetch the 10 latest long-form videos only
+                print(f"--- [TASK] Detected channel URL — fetching up to 10 latest videos from: {channel_url} ---")
+                transcripts, thumbnail, subs, skipped_videos = get_transcripts_from_channel(
+                    youtube_api,
+                    channel_url,
+                    target_video_count=10,
+                    progress_callback=progress_callback,
+                    on_transcript=pipeline.put
+                )
+            if transcripts:
+                update_task_progress(task_id, 'processing', 65, 'Building AI knowledge base...')
         
         if not transcripts:
             # Check if we found long-form videos but couldn't get transcripts (rate limiting or no captions)
@@ -151,9 +189,6 @@ def process_channel_task(channel_id, task=None):
                 raise ValueError(f"Found {len(skipped_videos)} long-form videos but could not fetch any transcripts. This may be due to YouTube rate limiting or videos without captions. Please try again in a few minutes.")
             else:
                 raise ValueError("Could not find any long-form videos with transcripts on this channel.")
-
-        update_task_progress(task_id, 'processing', 75, 'Building AI knowledge base...')
-        create_and_store_embeddings(transcripts, None, user_id_who_submitted, channel_id)
         
         # --- Stratified text sample for soul/style extraction ---
         # The old approach (transcripts[:5][:10000]) could profile just one video.
@@ -186,6 +221,8 @@ def process_channel_task(channel_id, task=None):
             {'video_id': t['video_id'], 'title': t['title'], 'url': t['url'], 'upload_date': t['upload_date']}
             for t in transcripts
         ]))
+        # Stored for the "latest video" intent so it needs no LLM call at question time
+        video_summaries.add_summaries(video_data, transcripts)
         channel_name = transcripts[0]['uploader'].strip() if transcripts else "Unknown Channel"
         
         supabase_admin.table('channels').update({
@@ -199,6 +236,10 @@ def process_channel_task(channel_id, task=None):
             'summary': summary,
             'status': 'ready'
         }).eq('id', channel_id).execute()
+        answer_cache.invalidate_channel(channel_id)
+        persona_compiler.recompile(channel_id, supabase_admin)
+        # Large channels get a dedicated partial HNSW index (built in the background).
+        ensure_channel_vector_index_task(channel_id)
 
         # --- SEO: Generate keyword-backed metadata in a separate background task ---
         try:
@@ -276,6 +317,7 @@ def process_channel_task(channel_id, task=None):
 
 # --- REFACTORED sync_channel_task ---
 @huey.task(context=True)
+@rate_limiter.bulk_lane()
 def sync_channel_task(channel_id, task=None):
     """
     [REFACTORED] Background task to sync a channel, processing only new long-form videos.
@@ -366,6 +408,8 @@ def sync_channel_task(channel_id, task=None):
                      
                      if update_fields:
                          supabase_admin.table('channels').update(update_fields).eq('id', channel_id).execute()
+                         answer_cache.invalidate_channel(channel_id)
+                         persona_compiler.recompile(channel_id, supabase_admin)
                          update_task_progress(task_id, 'complete', 100, 'Channel synced and persona profile updated!')
                          return "Channel synced and persona profile updated."
             # --- END: METADATA REFRESH LOGIC ---
@@ -379,24 +423,28 @@ def sync_channel_task(channel_id, task=None):
 
         # 3. Process only the new video URLs and filter for long-form content
         new_video_urls = [f"https://www.youtube.com/watch?v={vid}" for vid in new_video_ids]
-        new_transcripts = get_transcripts_from_urls(youtube_api, new_video_urls)
+        # Each new video is chunked, embedded and stored as soon as its transcript arrives
+        with IngestPipeline(user_id, channel_id, progress_callback=indexing_progress(task_id, 'syncing', 30, 90)) as pipeline:
+            new_transcripts = get_transcripts_from_urls(youtube_api, new_video_urls, on_transcript=pipeline.put)
         
         if not new_transcripts:
             print("None of the new videos were long-form or had transcripts.")
             update_task_progress(task_id, 'complete', 100, 'No new long-form content found.')
             return "No new long-form content to add."
         
-        update_task_progress(task_id, 'syncing', 70, 'Updating the AI knowledge base...')
-        create_and_store_embeddings(new_transcripts, None, user_id, channel_id)
-        
         update_task_progress(task_id, 'syncing', 95, 'Finalizing...')
         new_video_data = [
             {'video_id': t['video_id'], 'title': t['title'], 'url': t['url'], 'upload_date': t['upload_date']} 
             for t in new_transcripts
         ]
+        video_summaries.add_summaries(new_video_data, new_transcripts)
         
         updated_video_list = new_video_data + channel_resp.data.get('videos', [])
         supabase_admin.table('channels').update({'videos': updated_video_list}).eq('id', channel_id).execute()
+        answer_cache.invalidate_channel(channel_id)
+        # Also stores a prefix for channels created before persona prompts were precompiled.
+        persona_compiler.recompile(channel_id, supabase_admin)
+        ensure_channel_vector_index_task(channel_id)
 
         update_task_progress(task_id, 'complete', 100, f"Sync complete! Added {len(new_transcripts)} new videos.")
         print(f"--- [SYNC TASK SUCCESS] Channel {channel_id} updated with {len(new_transcripts)} new videos. ---")
@@ -414,9 +462,6 @@ def consume_answer_stream(question, config, channel_data, video_ids, user_id, ac
     """
     This is the corrected helper function that now includes chat history.
     """
-    full_answer = ""
-    sources = []
-
     # --- THIS IS THE FIX ---
     # 1. Determine the channel name for history lookup
     channel_name_for_history = conversation_id or (channel_data.get('channel_name', 'general') if channel_data else 'general')
@@ -442,7 +487,7 @@ def consume_answer_stream(question, config, channel_data, video_ids, user_id, ac
     # --- END FIX ---
 
     # This now correctly passes the question with context to the underlying stream function.
-    stream = answer_question_stream(
+    result = answer_api.answer(
         question_for_prompt=final_question_with_history, # Use the question with history
         question_for_search=question, # Use the original question for searching
         channel_data=channel_data,
@@ -453,24 +498,10 @@ def consume_answer_stream(question, config, channel_data, video_ids, user_id, ac
         conversation_id=conversation_id
     )
 
-    for chunk in stream:
-        if chunk.startswith('data: '):
-            data_str = chunk.replace('data: ', '').strip()
-            if data_str == "[DONE]":
-                break
-            try:
-                data = json.loads(data_str)
-                if data.get('error') == 'QUERY_LIMIT_REACHED':
-                    log.warning(f"Credit limit reached for telegram chat {conversation_id}. Message: {data.get('message')}")
-                    full_answer = "LIMIT_REACHED"
-                    break
-                if data.get('answer'):
-                    full_answer += data['answer']
-                if data.get('sources'):
-                    sources = data['sources']
-            except json.JSONDecodeError:
-                continue
-    return full_answer, sources
+    if result.limit_reached:
+        log.warning(f"Credit limit reached for telegram chat {conversation_id}. Message: {result.message}")
+        return "LIMIT_REACHED", []
+    return result.text, result.sources
 
 def process_private_message(message: dict):
     """
@@ -774,6 +805,29 @@ def post_answer_processing_task(user_id, channel_name, question, answer, sources
     except Exception as e:
         logger.error(f"Error in post-answer processing for user {user_id}: {e}", exc_info=True)
 
+@huey.task()
+def ensure_channel_vector_index_task(channel_id: int):
+    """
+    Gives a channel its own partial HNSW index once it crosses VECTOR_INDEX_MIN_ROWS
+    chunks. A no-op for small channels and channels that are already indexed.
+    Ingest and update_chatbot_readiness can both queue it, so one build runs at a time per channel.
+    """
+    from utils.vector_index_utils import ensure_channel_vector_index
+    try:
+        with huey.lock_task(f'vector-index-{channel_id}'):
+            result = ensure_channel_vector_index(channel_id)
+    except TaskLockedException:
+        logger.info(f"TASK: Vector index check for channel {channel_id} already running; skipped.")
+        return 'locked'
+    logger.info(f"TASK: Vector index check for channel {channel_id}: {result}")
+    return result
+
+@huey.task()
+def summarize_latest_video_task(channel_id: int):
+    """Backfills the latest video's summary for channels ingested before summaries were stored."""
+    summary = video_summaries.backfill_latest(channel_id)
+    logger.info(f"TASK: Latest video summary for channel {channel_id}: {'ready' if summary else 'unavailable'}")
+
 @huey.task()
 def update_bot_profile_task(bot_token: str, channel_url: str):
     """
@@ -869,6 +923,7 @@ from tasks_multi_source import (
 # SEO METADATA GENERATION TASK
 # ──────────────────────────────────────────────────────────────────────────────
 @huey.task()
+@rate_limiter.bulk_lane()
 def generate_seo_metadata_task(channel_id: int, channel_name: str):
     """
     Background task that:
@@ -2,6 +2,7 @@
 # --- MULTI-SOURCE CHATBOT TASKS ---
 import logging
 from tasks import huey, update_task_progress
+from utils import rate_limiter
 from utils.multi_source_tasks import (
     process_whatsapp_source as _process_whatsapp,
     process_website_source as _process_website,
@@ -13,6 +14,7 @@ logger = logging.getLogger(__name__)
 
 
 @huey.task(context=True)
+@rate_limiter.bulk_lane()
 def process_whatsapp_source_task(source_id: int, file_path: str, preferred_agent: str = None, task=None):
     """
     Huey task wrapper for processing WhatsApp chat exports.
@@ -54,6 +56,7 @@ def process_whatsapp_source_task(source_id: int, file_path: str, preferred_agent
 
 
 @huey.task(context=True)
+@rate_limiter.bulk_lane()
 def process_website_source_task(source_id: int, task=None):
     """
     Huey task wrapper for processing website sources.
@@ -92,6 +95,7 @@ def process_website_source_task(source_id: int, task=None):
 
 
 @huey.task(context=True)
+@rate_limiter.bulk_lane()
 def process_pdf_source_task(source_id: int, file_path: str, task=None):
     """
     Huey task wrapper for processing PDF file uploads.
@@ -0,0 +1,155 @@
+# In utils/answer_api.py
+"""
+Structured answer API for integrations (WhatsApp, Messenger, Telegram, Discord, widget).
+
+qa_utils.answer_question_events yields AnswerEvent(kind, payload):
+
+    EVENT_SOURCES        payload: list of {'title', 'url', 'snippet'}
+    EVENT_DELTA          payload: answer text delta
+    EVENT_QUERY_STRING   payload: remaining-credits banner (web only)
+    EVENT_ERROR          payload: {'error': code, 'message'?: str}
+    EVENT_DONE           payload: None
+
+answer() drains that iterator into an Answer, optionally bounded by a timeout
+or a cancel event. The SSE stream (sse_utils) is just another consumer of the
+same events.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, List, NamedTuple, Optional
+
+ANSWER_TIMEOUT = float(os.environ.get('ANSWER_TIMEOUT', 120))  # seconds; bounds answer() for integrations
+CANCEL_POLL_INTERVAL = 0.25
+
+EVENT_SOURCES = 'sources'
+EVENT_DELTA = 'delta'
+EVENT_QUERY_STRING = 'updated_query_string'
+EVENT_ERROR = 'error'
+EVENT_DONE = 'done'
+
+QUERY_LIMIT_REACHED = 'QUERY_LIMIT_REACHED'
+
+_END = object()
+
+
+class AnswerEvent(NamedTuple):
+    kind: str
+    payload: Any = None
+
+
+@dataclass
+class Answer:
+    text: str = ''
+    sources: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    message: Optional[str] = None
+    updated_query_string: Optional[str] = None
+    timed_out: bool = False
+    cancelled: bool = False
+
+    @property
+    def limit_reached(self) -> bool:
+        return self.error == QUERY_LIMIT_REACHED
+
+    @property
+    def complete(self) -> bool:
+        """The stream ran to the end without an error, timeout or cancellation."""
+        return not (self.error or self.timed_out or self.cancelled)
+
+
+class _Collector:
+    def __init__(self):
+        self.result = Answer()
+        self.parts = []
+
+    def add(self, event) -> None:
+        kind, payload = event
+        if kind == EVENT_DELTA:
+            self.parts.append(payload)
+        elif kind == EVENT_SOURCES:
+            self.result.sources = payload or []
+        elif kind == EVENT_QUERY_STRING:
+            self.result.updated_query_string = payload
+        elif kind == EVENT_ERROR:
+            self.result.error = payload.get('error')
+            self.result.message = payload.get('message')
+
+    def finish(self) -> Answer:
+        self.result.text = ''.join(self.parts)
+        return self.result
+
+
+def _pump(events, out: queue.Queue, stop: threading.Event) -> None:
+    # The generator must be closed from the thread that runs it.
+    try:
+        for event in events:
+            out.put(event)
+            if stop.is_set():
+                break
+    except Exception as e:
+        out.put(e)
+    finally:
+        events.close()
+        out.put(_END)
+
+
+def answer(timeout: Optional[float] = ANSWER_TIMEOUT, cancel_event: Optional[threading.Event] = None, **kwargs) -> Answer:
+    """
+    Blocking answer for a question; takes the same keyword arguments as answer_question_events.
+
+    With a timeout or cancel_event the pipeline runs on a helper thread; when either
+    fires, the partial Answer is returned (timed_out / cancelled set) and the stream is
+    closed at its next event, which also closes the provider connection. History is only
+    saved for answers that complete.
+    """
+    from .qa_utils import answer_question_events
+
+    collector = _Collector()
+    events = answer_question_events(**kwargs)
+
+    if timeout is None and cancel_event is None:
+        for event in events:
+            collector.add(event)
+        return collector.finish()
+
+    out = queue.Queue()
+    stop = threading.Event()
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_pump, events, out, stop), name='answer-api', daemon=True).start()
+
+    deadline = None if not timeout or timeout <= 0 else time.monotonic() + timeout
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                collector.result.cancelled = True
+                break
+            wait = CANCEL_POLL_INTERVAL if cancel_event is not None else None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    collector.result.timed_out = True
+                    break
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                item = out.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            collector.add(item)
+    finally:
+        stop.set()
+
+    result = collector.finish()
+    if result.timed_out or result.cancelled:
+        logging.warning(f"[ANSWER_API] Answer {'timed out' if result.timed_out else 'cancelled'} after {len(result.text)} chars "
+                        f"(integration={kwargs.get('integration_source')}, conversation={kwargs.get('conversation_id')})")
+    return result
@@ -0,0 +1,221 @@
+# In utils/answer_cache.py
+"""
+Semantic answer cache for answer_question_stream.
+
+When a new question lands within ANSWER_CACHE_MAX_DISTANCE (cosine distance)
+of a question we already answered for the same channel, persona and plan tier,
+the stored answer + sources are replayed instead of running retrieval,
+reranking and a full LLM generation.
+
+Entries live in Redis so every worker shares them:
+    answer_cache:{channel_id}:v{version}:{persona}:{tier}:emb  -> hash(entry_id -> float16 bytes)
+    answer_cache:{channel_id}:v{version}:{persona}:{tier}:ans  -> hash(entry_id -> JSON answer/sources)
+
+Invalidation is done by bumping `answer_cache_version:{channel_id}` whenever the
+channel's embeddings change (ingest / sync / multi-source tasks). Persona edits
+(speaking_style, creator_soul, ...) change the persona fingerprint, so they
+miss automatically; the settings endpoints also bump the version explicitly.
+Without Redis the cache falls back to process-local memory.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+import redis
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from .embedding_cache import normalize_question
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_MAX_DISTANCE = float(os.environ.get('ANSWER_CACHE_MAX_DISTANCE', 0.05))  # cosine distance
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 24 * 3600))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 256))  # per bucket
+# How long a worker keeps its decoded copy of a bucket's embedding matrix before re-reading Redis.
+ANSWER_CACHE_LOCAL_TTL = int(os.environ.get('ANSWER_CACHE_LOCAL_TTL', 30))
+
+# Fields that shape the persona prompt. Changing any of them produces a new fingerprint.
+PERSONA_FIELDS = ('bot_type', 'creator_name', 'channel_name', 'speaking_style', 'creator_soul', 'promotion_triggers')
+
+try:
+    redis_client = redis.from_url(os.environ.get('REDIS_URL'))
+except Exception:
+    redis_client = None
+
+_bucket_ttl = ANSWER_CACHE_LOCAL_TTL if redis_client else ANSWER_CACHE_TTL
+# bucket_key -> {'ids': [...], 'matrix': np.ndarray (L2-normalised rows)}
+_local_buckets = TTLCache(maxsize=512, ttl=_bucket_ttl)
+# (bucket_key, entry_id) -> answer dict (only used when Redis is unavailable)
+_local_answers = TTLCache(maxsize=512 * 16, ttl=ANSWER_CACHE_TTL)
+_local_versions: Dict[Any, int] = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+
+def persona_fingerprint(channel_data: Optional[dict]) -> str:
+    """Short hash over every channel field that shapes the persona prompt."""
+    payload = '\x1f'.join(str((channel_data or {}).get(field) or '') for field in PERSONA_FIELDS)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def _get_version(channel_id) -> int:
+    if redis_client:
+        try:
+            raw = redis_client.get(f"answer_cache_version:{channel_id}")
+            return int(raw) if raw else 0
+        except redis.RedisError as e:
+            logger.warning(f"Redis GET error for answer cache version: {e}")
+    return _local_versions.get(channel_id, 0)
+
+
+def _bucket_key(channel_data: dict, plan_tier: str) -> str:
+    channel_id = channel_data.get('id')
+    return f"answer_cache:{channel_id}:v{_get_version(channel_id)}:{persona_fingerprint(channel_data)}:{plan_tier}"
+
+
+def _normalise(vector) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype='float32')
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def _load_bucket(bucket: str) -> Optional[dict]:
+    with _lock:
+        cached = _local_buckets.get(bucket)
+    if cached is not None or not redis_client:
+        return cached
+
+    try:
+        raw = redis_client.hgetall(f"{bucket}:emb")
+    except redis.RedisError as e:
+        logger.warning(f"Redis HGETALL error for answer cache: {e}")
+        return None
+
+    ids, rows = [], []
+    for entry_id, blob in raw.items():
+        row = _normalise(np.frombuffer(blob, dtype='float16'))
+        if row is not None:
+            ids.append(entry_id.decode('utf-8') if isinstance(entry_id, bytes) else entry_id)
+            rows.append(row)
+    loaded = {'ids': ids, 'matrix': np.vstack(rows) if rows else None}
+    with _lock:
+        _local_buckets[bucket] = loaded
+    return loaded
+
+
+def lookup(channel_data: Optional[dict], plan_tier: str, query_embedding) -> Optional[dict]:
+    """
+    Returns {'answer', 'sources', 'question', 'distance'} for the closest cached
+    question within the configured distance, or None.
+    """
+    if not ANSWER_CACHE_ENABLED or not channel_data or not channel_data.get('id') or query_embedding is None:
+        return None
+
+    query = _normalise(query_embedding)
+    if query is None:
+        return None
+
+    bucket = _bucket_key(channel_data, plan_tier)
+    loaded = _load_bucket(bucket)
+    if not loaded or loaded['matrix'] is None or loaded['matrix'].shape[1] != query.shape[0]:
+        _stats['misses'] += 1
+        return None
+
+    similarities = loaded['matrix'] @ query
+    best = int(np.argmax(similarities))
+    distance = 1.0 - float(similarities[best])
+    if distance > ANSWER_CACHE_MAX_DISTANCE:
+        _stats['misses'] += 1
+        return None
+
+    entry_id = loaded['ids'][best]
+    entry = None
+    if redis_client:
+        try:
+            raw = redis_client.hget(f"{bucket}:ans", entry_id)
+            entry = json.loads(raw) if raw else None
+        except (redis.RedisError, ValueError) as e:
+            logger.warning(f"Could not read cached answer {entry_id}: {e}")
+    else:
+        entry = _local_answers.get((bucket, entry_id))
+
+    if not entry:
+        _stats['misses'] += 1
+        return None
+
+    _stats['hits'] += 1
+    entry['distance'] = distance
+    return entry
+
+
+def store(channel_data: Optional[dict], plan_tier: str, question: str, query_embedding, answer: str, sources: List[dict]):
+    """Adds an answered question to the channel's bucket (no-op once the bucket is full)."""
+    if not ANSWER_CACHE_ENABLED or not channel_data or not channel_data.get('id') or query_embedding is None:
+        return
+
+    row = _normalise(query_embedding)
+    if row is None:
+        return
+
+    bucket = _bucket_key(channel_data, plan_tier)
+    entry_id = hashlib.sha1(normalize_question(question).encode('utf-8')).hexdigest()[:16]
+    entry = {'question': question, 'answer': answer, 'sources': sources}
+
+    if redis_client:
+        try:
+            if redis_client.hlen(f"{bucket}:emb") >= ANSWER_CACHE_MAX_ENTRIES:
+                return
+            pipe = redis_client.pipeline()
+            pipe.hset(f"{bucket}:emb", entry_id, row.astype('float16').tobytes())
+            pipe.hset(f"{bucket}:ans", entry_id, json.dumps(entry))
+            pipe.expire(f"{bucket}:emb", ANSWER_CACHE_TTL)
+            pipe.expire(f"{bucket}:ans", ANSWER_CACHE_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Redis error while storing cached answer: {e}")
+            return
+    else:
+        _local_answers[(bucket, entry_id)] = entry
+
+    with _lock:
+        loaded = _local_buckets.get(bucket) or {'ids': [], 'matrix': None}
+        if entry_id in loaded['ids'] or len(loaded['ids']) >= ANSWER_CACHE_MAX_ENTRIES:
+            return
+        matrix = row[None, :] if loaded['matrix'] is None else np.vstack([loaded['matrix'], row])
+        _local_buckets[bucket] = {'ids': loaded['ids'] + [entry_id], 'matrix': matrix}
+    _stats['stores'] += 1
+
+
+def invalidate_channel(channel_id):
+    """Drops every cached answer for a channel by bumping its version."""
+    if channel_id is None:
+        return
+    if redis_client:
+        try:
+            redis_client.incr(f"answer_cache_version:{channel_id}")
+        except redis.RedisError as e:
+            logger.warning(f"Redis INCR error while invalidating answer cache for channel {channel_id}: {e}")
+    with _lock:
+        _local_versions[channel_id] = _local_versions.get(channel_id, 0) + 1
+        prefix = f"answer_cache:{channel_id}:"
+        for key in [k for k in _local_buckets.keys() if k.startswith(prefix)]:
+            _local_buckets.pop(key, None)
+    _stats['invalidations'] += 1
+    logger.info(f"[ANSWER_CACHE] Invalidated cached answers for channel {channel_id}")
+
+
+def get_cache_stats() -> dict:
+    """Returns hit/miss counters for this process."""
+    stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,352 @@
+# In utils/async_answer.py
+"""
+asyncio variant of answer_question_stream for the SSE endpoints.
+
+Under `gunicorn --threads 8` every open /stream_answer pins one of the eight
+threads for the whole LLM generation (5-30 s), so nine concurrent chats queue.
+Served through asgi.py, the route now only does the short per-request work
+(auth, limits, history) on a WSGI thread and hands the stream over to the event
+loop, which can hold hundreds of them:
+
+    Flask view     -> handoff_response(stream_kwargs)   empty response + X-Async-Stream token
+    asgi.py        -> claim_handoff(token)              runs answer_question_stream_async() on the loop
+
+answer_question_stream_async() shares _prepare_answer/_finish_answer with the
+blocking generator. Retrieval, rerank and the Supabase calls in those stages run
+in the loop's thread pool (they are short), while the provider stream itself is
+native asyncio for OpenAI-compatible APIs, Groq and Ollama. Providers without an
+async client (Gemini) are pumped from a worker thread.
+
+The blocking answer_question_stream stays the API for Huey tasks and integrations.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import secrets
+import threading
+from typing import AsyncIterator, Optional
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from . import provider_clients
+from . import llm_hedging
+from . import sse_utils
+from . import rate_limiter
+from .answer_api import AnswerEvent, EVENT_DELTA, EVENT_ERROR, EVENT_DONE
+from .qa_utils import (
+    LLM_STREAM_PROVIDER_MAP,
+    DEFAULT_REQUEST_TIMEOUT,
+    _prepare_answer,
+    _completion_events,
+    _finish_answer,
+)
+
+load_dotenv()
+
+ASYNC_STREAMING_ENABLED = os.environ.get('ASYNC_STREAMING', 'true').lower() == 'true'
+HANDOFF_TTL = int(os.environ.get('ASYNC_STREAM_HANDOFF_TTL', 60))  # seconds a handed-off stream may wait to be claimed
+
+HANDOFF_HEADER = 'X-Async-Stream'
+CAPABLE_HEADER = 'X-Async-Stream-Capable'
+# asgi.py stamps requests with this per-process secret so clients can't fake the capability.
+CAPABLE_SECRET = secrets.token_urlsafe(16)
+
+_handoffs = TTLCache(maxsize=10000, ttl=HANDOFF_TTL)
+_handoff_lock = threading.Lock()
+
+
+# --- Async provider streams (mirror the blocking ones in qa_utils) ---
+
+async def _get_openai_answer_stream_async(prompt: str, model: str, api_key: str, **kwargs) -> AsyncIterator[str]:
+    try:
+        import openai
+        client = provider_clients.get_async_openai_client(api_key, kwargs.get('base_url'))
+        image_base64 = kwargs.get('image_base64')
+        image_mime_type = kwargs.get('image_mime_type', 'image/jpeg')
+        if image_base64:
+            content = [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{image_mime_type};base64,{image_base64}"}},
+            ]
+        else:
+            content = prompt
+
+        request = {
+            'model': model,
+            'messages': [{"role": "user", "content": content}],
+            'max_tokens': kwargs.get('max_tokens', 1024),
+            'temperature': kwargs.get('temperature', 1),
+        }
+        await rate_limiter.acquire_async('openai', api_key)
+        try:
+            response_stream = await client.chat.completions.create(stream=True, **request)
+            async for chunk in response_stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.APIError as e:
+            if "streaming the response from the model provider" not in str(e):
+                raise
+            logging.warning(f"Streaming failed for model {model}, falling back to non-streaming: {e}")
+            response = await client.chat.completions.create(stream=False, **request)
+            if response.choices[0].message.content:
+                yield response.choices[0].message.content
+    except Exception as e:
+        if rate_limiter.is_rate_limit_error(e):
+            rate_limiter.report_throttled('openai', api_key)
+        logging.error(f"Failed to get async OpenAI stream: {e}", exc_info=True)
+        yield "Error: Could not get a response from the provider."
+
+
+async def _get_groq_answer_stream_async(prompt: str, model: str, api_key: str, **kwargs) -> AsyncIterator[str]:
+    try:
+        headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
+        data = {'model': model, 'messages': [{"role": "user", "content": prompt}], 'max_tokens': kwargs.get('max_tokens'), 'temperature': 1, 'stream': True}
+        client = provider_clients.get_async_http_client()
+        await rate_limiter.acquire_async('groq', api_key)
+        async with client.stream('POST', 'https://api.groq.com/openai/v1/chat/completions', headers=headers, json=data, timeout=DEFAULT_REQUEST_TIMEOUT) as response:
+            if response.status_code != 200:
+                if response.status_code == 429:
+                    rate_limiter.report_throttled('groq', api_key)
+                error_body = (await response.aread()).decode('utf-8', errors='replace')
+                logging.error(f"Groq API returned HTTP {response.status_code} for model '{model}': {error_body}")
+                yield f"Error: Groq API error {response.status_code}. Model '{model}' may be unavailable or the API key is invalid. Details: {error_body[:200]}"
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith('data: '):
+                    continue
+                chunk_data = line[6:].strip()
+                if chunk_data == '[DONE]':
+                    continue
+                try:
+                    content = json.loads(chunk_data)['choices'][0]['delta'].get('content')
+                except (json.JSONDecodeError, KeyError, IndexError):
+                    continue
+                if content:
+                    yield content
+    except Exception as e:
+        logging.error(f"Failed to get async Groq stream: {e}", exc_info=True)
+        yield "Error: Could not get a response from the provider."
+
+
+async def _get_ollama_answer_stream_async(prompt: str, model: str, ollama_url: str, **kwargs) -> AsyncIterator[str]:
+    try:
+        client = provider_clients.get_async_http_client()
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}
+        async with client.stream('POST', f"{ollama_url}/api/chat", json=payload, timeout=DEFAULT_REQUEST_TIMEOUT) as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    json_data = json.loads(line)
+                except ValueError:
+                    continue
+                content = None
+                if isinstance(json_data, dict):
+                    content = json_data.get('message', {}).get('content') or json_data.get('content') or json_data.get('text')
+                if content:
+                    yield content
+    except Exception as e:
+        logging.error(f"Failed to get async Ollama stream: {e}", exc_info=True)
+        yield "Error: Could not get a response from the provider."
+
+
+ASYNC_LLM_STREAM_PROVIDER_MAP = {
+    'openai': _get_openai_answer_stream_async,
+    'groq': _get_groq_answer_stream_async,
+    'ollama': _get_ollama_answer_stream_async,
+}
+
+
+async def _iterate_in_thread(stream_function, *args, **kwargs) -> AsyncIterator[str]:
+    """Runs a blocking stream function in the loop's thread pool and relays its chunks."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    handle = llm_hedging.AbortHandle()
+
+    def pump():
+        with llm_hedging.abortable(handle):
+            try:
+                for item in stream_function(*args, **kwargs):
+                    if handle.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    loop.run_in_executor(None, pump)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Also ends a read blocked before the first token (see llm_hedging.tracked)
+        handle.abort()
+
+
+def get_async_stream(llm_provider: str, prompt: str, model: str, **stream_kwargs) -> AsyncIterator[str]:
+    stream_function = ASYNC_LLM_STREAM_PROVIDER_MAP.get(llm_provider)
+    if stream_function:
+        return stream_function(prompt, model, **stream_kwargs)
+    return _iterate_in_thread(LLM_STREAM_PROVIDER_MAP[llm_provider], prompt, model, **stream_kwargs)
+
+
+async def _hedged_stream_async(provider: str, prompt: str, model: str, stream_kwargs: dict) -> AsyncIterator[str]:
+    """asyncio version of llm_hedging.hedged_stream: same deadline, failover and latency tracking."""
+    target = llm_hedging.hedge_target(provider, model)
+    if target and target[0] not in LLM_STREAM_PROVIDER_MAP:
+        target = None
+
+    streams = {}  # tag -> (provider, started_at, async iterator)
+    pending = {}  # __anext__ task -> tag
+
+    def launch(tag, launch_provider, launch_model, launch_kwargs):
+        iterator = get_async_stream(launch_provider, prompt, launch_model, **launch_kwargs)
+        streams[tag] = (launch_provider, time.perf_counter(), iterator)
+        pending[asyncio.ensure_future(iterator.__anext__())] = tag
+
+    deadline = llm_hedging.hedge_deadline(provider)
+    launch('primary', provider, model, stream_kwargs)
+    primary_error = None
+    winner = None
+    first_chunk = None
+
+    try:
+        while pending and winner is None:
+            timeout = None
+            if target and 'hedge' not in streams:
+                timeout = max(0.0, streams['primary'][1] + deadline - time.perf_counter())
+            done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"[LLM_HEDGE] No first token from {provider} after {deadline:.2f}s; hedging with {target[0]}/{target[1]}.")
+                launch('hedge', target[0], target[1], llm_hedging.hedge_stream_kwargs(target[0], stream_kwargs))
+                continue
+
+            for task in done:
+                tag = pending.pop(task)
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    chunk = None
+                except Exception as e:
+                    logging.error(f"[LLM_HEDGE] {tag} stream failed before its first token: {e}")
+                    chunk = None
+                if winner is None and not llm_hedging.is_failure_chunk(chunk):
+                    winner, first_chunk = tag, chunk
+                    continue
+                if tag == 'primary':
+                    primary_error = chunk
+                    if target and 'hedge' not in streams and winner is None:
+                        print(f"[LLM_HEDGE] {provider} failed before its first token; failing over to {target[0]}/{target[1]}.")
+                        launch('hedge', target[0], target[1], llm_hedging.hedge_stream_kwargs(target[0], stream_kwargs))
+
+        if winner is None:
+            if primary_error:
+                yield primary_error
+            return
+
+        now = time.perf_counter()
+        for tag, (tag_provider, started_at, _) in streams.items():
+            if tag == winner or tag in pending.values():
+                # A loser still waiting for its first token took at least this long.
+                llm_hedging.record_first_token(tag_provider, now - started_at)
+        if 'hedge' in streams:
+            print(f"[LLM_HEDGE] {winner} stream ({streams[winner][0]}) won the race.")
+
+        yield first_chunk
+        async for chunk in streams[winner][2]:
+            yield chunk
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for _, _, iterator in streams.values():
+            try:
+                await iterator.aclose()
+            except Exception:
+                pass
+
+
+async def answer_question_events_async(*args, **kwargs) -> AsyncIterator[AnswerEvent]:
+    """
+    Same arguments and events as qa_utils.answer_question_events, without holding
+    a thread while the LLM generates.
+    """
+    plan = await asyncio.to_thread(_prepare_answer, *args, **kwargs)
+    for event in plan['events']:
+        yield event
+    if plan['done']:
+        return
+
+    full_answer = ""
+    llm_stream_start_time = time.perf_counter()
+    first_token_time_logged = False
+    chunks = _hedged_stream_async(plan['llm_provider'], plan['prompt'], plan['model'], plan['stream_kwargs'])
+
+    try:
+        async for chunk in chunks:
+            if not first_token_time_logged:
+                print(f"[TIME_LOG] LLM time to first token (async): {time.perf_counter() - llm_stream_start_time:.4f} seconds.")
+                first_token_time_logged = True
+            full_answer += chunk
+            yield AnswerEvent(EVENT_DELTA, chunk)
+
+        if not first_token_time_logged and not full_answer:
+            print("[TIME_LOG] LLM stream produced no output.")
+        else:
+            print(f"[TIME_LOG] Full LLM stream generation (async) took {time.perf_counter() - llm_stream_start_time:.4f} seconds.")
+
+        for event in await asyncio.to_thread(_completion_events, plan['on_complete']):
+            yield event
+
+    except Exception as e:
+        logging.error(f"Streaming error in answer_question_stream_async: {e}", exc_info=True)
+        yield AnswerEvent(EVENT_ERROR, {'error': 'An error occurred while generating the answer.'})
+
+    finally:
+        # Closes the provider connection right away when the client disconnects mid-stream.
+        await chunks.aclose()
+
+    yield AnswerEvent(EVENT_DONE)
+    await asyncio.to_thread(_finish_answer, plan, full_answer)
+
+
+def answer_question_stream_async(*args, **kwargs) -> AsyncIterator[str]:
+    """answer_question_events_async encoded as coalesced SSE frames, with heartbeats."""
+    return sse_utils.encode_sse_async(answer_question_events_async(*args, **kwargs))
+
+
+# --- WSGI -> event loop handoff ---
+
+def can_handoff(request) -> bool:
+    """True when the request came through asgi.py, which will pick up a handed-off stream."""
+    return ASYNC_STREAMING_ENABLED and request.headers.get(CAPABLE_HEADER) == CAPABLE_SECRET
+
+
+def handoff_response(stream_kwargs: dict):
+    """
+    Parks the answer_question_stream kwargs and returns the placeholder response asgi.py
+    replaces with answer_question_stream_async(**stream_kwargs). Headers set on the
+    placeholder (session cookie, CORS) are kept.
+    """
+    from flask import Response
+
+    token = secrets.token_urlsafe(16)
+    with _handoff_lock:
+        _handoffs[token] = stream_kwargs
+    return Response('', mimetype='text/event-stream', headers={HANDOFF_HEADER: token})
+
+
+def claim_handoff(token: str) -> Optional[dict]:
+    with _handoff_lock:
+        return _handoffs.pop(token, None)
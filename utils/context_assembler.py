@@ -0,0 +1,167 @@
+# In utils/context_assembler.py
+"""
+Builds the prompt's context block from the reranked chunks.
+
+Chunks are cut by embed_utils with a 200-character overlap, so two adjacent
+chunks of the same video repeat that text, and the old join had no size limit.
+assemble_context():
+
+  1. groups chunks by source (video / website / chat / PDF) and merges runs of
+     consecutive chunk_index values into one passage, dropping the repeated overlap;
+  2. orders passages by the rank of their best chunk;
+  3. fits them into a per-plan token budget (CONTEXT_BUDGET_FREE / _PERSONAL /
+     _CREATOR), truncating the last passage that fits partially and dropping the rest.
+
+Token counts use a per-model cached tiktoken encoder (get_encoder); looking the
+encoding up is far slower than encoding a few chunks.
+"""
+
+import os
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+
+CONTEXT_BUDGETS = {
+    'free': int(os.environ.get('CONTEXT_BUDGET_FREE', 2000)),
+    'personal': int(os.environ.get('CONTEXT_BUDGET_PERSONAL', 3500)),
+    'creator': int(os.environ.get('CONTEXT_BUDGET_CREATOR', 6000)),
+}
+CONTEXT_MIN_PARTIAL_TOKENS = int(os.environ.get('CONTEXT_MIN_PARTIAL_TOKENS', 80))
+MAX_OVERLAP_CHARS = 400   # embed_utils uses chunk_overlap=200; the splitter can shift boundaries a little
+MIN_OVERLAP_CHARS = 20    # shorter matches are likely coincidence
+
+
+@lru_cache(maxsize=32)
+def get_encoder(model: Optional[str] = None):
+    try:
+        return tiktoken.encoding_for_model(model or '')
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def token_budget_for_plan(plan_tier: str) -> int:
+    return CONTEXT_BUDGETS.get(plan_tier, CONTEXT_BUDGETS['free'])
+
+
+def _source_key(chunk: dict) -> Optional[tuple]:
+    if chunk.get('source_id') is None and chunk.get('video_id') is None:
+        url = chunk.get('video_url') or chunk.get('url')
+        return ('url', url) if url else None
+    return (chunk.get('source_type'), chunk.get('source_id'), chunk.get('video_id'))
+
+
+def strip_overlap(previous: str, following: str) -> str:
+    """Removes the prefix of `following` that repeats the end of `previous`."""
+    longest = min(len(previous), len(following), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def _merge_passages(chunks: List[dict]) -> Tuple[List[Dict[str, Any]], int]:
+    """Returns passages ({'chunk', 'text', 'chunk_count'}) in relevance order and the overlap chars removed."""
+    groups: Dict[Any, List[Tuple[int, dict]]] = {}
+    order = []
+    for rank, chunk in enumerate(chunks):
+        key = _source_key(chunk)
+        if key is None or chunk.get('chunk_index') is None:
+            key = ('unmergeable', rank)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((rank, chunk))
+
+    passages = []
+    removed = 0
+    for key in order:
+        members = groups[key]
+        if len(members) > 1:
+            members.sort(key=lambda m: int(m[1]['chunk_index']))
+        run = None
+        for rank, chunk in members:
+            text = chunk.get('chunk_text') or ''
+            index = chunk.get('chunk_index')
+            if run is not None and index is not None and int(index) == run['last_index'] + 1:
+                trimmed = strip_overlap(run['text'], text)
+                removed += len(text) - len(trimmed)
+                run['text'] += trimmed if not trimmed or trimmed[0].isspace() or run['text'][-1:].isspace() else ' ' + trimmed
+                run['last_index'] = int(index)
+                run['rank'] = min(run['rank'], rank)
+                run['chunk_count'] += 1
+                continue
+            run = {
+                'chunk': chunk,
+                'text': text,
+                'rank': rank,
+                'last_index': int(index) if index is not None else -2,
+                'chunk_count': 1,
+            }
+            passages.append(run)
+
+    passages.sort(key=lambda p: p['rank'])
+    return passages, removed
+
+
+def format_passage(chunk: dict, text: str) -> str:
+    source_type = chunk.get('source_type', 'youtube')
+    title = chunk.get('video_title') or chunk.get('title') or 'Unknown Source'
+    date = chunk.get('upload_date') or chunk.get('date') or 'N/A'
+
+    if source_type == 'whatsapp':
+        return f"[WhatsApp Chat: \"{title}\" | {date}]\n{text}"
+    if source_type == 'website':
+        return f"[Website: \"{title}\" | {chunk.get('url')}]\n{text}"
+    return f"[Video: \"{title}\" | {date}]\n{text}"
+
+
+def assemble_context(chunks: List[dict], token_budget: Optional[int] = None, model: Optional[str] = None) -> Tuple[str, dict]:
+    """Returns (context, stats). token_budget=None means no limit."""
+    encoder = get_encoder(model)
+    passages, overlap_removed = _merge_passages(chunks)
+
+    parts = []
+    used_tokens = 0
+    dropped = 0
+    truncated = False
+    separator_tokens = 1  # '\n\n'
+    for passage in passages:
+        block = format_passage(passage['chunk'], passage['text'])
+        tokens = encoder.encode(block)
+        cost = len(tokens) + (separator_tokens if parts else 0)
+        if token_budget is not None and used_tokens + cost > token_budget:
+            remaining = token_budget - used_tokens - (separator_tokens if parts else 0)
+            if remaining >= CONTEXT_MIN_PARTIAL_TOKENS and not truncated:
+                parts.append(encoder.decode(tokens[:remaining]).rstrip() + " ...")
+                used_tokens += remaining + (separator_tokens if len(parts) > 1 else 0)
+                truncated = True
+            else:
+                dropped += passage['chunk_count']
+            continue
+        parts.append(block)
+        used_tokens += cost
+
+    context = '\n\n'.join(parts)
+    stats = {
+        'chunks': len(chunks),
+        'passages': len(parts),
+        'overlap_chars_removed': overlap_removed,
+        'dropped_chunks': dropped,
+        'truncated': truncated,
+        'tokens': used_tokens,
+        'tokens_before': None,
+        'budget': token_budget,
+    }
+    print(f"[CONTEXT] {len(chunks)} chunks -> {len(parts)} passages, {used_tokens} tokens "
+          f"(budget {token_budget}; overlap chars removed {overlap_removed}; "
+          f"dropped chunks {dropped}{'; last passage truncated' if truncated else ''})")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        # Re-encodes the whole unmerged context, so it is only measured when debugging.
+        naive_tokens = len(encoder.encode('\n\n'.join(format_passage(c, c.get('chunk_text', '')) for c in chunks)))
+        stats['tokens_before'] = naive_tokens
+        logging.debug(f"[CONTEXT] Unmerged context would have been {naive_tokens} tokens (saved {naive_tokens - used_tokens}).")
+    if dropped:
+        logging.info(f"[CONTEXT] Token budget {token_budget} dropped {dropped} lower-ranked chunks.")
+    return context, stats
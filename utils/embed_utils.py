@@ -1,174 +1,96 @@
 # In utils/embed_utils.py
 
 import logging
-import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import concurrent.futures
 import os
-import time
+import threading
 from dotenv import load_dotenv
-from .supabase_client import get_supabase_admin_client
 from .qa_utils import EMBEDDING_PROVIDER_MAP
+from . import embedding_cache
+from . import rate_limiter
 
 # Load environment variables from .env if present
 load_dotenv()
 
+EMBED_MAX_CONCURRENCY = int(os.environ.get('EMBED_MAX_CONCURRENCY', 8))  # embedding requests in flight per process
+
+# Shared by every ingest running in the process; request rate and 429 backoff are handled cluster-wide by rate_limiter.
+embed_slots = threading.BoundedSemaphore(EMBED_MAX_CONCURRENCY)
+
+def get_embedding_config() -> dict:
+    """The ingest embedding provider, model and credentials from the environment."""
+    embed_provider = os.environ.get('EMBED_PROVIDER', 'openai')
+    embed_model = os.environ.get('EMBED_MODEL', 'text-embedding-3-small')
+    return {
+        'provider': embed_provider,
+        'model': embed_model,
+        'dimensions': embedding_cache.get_embedding_dimensions(embed_provider),
+        'ollama_url': os.environ.get('OLLAMA_URL', 'http://localhost:11434'),
+        'api_key': os.environ.get('GEMINI_API_KEY') or os.environ.get('OPENAI_API_KEY') or os.environ.get('EMBED_API_KEY'),
+        'function': EMBEDDING_PROVIDER_MAP.get(embed_provider),
+    }
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1200,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+def chunk_transcript(transcript, text_splitter):
+    """Returns (enhanced chunk text, metadata) pairs for one transcript."""
+    chunks = text_splitter.split_text(transcript['transcript'])
+    return [
+        (create_enhanced_chunk(chunk, transcript, i, len(chunks)), create_comprehensive_metadata(transcript, chunk, i, len(chunks)))
+        for i, chunk in enumerate(chunks)
+    ]
+
+def embed_batch_with_retry(batch, config, max_retries=5):
+    """
+    Embeds one batch of texts, at most EMBED_MAX_CONCURRENCY at a time per process.
+    It will attempt to process a batch up to `max_retries` times; after a rate limit the
+    next attempt waits in rate_limiter for the provider's (reduced) quota. The provider
+    embedding functions report the 429 to rate_limiter themselves before re-raising it.
+    """
+    embedding_function = config['function']
+    if not embedding_function:
+        raise ValueError(f"Unsupported embedding provider selected: {config['provider']}")
+    for attempt in range(max_retries):
+        try:
+            # Attempt to get the embeddings
+            with embed_slots:
+                if config['provider'] == 'ollama':
+                    return embedding_function(batch, config['model'], config['ollama_url'])
+                else:
+                    return embedding_function(batch, config['model'], config['api_key'])
+        except Exception as e:
+            if rate_limiter.is_rate_limit_error(e) and attempt < max_retries - 1:
+                logging.warning(f"Rate limit hit on attempt {attempt + 1}/{max_retries}. Retrying when quota allows...")
+            else:
+                # If it's not a rate limit error or the last retry, raise the exception
+                logging.error(f"Final attempt failed for a batch: {e}")
+                raise e # Re-raise the final exception to be caught by the caller
+    return None # Should not be reached if an exception is always raised on failure
+
 # --- START: THE FIX ---
 # The function signature is updated to accept user_id and channel_id.
 # The _unused_config parameter is kept for compatibility with the sync task.
 def create_and_store_embeddings(transcripts, _unused_config, user_id, channel_id=None, progress_callback=None):
 # --- END: THE FIX ---
-    """Create embeddings for transcript chunks in parallel and upsert to the vector store."""
-    try:
-        embed_provider = os.environ.get('EMBED_PROVIDER', 'openai')
-        embed_model = os.environ.get('EMBED_MODEL', 'text-embedding-3-small')
-        ollama_url = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
-        embed_api_key = os.environ.get('GEMINI_API_KEY') or os.environ.get('OPENAI_API_KEY') or os.environ.get('EMBED_API_KEY')
-
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1200,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False,
-        )
-
-        all_chunks_for_embedding = []
-        all_metadata = []
-        total_videos = len(transcripts)
-
-        logging.info(f"Creating embeddings for {total_videos} videos using advanced chunking...")
-
-        for video_idx, transcript in enumerate(transcripts):
-            text = transcript['transcript']
-            video_title = transcript['title']
-            
-            chunks = text_splitter.split_text(text)
-            
-            logging.info(f"Processing video {video_idx + 1}/{total_videos}: {video_title[:50]}... ({len(chunks)} chunks)")
-
-            for i, chunk in enumerate(chunks):
-                enhanced_chunk = create_enhanced_chunk(chunk, transcript, i, len(chunks))
-                all_chunks_for_embedding.append(enhanced_chunk)
-                
-                chunk_metadata = create_comprehensive_metadata(transcript, chunk, i, len(chunks))
-                all_metadata.append(chunk_metadata)
-
-        if not all_chunks_for_embedding:
-            logging.warning("No chunks were created from the transcripts. Nothing to embed.")
-            return False
+    """
+    Chunks, embeds and stores already-fetched transcripts through an IngestPipeline.
+    progress_callback receives the pipeline's stats dict. Tasks that fetch transcripts
+    should feed an IngestPipeline directly so embedding overlaps with the downloads.
+    """
+    from .ingest_pipeline import IngestPipeline
 
-        logging.info(f"Total chunks created: {len(all_chunks_for_embedding)}. Now creating embeddings in parallel...")
-
-        embedding_function = EMBEDDING_PROVIDER_MAP.get(embed_provider)
-        if not embedding_function:
-            logging.error(f"Unsupported embedding provider selected: {embed_provider}")
-            return False
-        
-        all_embeddings = []
-        batch_size = 32
-        
-        text_batches = [all_chunks_for_embedding[i:i + batch_size] for i in range(0, len(all_chunks_for_embedding), batch_size)]
-
-        def embed_batch_with_retry(batch, max_retries=3):
-            """
-            NEW: Worker function with exponential backoff retry logic.
-            It will attempt to process a batch up to `max_retries` times.
-            """
-            for attempt in range(max_retries):
-                try:
-                    # Attempt to get the embeddings
-                    if embed_provider == 'ollama':
-                        return embedding_function(batch, embed_model, ollama_url)
-                    else:
-                        return embedding_function(batch, embed_model, embed_api_key)
-                except Exception as e:
-                    # Check if the error is a rate limit error (customize this check if needed)
-                    if "rate limit" in str(e).lower() and attempt < max_retries - 1:
-                        wait_time = 2 ** attempt  # Exponentially increase wait time (1, 2, 4 seconds)
-                        logging.warning(f"Rate limit hit. Retrying batch in {wait_time} seconds...")
-                        time.sleep(wait_time)
-                    else:
-                        # If it's not a rate limit error or the last retry, raise the exception
-                        logging.error(f"Final attempt failed for a batch: {e}")
-                        raise e # Re-raise the final exception to be caught by the main loop
-            return None # Should not be reached if an exception is always raised on failure
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-            future_to_batch = {executor.submit(embed_batch_with_retry, batch): batch for batch in text_batches}
-
-            for future in concurrent.futures.as_completed(future_to_batch):
-                try:
-                    batch_embeddings = future.result()
-                    if batch_embeddings:
-                        all_embeddings.extend(batch_embeddings)
-                except Exception as exc:
-                    # Log the error, but crucially, the application continues to process other batches
-                    logging.error(f'A batch failed after all retries and was skipped: {exc}')
-
-        if not all_embeddings or len(all_embeddings) != len(all_chunks_for_embedding):
-             logging.error(f"Embedding creation failed or produced incorrect count. Expected {len(all_chunks_for_embedding)}, got {len(all_embeddings)}. Some batches may have been skipped after multiple failures.")
-             return False
-
-        logging.info(f"Successfully created {len(all_embeddings)} embeddings. Now preparing to save to Supabase.")
-
-        supabase = get_supabase_admin_client()
-        
-        vectors_to_insert = []
-        for i, embedding in enumerate(all_embeddings):
-            if embedding is None: continue # Ensure we don't process failed embeddings
-            meta = all_metadata[i]
-            # --- START: THE FIX ---
-            # The user_id and channel_id are now correctly included in the data to be inserted.
-            vectors_to_insert.append({
-                'user_id': user_id,
-                'channel_id': channel_id,
-                'video_id': meta['video_id'],
-                'embedding': embedding.tolist(),
-                'metadata': meta
-            })
-            # --- END: THE FIX ---
-
-        if not vectors_to_insert:
-            logging.warning("No valid vectors to insert. Skipping database operation.")
-            return True
-        
-        # --- START OF FIX: Reduced batch size for database insertion ---
-        # Changed from 50 to 20 to prevent statement timeouts on large channels.
-        # This is the key change to solve the error.
-        insert_batch_size = 20
-        # --- END OF FIX ---
-        
-        total_batches = (len(vectors_to_insert) + insert_batch_size - 1) // insert_batch_size
-        
-        logging.info(f"Preparing to insert {len(vectors_to_insert)} vectors in {total_batches} batches.")
-
-        for i in range(total_batches):
-            start_index = i * insert_batch_size
-            end_index = start_index + insert_batch_size
-            batch = vectors_to_insert[start_index:end_index]
-            
-            logging.info(f"Inserting batch {i + 1}/{total_batches} ({len(batch)} vectors)...")
-            
-            # Retry logic for database insertion
-            max_db_retries = 3
-            for attempt in range(max_db_retries):
-                try:
-                    supabase.table('embeddings').insert(batch).execute()
-                    break # Success, exit retry loop
-                except Exception as db_err:
-                    if attempt < max_db_retries - 1:
-                        wait = 2 * (attempt + 1)
-                        logging.warning(f"DB Insert failed (Attempt {attempt+1}/{max_db_retries}). Retrying in {wait}s... Error: {db_err}")
-                        time.sleep(wait)
-                    else:
-                        logging.error(f"Failed to insert batch {i+1} after all retries. Skipping this batch. Error: {db_err}")
-                        # We continue to the next batch even if this one fails to avoid total task failure
-
-            if progress_callback:
-                progress_callback(i + 1, total_batches)
-                
-        logging.info("All batches inserted successfully.")
-        return True
+    try:
+        logging.info(f"Creating embeddings for {len(transcripts)} videos using advanced chunking...")
+        with IngestPipeline(user_id, channel_id, progress_callback=progress_callback) as pipeline:
+            for transcript in transcripts:
+                pipeline.put(transcript)
+        return pipeline.succeeded()
 
     except Exception as e:
         logging.error(f"Error in embedding creation process: {e}", exc_info=True)
@@ -0,0 +1,199 @@
+# In utils/embedding_cache.py
+"""
+Two-tier cache for query embeddings.
+
+Tier 1 is a small in-process LRU so repeated questions inside one Gunicorn /
+Huey worker never leave the process. Tier 2 is Redis, shared by every worker
+(web, Huey, Discord service), so a question asked on the widget is a hit when
+it is asked again on WhatsApp a minute later.
+
+Vectors are stored as raw float16 / float32 bytes instead of JSON float lists.
+
+Document-chunk embeddings are cached too, keyed by (provider, model,
+dimensions, sha256 of the exact chunk text). Ingest
+(ingest_pipeline.IngestPipeline, for YouTube and multi-source alike)
+looks each batch of chunks up in one MGET and only sends the misses to the provider, so
+reprocessing a channel or re-adding a source doesn't re-embed unchanged text.
+
+Every ingested chunk costs about 3.2 KB in the chunk cache: a 1536-dim float16
+vector plus its key. That is roughly 3 GB per million chunks within
+CHUNK_EMBED_CACHE_TTL, bounded only by ingest volume. The chunk cache
+therefore never shares REDIS_URL, which is also the Huey broker and the
+session/answer cache. It uses its own CHUNK_EMBED_CACHE_REDIS_URL (a separate
+instance or DB configured with maxmemory and an allkeys-lru policy) and is off
+when that isn't set.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+import redis
+from cachetools import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBED_CACHE_ENABLED = os.environ.get('QUERY_EMBED_CACHE_ENABLED', 'true').lower() == 'true'
+QUERY_EMBED_CACHE_TTL = int(os.environ.get('QUERY_EMBED_CACHE_TTL', 7 * 24 * 3600))  # seconds
+QUERY_EMBED_CACHE_SIZE = int(os.environ.get('QUERY_EMBED_CACHE_SIZE', 2048))  # in-process entries
+# float16 halves the Redis footprint; cosine ranking is unaffected at this precision.
+QUERY_EMBED_CACHE_DTYPE = os.environ.get('QUERY_EMBED_CACHE_DTYPE', 'float16').lower()
+if QUERY_EMBED_CACHE_DTYPE not in ('float16', 'float32'):
+    QUERY_EMBED_CACHE_DTYPE = 'float16'
+CHUNK_EMBED_CACHE_ENABLED = os.environ.get('CHUNK_EMBED_CACHE_ENABLED', 'true').lower() == 'true'
+CHUNK_EMBED_CACHE_REDIS_URL = os.environ.get('CHUNK_EMBED_CACHE_REDIS_URL')  # dedicated, LRU-evicting Redis
+CHUNK_EMBED_CACHE_TTL = int(os.environ.get('CHUNK_EMBED_CACHE_TTL', 7 * 24 * 3600))  # seconds; covers reprocess/re-add within a week
+CHUNK_EMBED_CACHE_DTYPE = os.environ.get('CHUNK_EMBED_CACHE_DTYPE', 'float16').lower()
+if CHUNK_EMBED_CACHE_DTYPE not in ('float16', 'float32'):
+    CHUNK_EMBED_CACHE_DTYPE = 'float16'
+CHUNK_EMBED_CACHE_BATCH = 500  # keys per MGET / pipeline
+
+try:
+    redis_client = redis.from_url(os.environ.get('REDIS_URL'))
+except Exception:
+    redis_client = None
+
+try:
+    chunk_redis_client = redis.from_url(CHUNK_EMBED_CACHE_REDIS_URL) if CHUNK_EMBED_CACHE_REDIS_URL else None
+except Exception:
+    chunk_redis_client = None
+
+_local_cache = LRUCache(maxsize=QUERY_EMBED_CACHE_SIZE)
+_local_lock = threading.Lock()
+_stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'chunk_hits': 0, 'chunk_misses': 0}
+_stats_lock = threading.Lock()
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_question(text: str) -> str:
+    """Case-folds and collapses whitespace / trailing punctuation so trivial variants share an entry."""
+    normalized = _WHITESPACE_RE.sub(' ', (text or '').casefold()).strip()
+    return normalized.rstrip('?!. ')
+
+
+def get_embedding_dimensions(provider: str) -> str:
+    """Returns the configured output dimensionality for a provider (part of the cache key)."""
+    if provider == 'gemini':
+        return os.environ.get('GEMINI_EMBED_DIMENSIONS', '1536')
+    return os.environ.get('EMBED_DIMENSIONS', 'native')
+
+
+def make_cache_key(provider: str, model: str, dimensions: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_question(text).encode('utf-8')).hexdigest()
+    return f"qemb:{provider}:{model}:{dimensions}:{QUERY_EMBED_CACHE_DTYPE}:{digest}"
+
+
+def _bump(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def get_cached_query_embedding(provider: str, model: str, dimensions: str, text: str) -> Optional[np.ndarray]:
+    """Looks up a query embedding in the local LRU, then Redis. Returns a float32 array or None."""
+    if not QUERY_EMBED_CACHE_ENABLED:
+        return None
+
+    key = make_cache_key(provider, model, dimensions, text)
+    with _local_lock:
+        vector = _local_cache.get(key)
+    if vector is not None:
+        _bump('local_hits')
+        return vector
+
+    if redis_client:
+        try:
+            raw = redis_client.get(key)
+            if raw:
+                vector = np.frombuffer(raw, dtype=QUERY_EMBED_CACHE_DTYPE).astype('float32')
+                with _local_lock:
+                    _local_cache[key] = vector
+                _bump('redis_hits')
+                return vector
+        except redis.RedisError as e:
+            logger.warning(f"Redis GET error for query embedding cache: {e}")
+
+    _bump('misses')
+    return None
+
+
+def set_cached_query_embedding(provider: str, model: str, dimensions: str, text: str, vector: np.ndarray):
+    """Stores a freshly computed query embedding in both tiers."""
+    if not QUERY_EMBED_CACHE_ENABLED or vector is None:
+        return
+
+    key = make_cache_key(provider, model, dimensions, text)
+    vector = np.asarray(vector, dtype='float32')
+    with _local_lock:
+        _local_cache[key] = vector
+
+    if redis_client:
+        try:
+            redis_client.setex(key, QUERY_EMBED_CACHE_TTL, vector.astype(QUERY_EMBED_CACHE_DTYPE).tobytes())
+        except redis.RedisError as e:
+            logger.warning(f"Redis SETEX error for query embedding cache: {e}")
+
+
+def make_chunk_cache_key(provider: str, model: str, dimensions: str, text: str) -> str:
+    # Exact text: chunks are embedded verbatim, so no normalisation.
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f"cemb:{provider}:{model}:{dimensions}:{CHUNK_EMBED_CACHE_DTYPE}:{digest}"
+
+
+def get_cached_chunk_embeddings(provider: str, model: str, dimensions: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+    """Bulk lookup of chunk embeddings; returns a float32 array or None per text, in order."""
+    results: List[Optional[np.ndarray]] = [None] * len(texts)
+    if not CHUNK_EMBED_CACHE_ENABLED or not chunk_redis_client or not texts:
+        return results
+
+    keys = [make_chunk_cache_key(provider, model, dimensions, text) for text in texts]
+    for start in range(0, len(keys), CHUNK_EMBED_CACHE_BATCH):
+        try:
+            values = chunk_redis_client.mget(keys[start:start + CHUNK_EMBED_CACHE_BATCH])
+        except redis.RedisError as e:
+            logger.warning(f"Redis MGET error for chunk embedding cache: {e}")
+            return results
+        for offset, raw in enumerate(values):
+            if raw:
+                results[start + offset] = np.frombuffer(raw, dtype=CHUNK_EMBED_CACHE_DTYPE).astype('float32')
+
+    hits = sum(1 for vector in results if vector is not None)
+    with _stats_lock:
+        _stats['chunk_hits'] += hits
+        _stats['chunk_misses'] += len(texts) - hits
+    return results
+
+
+def set_cached_chunk_embeddings(provider: str, model: str, dimensions: str, texts: Sequence[str], vectors: Sequence) -> None:
+    """Stores freshly computed chunk embeddings (None entries are skipped)."""
+    if not CHUNK_EMBED_CACHE_ENABLED or not chunk_redis_client:
+        return
+    items = [(text, vector) for text, vector in zip(texts, vectors) if vector is not None]
+    for start in range(0, len(items), CHUNK_EMBED_CACHE_BATCH):
+        try:
+            pipe = chunk_redis_client.pipeline(transaction=False)
+            for text, vector in items[start:start + CHUNK_EMBED_CACHE_BATCH]:
+                payload = np.asarray(vector, dtype='float32').astype(CHUNK_EMBED_CACHE_DTYPE).tobytes()
+                pipe.setex(make_chunk_cache_key(provider, model, dimensions, text), CHUNK_EMBED_CACHE_TTL, payload)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Redis pipeline error for chunk embedding cache: {e}")
+            return
+
+
+def get_cache_stats() -> dict:
+    """Returns hit/miss counters for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['local_hits'] + stats['redis_hits'] + stats['misses']
+    stats['hit_rate'] = round((stats['local_hits'] + stats['redis_hits']) / lookups, 4) if lookups else 0.0
+    with _local_lock:
+        stats['local_entries'] = len(_local_cache)
+    return stats
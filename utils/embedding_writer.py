@@ -0,0 +1,202 @@
+# In utils/embedding_writer.py
+"""
+Bulk writer for rows of public.embeddings.
+
+Ingest used to insert vectors through PostgREST, 20 rows per request
+(create_and_store_embeddings) or one row per request (multi_source_embed), with
+each vector serialised as a JSON float list. Large PDFs and WhatsApp exports
+spent most of their time on those HTTP round trips.
+
+When SUPABASE_DB_URL (a direct Postgres DSN) is configured, write_embeddings()
+streams the rows with COPY ... FROM STDIN (CSV, vectors in pgvector's text
+form) into a temporary staging table. A single INSERT ... SELECT then moves them
+into public.embeddings, one transaction per EMBED_COPY_BATCH rows. Without a
+DSN, or if COPY fails, the rows go through PostgREST in batches of
+EMBED_INSERT_BATCH with retries, as before.
+
+EmbeddingWriter keeps one connection, and the staging table on it, across many
+writes; IngestPipeline holds one for its whole run. write_embeddings() is a
+one-shot writer.
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import logging
+from typing import Callable, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .supabase_client import get_supabase_admin_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBED_COPY_BATCH = int(os.environ.get('EMBED_COPY_BATCH', 5000))  # rows per COPY transaction
+EMBED_INSERT_BATCH = int(os.environ.get('EMBED_INSERT_BATCH', 20))  # rows per PostgREST insert (fallback)
+EMBED_INSERT_RETRIES = 3
+EMBED_WRITE_FLUSH_ROWS = int(os.environ.get('EMBED_WRITE_FLUSH_ROWS', 500))  # rows callers buffer before a bulk write
+EMBED_WRITE_FLUSH_SECONDS = float(os.environ.get('EMBED_WRITE_FLUSH_SECONDS', 2.0))  # ...or how long they hold a partial buffer
+
+COLUMNS = ('channel_id', 'source_id', 'user_id', 'video_id', 'embedding', 'metadata')
+
+_STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS embeddings_staging (
+    channel_id bigint,
+    source_id bigint,
+    user_id uuid,
+    video_id text,
+    embedding text,
+    metadata jsonb
+) ON COMMIT DELETE ROWS
+"""
+_INSERT_FROM_STAGING = """
+INSERT INTO public.embeddings (channel_id, source_id, user_id, video_id, embedding, metadata)
+SELECT channel_id, source_id, user_id, video_id, embedding::vector, metadata
+FROM embeddings_staging
+"""
+
+
+def vector_literal(embedding) -> str:
+    """pgvector text form, '[0.1,0.2,...]'."""
+    return '[' + ','.join('%.9g' % x for x in np.asarray(embedding, dtype=np.float32).ravel()) + ']'
+
+
+def _to_csv(rows: List[dict]) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow((
+            row.get('channel_id'),
+            row.get('source_id'),
+            row.get('user_id'),
+            row.get('video_id'),
+            vector_literal(row['embedding']),
+            json.dumps(row.get('metadata') or {}),
+        ))
+    buffer.seek(0)
+    return buffer
+
+
+def _copy_rows(rows: List[dict], conn, progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    total_batches = (len(rows) + EMBED_COPY_BATCH - 1) // EMBED_COPY_BATCH
+    written = 0
+    try:
+        with conn.cursor() as cur:
+            for batch_index in range(total_batches):
+                batch = rows[batch_index * EMBED_COPY_BATCH:(batch_index + 1) * EMBED_COPY_BATCH]
+                start_time = time.perf_counter()
+                cur.copy_expert(f"COPY embeddings_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", _to_csv(batch))
+                cur.execute(_INSERT_FROM_STAGING)
+                conn.commit()
+                written += len(batch)
+                print(f"[TIME_LOG] COPY of {len(batch)} embeddings took {time.perf_counter() - start_time:.4f} seconds.")
+                if progress_callback:
+                    progress_callback(batch_index + 1, total_batches)
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        if written < len(rows):
+            del rows[:written]  # let the caller fall back with only what wasn't committed
+    return written
+
+
+def _insert_rows(rows: List[dict], progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    supabase = get_supabase_admin_client()
+    total_batches = (len(rows) + EMBED_INSERT_BATCH - 1) // EMBED_INSERT_BATCH
+    written = 0
+    for batch_index in range(total_batches):
+        batch = [
+            {**row, 'embedding': vector_literal(row['embedding'])}
+            for row in rows[batch_index * EMBED_INSERT_BATCH:(batch_index + 1) * EMBED_INSERT_BATCH]
+        ]
+        for attempt in range(EMBED_INSERT_RETRIES):
+            try:
+                supabase.table('embeddings').insert(batch).execute()
+                written += len(batch)
+                break
+            except Exception as db_err:
+                if attempt < EMBED_INSERT_RETRIES - 1:
+                    wait = 2 * (attempt + 1)
+                    logger.warning(f"DB Insert failed (Attempt {attempt+1}/{EMBED_INSERT_RETRIES}). Retrying in {wait}s... Error: {db_err}")
+                    time.sleep(wait)
+                else:
+                    # Keep going so one bad batch doesn't fail the whole ingest
+                    logger.error(f"Failed to insert batch {batch_index + 1} after all retries. Skipping this batch. Error: {db_err}")
+        if progress_callback:
+            progress_callback(batch_index + 1, total_batches)
+    return written
+
+
+class EmbeddingWriter:
+    """Writes batches of embedding rows over one COPY connection, opened on first use. Not thread-safe."""
+
+    def __init__(self, dsn: Optional[str] = None):
+        self.dsn = dsn if dsn is not None else os.environ.get('SUPABASE_DB_URL')
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            import psycopg2
+
+            self._conn = psycopg2.connect(self.dsn)
+            with self._conn.cursor() as cur:
+                cur.execute(_STAGING_DDL)
+            self._conn.commit()
+        return self._conn
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def write(self, rows: List[dict], progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Writes rows ({'channel_id', 'video_id', 'embedding', 'metadata', 'user_id'?, 'source_id'?})
+        to public.embeddings and returns how many were written.
+        """
+        rows = [row for row in rows if row.get('embedding') is not None]
+        if not rows:
+            return 0
+
+        written = 0
+        if self.dsn:
+            pending = list(rows)
+            try:
+                written = _copy_rows(pending, self._connection(), progress_callback)
+                logger.info(f"[EMBED_WRITER] Copied {written} embeddings.")
+                return written
+            except Exception as e:
+                # _copy_rows leaves only the uncommitted rows in `pending`; the next write reconnects
+                self.close()
+                written = len(rows) - len(pending)
+                logger.warning(f"[EMBED_WRITER] COPY failed after {written} rows ({e}); inserting the remaining {len(pending)} through PostgREST.")
+                rows = pending
+
+        written += _insert_rows(rows, progress_callback)
+        logger.info(f"[EMBED_WRITER] Inserted {written} embeddings.")
+        return written
+
+
+def write_embeddings(rows: List[dict], progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """One-shot EmbeddingWriter.write; returns how many rows were written."""
+    with EmbeddingWriter() as writer:
+        return writer.write(rows, progress_callback)
@@ -0,0 +1,214 @@
+# In utils/flow_registry.py
+"""
+Per-channel cache of visual-flow metadata.
+
+Every bot message used to hit `channel_flows` two to four times: once for the
+"VISUAL FLOW TRIGGERS" prompt block, once or twice (plus a local file read) in
+flow_runner.get_active_flow, and again to resolve a [TRIGGER_FLOW: "..."] marker.
+The registry loads a channel's flows once and keeps:
+
+    active_flow      the runnable active flow ({'flow_id', 'nodes', 'edges', ...}) or None
+    trigger_prompt   the compiled VISUAL FLOW TRIGGERS block ('' when there are no active flows)
+    trigger_intents  [{'name', 'text'}] per active flow, embedded by intent_router
+    by_name / by_id  lookups used to resolve [TRIGGER_FLOW] markers
+
+Entries live in a process-local TTLCache. routes_flow.save_flow / activate_flow
+call invalidate(), which publishes the channel id on a Redis pub/sub channel so
+every worker drops its copy together. Without Redis, FLOW_REGISTRY_TTL bounds
+how long another process can serve a stale entry.
+"""
+
+import os
+import logging
+import threading
+from typing import Optional
+
+import redis
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from .supabase_client import get_supabase_admin_client
+from .local_flow_store import load_flow_local
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FLOW_REGISTRY_TTL = int(os.environ.get('FLOW_REGISTRY_TTL', 300))
+FLOW_REGISTRY_SIZE = int(os.environ.get('FLOW_REGISTRY_SIZE', 4096))
+INVALIDATION_CHANNEL = 'flow_registry:invalidate'
+
+try:
+    redis_client = redis.from_url(os.environ.get('REDIS_URL'))
+except Exception:
+    redis_client = None
+
+_registry = TTLCache(maxsize=FLOW_REGISTRY_SIZE, ttl=FLOW_REGISTRY_TTL)
+_lock = threading.Lock()
+_subscriber_started = False
+# Bumped on every invalidation so a load that raced with it doesn't re-cache stale data.
+_generations = {}
+
+
+def _compile_trigger_prompt(active_rows: list) -> str:
+    if not active_rows:
+        return ""
+    flows_list = []
+    for f in active_rows:
+        instructions = ""
+        if f.get('flow_data') and f['flow_data'].get('ai_instructions'):
+            instructions = f" (TRIGGER WHEN: {f['flow_data']['ai_instructions']})"
+        flows_list.append(f"- Name: \"{f['name']}\" | ID: {f['id']}{instructions}")
+
+    flows_list_str = "\n".join(flows_list)
+    return (
+        "\n\n--- VISUAL FLOW TRIGGERS ---\n"
+        "You have the ability to hand over the conversation to specific visual workflows configured by the user, if the user's intent matches.\n"
+        f"Available Flows:\n{flows_list_str}\n\n"
+        "If the user asks to start one of these flows, or their intent precisely matches the general purpose of one of these flows (e.g., booking, support, survey), or if their message matches the 'TRIGGER WHEN' rules defined above, you MUST STOP answering their prompt directly, and instead trigger the workflow.\n"
+        "To trigger a flow, simply append the exact tag: [TRIGGER_FLOW: \"<FLOW_NAME>\"] at the very end of your response.\n"
+        "IMPORTANT: Use only the exact name exactly as written in the Available Flows list above.\n"
+        "Example: \"I'll redirect you to our booking system now! [TRIGGER_FLOW: \"Booking\"]\"\n"
+    )
+
+
+def _trigger_intents(active_rows: list) -> list:
+    intents = []
+    for f in active_rows:
+        if not f.get('name'):
+            continue
+        instructions = (f.get('flow_data') or {}).get('ai_instructions')
+        intents.append({'name': f['name'], 'text': f"{f['name']}: {instructions}" if instructions else f['name']})
+    return intents
+
+
+def _load(channel_id: int, supabase=None) -> dict:
+    supabase = supabase or get_supabase_admin_client()
+    res = supabase.table('channel_flows').select('id, name, is_active, flow_data').eq('channel_id', channel_id).execute()
+    rows = res.data or []
+
+    # Flow graphs live in data/flows/<channel_id>.json; the DB column only holds legacy data.
+    local_data = load_flow_local(channel_id) if rows else None
+
+    by_id, by_name = {}, {}
+    for row in rows:
+        legacy_data = row.get('flow_data') or {}
+        flow = {'flow_id': row['id'], **legacy_data}
+        by_id[str(row['id'])] = flow
+        if row.get('name'):
+            by_name.setdefault(row['name'].strip().lower(), flow)
+
+    active_rows = [row for row in rows if row.get('is_active')]
+    active_flow = None
+    if active_rows:
+        flow_id = active_rows[0]['id']
+        if local_data:
+            active_flow = {'flow_id': flow_id, **local_data}
+        elif (active_rows[0].get('flow_data') or {}).get('nodes'):
+            active_flow = {'flow_id': flow_id, **active_rows[0]['flow_data']}
+        if active_flow:
+            # Triggering the active flow by name should run the same graph get_active_flow returns.
+            by_id[str(flow_id)] = active_flow
+            name = (active_rows[0].get('name') or '').strip().lower()
+            if name:
+                by_name[name] = active_flow
+
+    return {
+        'active_flow': active_flow,
+        'trigger_prompt': _compile_trigger_prompt(active_rows),
+        'trigger_intents': _trigger_intents(active_rows),
+        'by_name': by_name,
+        'by_id': by_id,
+    }
+
+
+def get_registry(channel_id: int, supabase=None) -> dict:
+    """Returns the cached flow registry for a channel, loading it on a miss."""
+    _ensure_subscriber()
+    with _lock:
+        entry = _registry.get(channel_id)
+        generation = _generations.get(channel_id, 0)
+    if entry is not None:
+        return entry
+    entry = _load(channel_id, supabase)
+    with _lock:
+        if _generations.get(channel_id, 0) == generation:
+            _registry[channel_id] = entry
+    return entry
+
+
+def get_active_flow(channel_id: int, supabase=None) -> Optional[dict]:
+    return get_registry(channel_id, supabase)['active_flow']
+
+
+def get_trigger_prompt(channel_id: int) -> str:
+    return get_registry(channel_id)['trigger_prompt']
+
+
+def get_trigger_intents(channel_id: int) -> list:
+    return get_registry(channel_id)['trigger_intents']
+
+
+def resolve_trigger(channel_id: int, marker: str) -> Optional[dict]:
+    """Maps a [TRIGGER_FLOW: "..."] marker (flow name, case-insensitive, or flow id) to a runnable flow."""
+    if not marker:
+        return None
+    registry = get_registry(channel_id)
+    return registry['by_name'].get(marker.strip().lower()) or registry['by_id'].get(marker.strip())
+
+
+def get_flow_by_id(channel_id: int, flow_id) -> Optional[dict]:
+    return get_registry(channel_id)['by_id'].get(str(flow_id))
+
+
+def _drop(channel_id: int) -> None:
+    with _lock:
+        _registry.pop(channel_id, None)
+        _generations[channel_id] = _generations.get(channel_id, 0) + 1
+
+
+def invalidate(channel_id: int) -> None:
+    """Drops the channel's entry here and, through Redis pub/sub, in every other worker."""
+    _drop(channel_id)
+    if redis_client:
+        try:
+            redis_client.publish(INVALIDATION_CHANNEL, str(channel_id))
+        except redis.RedisError as e:
+            logger.warning(f"[FLOW_REGISTRY] Could not publish invalidation for channel {channel_id}: {e}")
+
+
+def _listen_for_invalidations():
+    while True:
+        pubsub = None
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything published while we were disconnected was missed.
+            with _lock:
+                _registry.clear()
+            for message in pubsub.listen():
+                try:
+                    channel_id = int(message['data'])
+                except (TypeError, ValueError):
+                    continue
+                _drop(channel_id)
+        except Exception as e:
+            logger.warning(f"[FLOW_REGISTRY] Invalidation listener disconnected: {e}. Reconnecting in 5s.")
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+        threading.Event().wait(5)
+
+
+def _ensure_subscriber():
+    global _subscriber_started
+    if _subscriber_started or not redis_client:
+        return
+    with _lock:
+        if _subscriber_started:
+            return
+        _subscriber_started = True
+        threading.Thread(target=_listen_for_invalidations, name='flow-registry-invalidation', daemon=True).start()
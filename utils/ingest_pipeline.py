@@ -0,0 +1,250 @@
+# In utils/ingest_pipeline.py
+"""
+Streaming ingest: documents -> chunks -> embeddings -> public.embeddings.
+
+Channel ingest used to run in phases. The task waited for every transcript,
+then create_and_store_embeddings chunked all of them in memory, embedded
+everything, and only then wrote. IngestPipeline runs the stages concurrently,
+with bounded queues between them:
+
+    put(document)        chunk queue   (INGEST_QUEUE_SIZE documents)
+    chunker thread       embed queue   (INGEST_QUEUE_SIZE batches of EMBED_BATCH_SIZE chunks)
+    EMBED_WORKERS        write queue   (INGEST_QUEUE_SIZE embedded batches)
+    writer thread        embedding_writer.EmbeddingWriter (one connection per pipeline)
+
+Every source type goes through it. A document is a YouTube transcript by
+default. `chunker` swaps in another chunking strategy; multi_source_embed
+provides the ones for WhatsApp, website and PDF sources. Embedding uses
+EMBED_PROVIDER / EMBED_MODEL through embed_utils.embed_batch_with_retry. All
+pipelines in the process share its concurrency cap (EMBED_MAX_CONCURRENCY).
+Embedding threads run in rate_limiter's bulk lane, so ingest gives way to
+live traffic on the same provider key.
+
+The YouTube fetchers call put() as each transcript downloads. Chunking,
+embedding and writing therefore overlap with the remaining downloads, and the
+first videos are stored before the last ones arrive. When a queue is full, the
+stage before it blocks, so memory is bounded by the queue sizes rather than the
+size of the source. The writer flushes once it holds EMBED_WRITE_FLUSH_ROWS
+rows or has held rows for EMBED_WRITE_FLUSH_SECONDS, whichever comes first.
+
+progress_callback, if given, receives a stats dict at most once per
+PROGRESS_INTERVAL seconds. The dict has per-stage counters: documents, chunks,
+cached, embedded, written and failed_batches, plus closed once every
+document is in.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from . import embed_utils
+from . import embedding_cache
+from . import embedding_writer
+from . import rate_limiter
+
+load_dotenv()
+
+EMBED_BATCH_SIZE = 32
+EMBED_WORKERS = int(os.environ.get('EMBED_WORKERS', 8))  # embedding threads per pipeline (see EMBED_MAX_CONCURRENCY)
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 16))  # items buffered between stages
+PROGRESS_INTERVAL = 1.0  # seconds between progress_callback calls
+
+_DONE = object()
+
+
+def describe(stats: dict, unit: str = 'videos') -> str:
+    return (f"{stats['documents']} {unit} chunked, {stats['cached'] + stats['embedded']}/{stats['chunks']} chunks embedded, "
+            f"{stats['written']} stored")
+
+
+class IngestPipeline:
+    def __init__(
+        self,
+        user_id,
+        channel_id,
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        chunker: Optional[Callable[[dict], List[Tuple[str, dict]]]] = None,
+        source_id=None,
+    ):
+        """chunker maps a document to (text to embed, metadata) pairs; metadata must include video_id."""
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.source_id = source_id
+        self.progress_callback = progress_callback
+        self.chunker = chunker
+        self.config = embed_utils.get_embedding_config()
+        self.stats = {'documents': 0, 'chunks': 0, 'cached': 0, 'embedded': 0, 'written': 0, 'failed_batches': 0, 'closed': False}
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+        self._closed = False
+        self._start_time = time.perf_counter()
+
+        self._chunk_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self._embed_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self._write_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self._threads = [threading.Thread(target=self._chunk_stage, name='ingest-chunk', daemon=True)]
+        self._threads += [threading.Thread(target=self._embed_stage, name=f'ingest-embed-{i}', daemon=True) for i in range(EMBED_WORKERS)]
+        self._threads.append(threading.Thread(target=self._write_stage, name='ingest-write', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def put(self, document: dict) -> None:
+        """Queues one document; blocks while the chunker is INGEST_QUEUE_SIZE behind."""
+        if self._closed:
+            raise RuntimeError("IngestPipeline is closed")
+        self._chunk_queue.put(document)
+
+    def close(self) -> dict:
+        """Waits for everything queued to be written and returns the final stats."""
+        if not self._closed:
+            self._closed = True
+            self._update(closed=True)
+            self._chunk_queue.put(_DONE)
+            for thread in self._threads:
+                thread.join()
+            print(f"[TIME_LOG] Ingest pipeline stored {self.stats['written']}/{self.stats['chunks']} chunks from {self.stats['documents']} documents in {time.perf_counter() - self._start_time:.4f} seconds.")
+            self._report(force=True)
+        return dict(self.stats)
+
+    def succeeded(self) -> bool:
+        return self.stats['chunks'] > 0 and not self.stats['failed_batches']
+
+    # --- Progress ---
+
+    def _update(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                if isinstance(value, bool):
+                    self.stats[key] = value
+                else:
+                    self.stats[key] += value
+        self._report()
+
+    def _report(self, force: bool = False):
+        if not self.progress_callback:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_report < PROGRESS_INTERVAL:
+                return
+            self._last_report = now
+            snapshot = dict(self.stats)
+        try:
+            self.progress_callback(snapshot)
+        except Exception as e:
+            logging.warning(f"[INGEST] Progress callback failed: {e}")
+
+    # --- Stages ---
+
+    def _chunk_stage(self):
+        chunker = self.chunker or partial(embed_utils.chunk_transcript, text_splitter=embed_utils.get_text_splitter())
+        try:
+            while True:
+                document = self._chunk_queue.get()
+                if document is _DONE:
+                    return
+                try:
+                    chunks = chunker(document)
+                except Exception as e:
+                    logging.error(f"[INGEST] Could not chunk document {document.get('video_id')}: {e}")
+                    continue
+                logging.info(f"Processing document {self.stats['documents'] + 1}: {(document.get('title') or document.get('video_id') or '')[:50]}... ({len(chunks)} chunks)")
+                self._update(documents=1, chunks=len(chunks))
+                # Batches don't span documents, so a video's last chunks don't wait for the next download
+                for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+                    self._embed_queue.put(chunks[start:start + EMBED_BATCH_SIZE])
+        finally:
+            for _ in range(EMBED_WORKERS):
+                self._embed_queue.put(_DONE)
+
+    def _embed_stage(self):
+        rate_limiter.set_lane(rate_limiter.BULK)
+        try:
+            while True:
+                batch = self._embed_queue.get()
+                if batch is _DONE:
+                    return
+                try:
+                    rows = self._embed(batch)
+                except Exception as exc:
+                    # Log the error and keep going with the other batches
+                    self._update(failed_batches=1)
+                    logging.error(f'A batch failed after all retries and was skipped: {exc}')
+                    continue
+                self._write_queue.put(rows)
+        finally:
+            self._write_queue.put(_DONE)
+
+    def _embed(self, batch):
+        texts = [text for text, _ in batch]
+        config = self.config
+        # Chunks whose exact text was embedded before (reprocess, shared channel) come from the cache
+        embeddings = embedding_cache.get_cached_chunk_embeddings(config['provider'], config['model'], config['dimensions'], texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = embed_utils.embed_batch_with_retry(missing_texts, config)
+            if not fresh or len(fresh) != len(missing) or any(embedding is None for embedding in fresh):
+                raise ValueError(f"expected {len(missing)} embeddings, got {len(fresh or [])}")
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            embedding_cache.set_cached_chunk_embeddings(config['provider'], config['model'], config['dimensions'], missing_texts, fresh)
+        self._update(cached=len(batch) - len(missing), embedded=len(missing))
+        rows = [
+            {
+                'user_id': self.user_id,
+                'channel_id': self.channel_id,
+                'video_id': meta['video_id'],
+                'embedding': embedding,
+                'metadata': meta,
+            }
+            for (_, meta), embedding in zip(batch, embeddings)
+        ]
+        if self.source_id is not None:
+            for row in rows:
+                row['source_id'] = self.source_id
+        return rows
+
+    def _write_stage(self):
+        pending = []
+        deadline = None  # when the oldest pending row must be flushed
+        workers_left = EMBED_WORKERS
+        with embedding_writer.EmbeddingWriter() as writer:
+            while workers_left:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    rows = self._write_queue.get(timeout=timeout)
+                except queue.Empty:
+                    rows = None
+                if rows is _DONE:
+                    workers_left -= 1
+                elif rows:
+                    if not pending:
+                        deadline = time.monotonic() + embedding_writer.EMBED_WRITE_FLUSH_SECONDS
+                    pending.extend(rows)
+                if pending and (len(pending) >= embedding_writer.EMBED_WRITE_FLUSH_ROWS or time.monotonic() >= deadline):
+                    self._flush(writer, pending)
+                    pending, deadline = [], None
+            if pending:
+                self._flush(writer, pending)
+
+    def _flush(self, writer, rows):
+        try:
+            written = writer.write(rows)
+        except Exception as e:
+            logging.error(f"[INGEST] Failed to write {len(rows)} embeddings: {e}", exc_info=True)
+            written = 0
+        self._update(written=written)
@@ -0,0 +1,306 @@
+# In utils/intent_router.py
+"""
+Embedding-based intent routing for get_routed_context.
+
+Questions used to be routed by substring checks ("latest video", "who are
+you", ...), so paraphrases like "what did you upload last?" went through the
+full search + rerank path. route() compares the query embedding (the one
+retrieval uses; create_query_embedding caches it, so search reuses it) with
+one centroid per intent:
+
+    latest_video   the latest video's stored summary (video_summaries)
+    identity       an identity card built from channel_data, worded per bot_type
+    flow:<name>    a pointer to one of the channel's active visual flows
+
+Centroids are the normalised mean of each intent's example phrases, embedded
+in one batch per process (flow centroids once per flow registry entry). An
+intent wins when its cosine similarity reaches its threshold
+(INTENT_ROUTER_THRESHOLD, FLOW_INTENT_THRESHOLD) and beats the runner-up by
+INTENT_ROUTER_MARGIN. Its handler answers without retrieval or reranking,
+except for identity: the card is put in front of the normal search results
+(AUGMENTING_INTENTS), as before routing existed. If a handler returns nothing,
+the question falls through to semantic search. When no query embedding is
+available, the old phrase lists are used instead.
+
+Identity examples are limited to who-are-you questions. "What do you do?" or
+"What is this about?" are knowledge-base questions for business, website and
+WhatsApp bots, so they stay on the search path.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from . import flow_registry
+from . import persona_compiler
+from . import video_summaries
+
+load_dotenv()
+
+INTENT_ROUTER_ENABLED = os.environ.get('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+INTENT_ROUTER_THRESHOLD = float(os.environ.get('INTENT_ROUTER_THRESHOLD', 0.55))  # cosine similarity to a centroid
+INTENT_ROUTER_MARGIN = float(os.environ.get('INTENT_ROUTER_MARGIN', 0.05))
+FLOW_INTENT_THRESHOLD = float(os.environ.get('FLOW_INTENT_THRESHOLD', 0.6))
+CENTROID_RETRY_SECONDS = 60
+
+LATEST_VIDEO = 'latest_video'
+IDENTITY = 'identity'
+FLOW_PREFIX = 'flow:'
+AUGMENTING_INTENTS = {IDENTITY}  # handler output goes in front of the search results instead of replacing them
+
+INTENT_EXAMPLES = {
+    LATEST_VIDEO: [
+        "What's your latest video about?",
+        "Tell me about your newest video",
+        "What was your most recent video?",
+        "What did you upload last?",
+        "What's the new video about?",
+        "Can you summarize your last video?",
+        "What did you talk about in your recent upload?",
+        "Did you post anything new this week?",
+    ],
+    IDENTITY: [
+        "Who are you?",
+        "What is your name?",
+        "What should I call you?",
+        "Introduce yourself",
+        "Tell me about yourself",
+        "Who am I talking to?",
+        "Am I chatting with a bot?",
+    ],
+}
+
+# Used when the query embedding is unavailable.
+KEYWORD_FALLBACK = {
+    LATEST_VIDEO: ['latest video', 'newest video', 'recent video', 'most recent video', 'your last video', 'new video'],
+    IDENTITY: ['who are you', 'what is your name', 'introduce yourself', 'your email'],
+}
+
+
+class Intent(NamedTuple):
+    name: str
+    score: float
+    flow_name: Optional[str] = None
+
+
+_centroids = {}  # (provider, model) -> (intent names, matrix of L2-normalised centroids)
+_centroid_failed_at = {}
+_centroid_lock = threading.Lock()
+# (channel_id, provider, model, flow texts) -> matrix; flows change rarely, the registry TTL bounds staleness
+_flow_centroids = TTLCache(maxsize=1024, ttl=flow_registry.FLOW_REGISTRY_TTL)
+
+
+def _embedding_config():
+    return os.environ.get('EMBED_PROVIDER', 'openai'), os.environ.get('EMBED_MODEL')
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embed_texts(texts: List[str]) -> Optional[np.ndarray]:
+    """Embeds texts in one provider call; returns L2-normalised rows, or None if any failed."""
+    from .qa_utils import EMBEDDING_PROVIDER_MAP, _get_api_key
+
+    provider, model = _embedding_config()
+    embedding_function = EMBEDDING_PROVIDER_MAP.get(provider)
+    if not model or not embedding_function:
+        return None
+    try:
+        if provider == 'ollama':
+            vectors = embedding_function(texts, model, ollama_url=os.environ.get('OLLAMA_URL'))
+        else:
+            api_key = _get_api_key(provider)
+            if not api_key:
+                return None
+            vectors = embedding_function(texts, model, api_key=api_key)
+    except Exception as e:
+        logging.warning(f"[INTENT] Embedding request failed: {e}")
+        return None
+    if not vectors or len(vectors) != len(texts) or any(v is None for v in vectors):
+        return None
+    return _normalize(np.vstack(vectors).astype('float32'))
+
+
+def _static_centroids():
+    key = _embedding_config()
+    entry = _centroids.get(key)
+    if entry is not None:
+        return entry
+    with _centroid_lock:
+        entry = _centroids.get(key)
+        if entry is not None:
+            return entry
+        if time.monotonic() - _centroid_failed_at.get(key, -CENTROID_RETRY_SECONDS) < CENTROID_RETRY_SECONDS:
+            return None
+        names = list(INTENT_EXAMPLES)
+        texts = [text for name in names for text in INTENT_EXAMPLES[name]]
+        start = time.perf_counter()
+        embedded = embed_texts(texts)
+        if embedded is None:
+            _centroid_failed_at[key] = time.monotonic()
+            logging.warning("[INTENT] Could not embed intent examples; using keyword routing for now.")
+            return None
+        rows, offset = [], 0
+        for name in names:
+            count = len(INTENT_EXAMPLES[name])
+            rows.append(embedded[offset:offset + count].mean(axis=0))
+            offset += count
+        entry = (names, _normalize(np.vstack(rows)))
+        _centroids[key] = entry
+        print(f"[TIME_LOG] Intent centroids ({len(texts)} examples) embedded in {time.perf_counter() - start:.4f} seconds.")
+        return entry
+
+
+def _flow_intents(channel_id):
+    intents = flow_registry.get_trigger_intents(channel_id)
+    if not intents:
+        return [], None
+    texts = tuple(i['text'] for i in intents)
+    key = (channel_id,) + _embedding_config() + (texts,)
+    matrix = _flow_centroids.get(key)
+    if matrix is None:
+        matrix = embed_texts(list(texts))
+        if matrix is None:
+            return [], None
+        _flow_centroids[key] = matrix
+    return intents, matrix
+
+
+def keyword_intent(question: str) -> Optional[Intent]:
+    question_lower = question.lower()
+    for name, phrases in KEYWORD_FALLBACK.items():
+        if any(phrase in question_lower for phrase in phrases):
+            return Intent(name, 1.0)
+    return None
+
+
+def classify(query_embedding: np.ndarray, channel_data: Optional[dict]) -> Optional[Intent]:
+    query = _normalize(np.asarray(query_embedding, dtype='float32').reshape(-1))
+    candidates = []  # (score, threshold, Intent)
+
+    static = _static_centroids()
+    if static is not None:
+        names, matrix = static
+        if matrix.shape[1] == query.shape[0]:
+            for name, score in zip(names, matrix @ query):
+                candidates.append((float(score), INTENT_ROUTER_THRESHOLD, Intent(name, float(score))))
+
+    if channel_data and channel_data.get('id'):
+        try:
+            intents, matrix = _flow_intents(channel_data['id'])
+        except Exception as e:
+            logging.warning(f"[INTENT] Could not load flow intents for channel {channel_data['id']}: {e}")
+            intents, matrix = [], None
+        if matrix is not None and matrix.shape[1] == query.shape[0]:
+            for intent, score in zip(intents, matrix @ query):
+                candidates.append((float(score), FLOW_INTENT_THRESHOLD, Intent(FLOW_PREFIX + intent['name'], float(score), intent['name'])))
+
+    if not candidates:
+        return None
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    score, threshold, best = candidates[0]
+    runner_up = candidates[1][0] if len(candidates) > 1 else -1.0
+    if score < threshold or score - runner_up < INTENT_ROUTER_MARGIN:
+        return None
+    return best
+
+
+def route(question: str, channel_data: Optional[dict]) -> Optional[Intent]:
+    """The intent for a question, or None for the semantic search path."""
+    if not INTENT_ROUTER_ENABLED:
+        return keyword_intent(question)
+    from .qa_utils import create_query_embedding
+
+    start = time.perf_counter()
+    query_embedding = create_query_embedding(question)
+    if query_embedding is None:
+        return keyword_intent(question)
+    intent = classify(query_embedding, channel_data)
+    if intent:
+        print(f"[INTENT] Routed to '{intent.name}' (similarity {intent.score:.3f}) in {time.perf_counter() - start:.4f}s")
+    return intent
+
+
+# --- Handlers: each returns context chunks, or None to fall back to semantic search ---
+
+def latest_video_context(channel_data: Optional[dict]) -> Optional[List[dict]]:
+    if not channel_data or not channel_data.get('videos'):
+        return None
+    latest_video = video_summaries.latest_video(channel_data['videos'])
+    title = latest_video.get('title', 'My Latest Video')
+    video_id = latest_video.get('video_id')
+    summary = latest_video.get('summary')
+
+    if summary:
+        chunk_text = f"My latest video is titled '{title}'. Here is a quick summary of what it is about: {summary}"
+    else:
+        # Ingested before summaries were stored: use the opening of the transcript and backfill for next time
+        video_summaries.queue_backfill(channel_data.get('id'))
+        opening = video_summaries.fetch_opening_text(video_id)
+        if opening:
+            chunk_text = f"My latest video is titled '{title}'. This is how it starts: {opening}"
+        else:
+            # Fallback to the stored description only if no transcript chunks are found
+            description = latest_video.get('description') or "I can't seem to find the details for this video right now, but I hope you check it out!"
+            chunk_text = f"My latest video is titled '{title}'. Here is a quick summary of what it is about: {description}"
+
+    print(f"Crafted {'stored-summary' if summary else 'transcript-opening'} context for main LLM: {chunk_text[:100]}...")
+    return [{
+        'chunk_text': chunk_text,
+        'video_title': title,
+        'video_url': latest_video.get('url'),
+        'video_id': video_id,
+        'upload_date': latest_video.get('upload_date'),
+    }]
+
+
+def identity_context(channel_data: Optional[dict]) -> Optional[List[dict]]:
+    if not channel_data:
+        return None
+    creator_name = channel_data.get('channel_name', 'the creator')
+    if persona_compiler.bot_type_for(channel_data) == 'youtuber':
+        summary = channel_data.get('summary') or 'a content creator who makes videos on YouTube.'
+        chunk_text = f"My name is {creator_name}. I run this channel where {summary}"
+    else:
+        # Business / general assistants speak for an organisation or knowledge base, not a channel
+        chunk_text = f"I am the assistant for {creator_name}."
+        if channel_data.get('summary'):
+            chunk_text += f" About {creator_name}: {channel_data['summary']}"
+    topics = channel_data.get('topics')
+    if topics:
+        chunk_text += f"\nTopics I cover: {', '.join(topics) if isinstance(topics, list) else topics}"
+    return [{
+        'video_title': 'Introduction',
+        'chunk_text': chunk_text,
+        'video_url': channel_data.get('channel_url', '#'),
+        'video_id': 'intro_chunk',
+    }]
+
+
+def flow_context(channel_data: Optional[dict], flow_name: str) -> Optional[List[dict]]:
+    if not channel_data or not flow_name:
+        return None
+    return [{
+        'video_title': flow_name,
+        'chunk_text': f"This message matches the \"{flow_name}\" workflow. Hand the conversation over to it as described in VISUAL FLOW TRIGGERS.",
+        'video_id': 'flow_intent',
+    }]
+
+
+def handle(intent: Intent, channel_data: Optional[dict]) -> Optional[List[dict]]:
+    if intent.name == LATEST_VIDEO:
+        return latest_video_context(channel_data)
+    if intent.name == IDENTITY:
+        return identity_context(channel_data)
+    if intent.flow_name:
+        return flow_context(channel_data, intent.flow_name)
+    return None
@@ -0,0 +1,316 @@
+# In utils/llm_hedging.py
+"""
+Hedged LLM streams: fail over to a second provider when the first is slow to start.
+
+With LLM_HEDGE_PROVIDER set, hedged_stream() starts the primary provider's
+stream and, if no token has arrived by the hedge deadline (or the primary fails
+before its first token), fires the same prompt at LLM_HEDGE_PROVIDER /
+LLM_HEDGE_MODEL. Whichever stream yields a real token first wins; the other is
+aborted. LLM_HEDGE_MODEL is required when LLM_HEDGE_PROVIDER differs from the
+primary provider, since model names don't carry across providers.
+
+A losing stream is usually blocked in a socket read on its pump thread, so
+setting a flag isn't enough to stop it. Provider stream functions register their
+HTTP response with tracked(), and the abort shuts that socket down, which
+ends the blocked read right away. A stream that hasn't received response headers
+yet has nothing registered and still waits for its own request timeout.
+
+The deadline is the LLM_HEDGE_PERCENTILE of each provider's recent
+time-to-first-token, clamped to [LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY].
+Until LLM_HEDGE_MIN_SAMPLES observations exist, LLM_HEDGE_DEFAULT_DELAY is used.
+First-token latency is tracked for every stream, hedged or not.
+"""
+
+import os
+import time
+import queue
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_HEDGE_PROVIDER = os.environ.get('LLM_HEDGE_PROVIDER', '').lower()
+LLM_HEDGE_MODEL = os.environ.get('LLM_HEDGE_MODEL', '')
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', 1.5))  # seconds
+LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 0.3))
+LLM_HEDGE_MAX_DELAY = float(os.environ.get('LLM_HEDGE_MAX_DELAY', 5.0))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_HEDGE_WINDOW = int(os.environ.get('LLM_HEDGE_WINDOW', 200))
+
+_latencies = {}
+_latency_lock = threading.Lock()
+_END = object()
+_local = threading.local()
+_warned_missing_hedge_model = False
+
+
+def record_first_token(provider: str, seconds: float) -> None:
+    with _latency_lock:
+        window = _latencies.get(provider)
+        if window is None:
+            window = _latencies[provider] = deque(maxlen=LLM_HEDGE_WINDOW)
+        window.append(seconds)
+
+
+def first_token_percentile(provider: str, percentile: float = LLM_HEDGE_PERCENTILE) -> Optional[float]:
+    """Rolling first-token latency percentile for a provider, or None while there are too few samples."""
+    with _latency_lock:
+        samples = sorted(_latencies.get(provider) or ())
+    if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def hedge_deadline(provider: str) -> float:
+    observed = first_token_percentile(provider)
+    if observed is None:
+        return LLM_HEDGE_DEFAULT_DELAY
+    return min(LLM_HEDGE_MAX_DELAY, max(LLM_HEDGE_MIN_DELAY, observed))
+
+
+def hedge_target(provider: str, model: str) -> Optional[Tuple[str, str]]:
+    """(provider, model) to hedge with, or None when hedging is off or would hit the same target."""
+    global _warned_missing_hedge_model
+    if not LLM_HEDGE_PROVIDER:
+        return None
+    if not LLM_HEDGE_MODEL and LLM_HEDGE_PROVIDER != provider:
+        if not _warned_missing_hedge_model:
+            _warned_missing_hedge_model = True
+            logging.warning(f"[LLM_HEDGE] LLM_HEDGE_PROVIDER={LLM_HEDGE_PROVIDER} differs from {provider} but LLM_HEDGE_MODEL is not set; hedging disabled.")
+        return None
+    hedge_model = LLM_HEDGE_MODEL or model
+    if (LLM_HEDGE_PROVIDER, hedge_model) == (provider, model):
+        return None
+    return LLM_HEDGE_PROVIDER, hedge_model
+
+
+def hedge_stream_kwargs(provider: str, stream_kwargs: dict) -> dict:
+    from .qa_utils import _get_api_key
+    return {**stream_kwargs, 'api_key': _get_api_key(provider)}
+
+
+def is_failure_chunk(chunk) -> bool:
+    # The provider stream functions report failures as an "Error: ..." chunk instead of raising.
+    return not chunk or (isinstance(chunk, str) and chunk.startswith('Error:'))
+
+
+def _response_socket(response) -> Optional[socket.socket]:
+    # requests.Response -> urllib3 connection
+    connection = getattr(getattr(response, 'raw', None), '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        return sock
+    # openai.Stream wraps an httpx.Response; httpcore exposes its network stream
+    http_response = getattr(response, 'response', response)
+    network_stream = (getattr(http_response, 'extensions', None) or {}).get('network_stream')
+    if network_stream is not None:
+        return network_stream.get_extra_info('socket')
+    return None
+
+
+def _abort_response(response) -> None:
+    # A finished response's connection may already be back in the pool, serving someone else.
+    if getattr(getattr(response, 'response', response), 'is_closed', False):
+        return
+    # close() alone doesn't wake a thread blocked in recv(); shutdown() does.
+    sock = _response_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+class AbortHandle:
+    """Cancels a provider stream running on another thread, including a read blocked before its first token."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._responses = []
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def track(self, response) -> None:
+        with self._lock:
+            self._responses.append(response)
+            already_aborted = self._event.is_set()
+        if already_aborted:
+            _abort_response(response)
+
+    def untrack(self, response) -> None:
+        with self._lock:
+            if response in self._responses:
+                self._responses.remove(response)
+
+    def abort(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            responses = list(self._responses)
+        for response in responses:
+            _abort_response(response)
+
+
+@contextmanager
+def abortable(handle: AbortHandle):
+    """Binds `handle` to the current thread, so responses the stream wraps in tracked() register with it."""
+    _local.handle = handle
+    try:
+        yield handle
+    finally:
+        _local.handle = None
+
+
+@contextmanager
+def tracked(response):
+    """
+    Lets a hedge abort this streaming HTTP response while the block runs. Wrap only the
+    reads, so a response whose connection went back to the pool is never shut down.
+    A no-op outside abortable().
+    """
+    handle = getattr(_local, 'handle', None)
+    if handle is None:
+        yield response
+        return
+    handle.track(response)
+    try:
+        yield response
+    finally:
+        handle.untrack(response)
+
+
+def stream_aborted() -> bool:
+    """True on a pump thread whose stream lost the race; provider errors after that are expected."""
+    handle = getattr(_local, 'handle', None)
+    return handle is not None and handle.is_set()
+
+
+def _pump(tag: str, stream_function, args: tuple, kwargs: dict, out: queue.Queue, handle: AbortHandle) -> None:
+    stream = None
+    with abortable(handle):
+        try:
+            stream = stream_function(*args, **kwargs)
+            for chunk in stream:
+                if handle.is_set():
+                    break
+                out.put((tag, chunk))
+        except Exception as e:
+            out.put((tag, e))
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            out.put((tag, _END))
+
+
+def hedged_stream(provider: str, prompt: str, model: str, stream_kwargs: dict) -> Iterator[str]:
+    """Drop-in replacement for LLM_STREAM_PROVIDER_MAP[provider](prompt, model, **stream_kwargs)."""
+    from .qa_utils import LLM_STREAM_PROVIDER_MAP
+
+    target = hedge_target(provider, model)
+    if target and target[0] not in LLM_STREAM_PROVIDER_MAP:
+        logging.warning(f"[LLM_HEDGE] Hedge provider '{target[0]}' has no stream function; hedging disabled.")
+        target = None
+
+    if not target:
+        start = time.perf_counter()
+        first = True
+        for chunk in LLM_STREAM_PROVIDER_MAP[provider](prompt, model, **stream_kwargs):
+            if first and not is_failure_chunk(chunk):
+                record_first_token(provider, time.perf_counter() - start)
+                first = False
+            yield chunk
+        return
+
+    out = queue.Queue()
+    streams = {}  # tag -> (provider, started_at, AbortHandle)
+
+    def launch(tag, launch_provider, launch_model, launch_kwargs):
+        handle = AbortHandle()
+        streams[tag] = (launch_provider, time.perf_counter(), handle)
+        threading.Thread(
+            target=_pump,
+            args=(tag, LLM_STREAM_PROVIDER_MAP[launch_provider], (prompt, launch_model), launch_kwargs, out, handle),
+            name=f'llm-hedge-{tag}',
+            daemon=True,
+        ).start()
+
+    deadline = hedge_deadline(provider)
+    launch('primary', provider, model, stream_kwargs)
+    failed = {}
+    winner = None
+    first_chunk = None
+
+    try:
+        while winner is None and len(failed) < len(streams):
+            timeout = None
+            if 'hedge' not in streams:
+                timeout = max(0.0, streams['primary'][1] + deadline - time.perf_counter())
+            try:
+                tag, item = out.get(timeout=timeout)
+            except queue.Empty:
+                print(f"[LLM_HEDGE] No first token from {provider} after {deadline:.2f}s; hedging with {target[0]}/{target[1]}.")
+                launch('hedge', target[0], target[1], hedge_stream_kwargs(target[0], stream_kwargs))
+                continue
+
+            if tag in failed:
+                continue
+            if item is _END or isinstance(item, Exception) or is_failure_chunk(item):
+                failed[tag] = item
+                if tag == 'primary' and 'hedge' not in streams:
+                    print(f"[LLM_HEDGE] {provider} failed before its first token; failing over to {target[0]}/{target[1]}.")
+                    launch('hedge', target[0], target[1], hedge_stream_kwargs(target[0], stream_kwargs))
+                continue
+            winner, first_chunk = tag, item
+
+        if winner is None:
+            # Both failed: surface the primary's error the way an unhedged stream would.
+            error = failed.get('primary')
+            if isinstance(error, Exception):
+                raise error
+            if isinstance(error, str) and error:
+                yield error
+            return
+
+        now = time.perf_counter()
+        for tag, (tag_provider, started_at, handle) in streams.items():
+            if tag == winner:
+                record_first_token(tag_provider, now - started_at)
+            else:
+                handle.abort()
+                if tag not in failed:
+                    # The loser was still waiting; its latency is at least this long.
+                    record_first_token(tag_provider, now - started_at)
+        if 'hedge' in streams:
+            print(f"[LLM_HEDGE] {winner} stream ({streams[winner][0]}) won the race.")
+
+        yield first_chunk
+        while True:
+            tag, item = out.get()
+            if tag != winner:
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for _, _, handle in streams.values():
+            handle.abort()
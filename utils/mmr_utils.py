@@ -0,0 +1,131 @@
+# In utils/mmr_utils.py
+"""
+Maximal marginal relevance (MMR) selection of the final context chunks.
+
+search_and_rerank_chunks used to diversify by allowing at most two chunks per
+video_id. That does nothing about near-duplicates across videos or sources,
+such as the same FAQ answer on a website page and in a WhatsApp export. With
+MMR_ENABLED, the top MMR_CANDIDATES reranked chunks are instead picked greedily by
+
+    lambda * relevance - (1 - lambda) * max cosine similarity to the chunks already picked
+
+with lambda = MMR_LAMBDA. Relevance is the cross-encoder score (or the vector
+similarity when reranking is off), min-max scaled to [0, 1]. The pairwise
+similarities come from a single matrix product over the candidates' stored
+embeddings. Embeddings are fetched by chunk id and kept in a process-local LRU
+cache (float16), since a chunk's embedding never changes. If any candidate has
+no embedding, diversify() returns None and the caller keeps the per-video cap.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from cachetools import LRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MMR_ENABLED = os.environ.get('MMR_ENABLED', 'false').lower() == 'true'
+MMR_LAMBDA = float(os.environ.get('MMR_LAMBDA', 0.7))  # 1.0 = pure relevance, 0.0 = pure diversity
+MMR_CANDIDATES = int(os.environ.get('MMR_CANDIDATES', 20))
+MMR_EMBED_CACHE_SIZE = int(os.environ.get('MMR_EMBED_CACHE_SIZE', 5000))  # chunks; ~3 KB each at 1536 dims
+
+_embedding_cache = LRUCache(maxsize=MMR_EMBED_CACHE_SIZE)
+_cache_lock = threading.Lock()
+
+
+def _parse_vector(value) -> Optional[np.ndarray]:
+    # PostgREST returns pgvector columns as their text form, "[0.1,0.2,...]".
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def fetch_chunk_embeddings(supabase, chunk_ids: List[int]) -> Dict[int, np.ndarray]:
+    found = {}
+    with _cache_lock:
+        for chunk_id in chunk_ids:
+            vector = _embedding_cache.get(chunk_id)
+            if vector is not None:
+                found[chunk_id] = vector
+    missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+    if missing:
+        response = supabase.table('embeddings').select('id, embedding').in_('id', missing).execute()
+        fetched = {}
+        for row in getattr(response, 'data', None) or []:
+            vector = _parse_vector(row.get('embedding'))
+            if vector is not None:
+                fetched[row['id']] = vector.astype(np.float16)
+        with _cache_lock:
+            for chunk_id, vector in fetched.items():
+                _embedding_cache[chunk_id] = vector
+        found.update(fetched)
+    return found
+
+
+def _scale(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min()
+    if spread <= 0:
+        return np.ones_like(values)
+    return (values - values.min()) / spread
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int, lambda_: float = MMR_LAMBDA) -> List[int]:
+    """Indices of k rows chosen by MMR. relevance is (n,), embeddings is (n, d)."""
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    vectors = embeddings.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    similarity = vectors @ vectors.T
+
+    relevance_term = lambda_ * relevance
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for _ in range(k):
+        scores = np.where(available, relevance_term - (1 - lambda_) * max_similarity, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def diversify(supabase, chunks: List[dict], top_k: int, lambda_: float = MMR_LAMBDA) -> Optional[List[dict]]:
+    """
+    Picks top_k of the best MMR_CANDIDATES chunks (already ordered by relevance) by MMR.
+    Returns None when embeddings can't be resolved for every candidate.
+    """
+    candidates = chunks[:MMR_CANDIDATES]
+    if len(candidates) <= 1:
+        return candidates[:top_k]
+    chunk_ids = [chunk.get('id') for chunk in candidates]
+    if any(chunk_id is None for chunk_id in chunk_ids):
+        return None
+
+    start_time = time.perf_counter()
+    try:
+        vectors = fetch_chunk_embeddings(supabase, chunk_ids)
+    except Exception as e:
+        logging.warning(f"[MMR] Could not fetch candidate embeddings: {e}")
+        return None
+    if len(vectors) < len(set(chunk_ids)):
+        return None
+
+    score_key = 'relevance_score' if all('relevance_score' in c for c in candidates) else 'similarity_score'
+    relevance = _scale(np.array([float(c.get(score_key) or 0.0) for c in candidates], dtype=np.float32))
+    matrix = np.vstack([vectors[chunk_id] for chunk_id in chunk_ids])
+    picked = mmr_select(relevance, matrix, top_k, lambda_)
+    print(f"[TIME_LOG] MMR selection of {len(picked)} from {len(candidates)} candidates (lambda={lambda_}) took {time.perf_counter() - start_time:.4f} seconds.")
+    return [candidates[i] for i in picked]
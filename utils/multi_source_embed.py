@@ -1,158 +1,87 @@
 """
-Simplified embedding creation for multi-source data
-Processes in small batches to avoid database timeouts
-Uses Gemini embeddings to match existing configuration
+Chunking strategies for multi-source data (WhatsApp, website, PDF)
+Embedding, rate limiting and bulk writes are shared with YouTube ingest
+through utils/ingest_pipeline.IngestPipeline
 """
 
 import logging
-import os
-import google.generativeai as genai
-from utils.supabase_client import get_supabase_admin_client
+from functools import lru_cache
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from utils.ingest_pipeline import IngestPipeline
 
 logger = logging.getLogger(__name__)
 
-def create_embeddings_batch(texts, channel_id, source_id, user_id, metadata_list, batch_size=10):
-    """
-    Create embeddings in small batches using Gemini.
-    Uses the same embedding configuration as the main app.
-    
-    Args:
-        texts: List of text chunks to embed
-        channel_id: Channel/chatbot ID
-        source_id: Data source ID
-        user_id: User/creator ID
-        metadata_list: List of metadata dicts for each text
-        batch_size: Number of embeddings to process at once
-    """
-    supabase = get_supabase_admin_client()
-    
-    # Get Gemini configuration
-    api_key = os.getenv('GEMINI_API_KEY')
-    if not api_key:
-        logger.error("GEMINI_API_KEY not found in environment")
-        return
-    
-    genai.configure(api_key=api_key)
-    model = os.environ.get('EMBED_MODEL', 'models/text-embedding-004')
-    if not model.startswith('models/'):
-        model = f"models/{model}"
-    
-    output_dimensions = int(os.environ.get('GEMINI_EMBED_DIMENSIONS', '1536'))
-    
-    total = len(texts)
-    logger.info(f"Creating {total} embeddings in batches of {batch_size} using Gemini ({output_dimensions} dimensions)")
-    
-    for i in range(0, total, batch_size):
-        batch_texts = texts[i:i+batch_size]
-        batch_metadata = metadata_list[i:i+batch_size]
-        
-        # Generate embeddings using Gemini with retry logic for rate limits
-        max_retries = 5
-        base_delay = 5  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                result = genai.embed_content(
-                    model=model, 
-                    content=batch_texts, 
-                    task_type="retrieval_document",
-                    output_dimensionality=output_dimensions
-                )
-                
-                # Extract embeddings from result
-                embeddings = []
-                if isinstance(result, dict) and 'embedding' in result:
-                    emb_data = result['embedding']
-                    # Single text case
-                    if isinstance(emb_data, (list, tuple)) and all(isinstance(x, (float, int)) for x in emb_data):
-                        if len(batch_texts) == 1:
-                            embeddings = [emb_data]
-                    # Multiple texts case
-                    elif isinstance(emb_data, list) and len(emb_data) > 0:
-                        embeddings = emb_data
-                
-                if len(embeddings) != len(batch_texts):
-                    logger.error(f"Embedding count mismatch: got {len(embeddings)}, expected {len(batch_texts)}")
-                    break # Break retry loop, this is a logic/formatting error
-                
-                break # Success! Break out of the retry loop
-                    
-            except Exception as e:
-                error_msg = str(e).lower()
-                is_rate_limit = "429" in error_msg or "quota" in error_msg or "rate limit" in error_msg
-                
-                if is_rate_limit and attempt < max_retries - 1:
-                    sleep_time = base_delay * (2 ** attempt) # Exponential backoff: 5s, 10s, 20s, 40s
-                    logger.warning(f"Rate limit hit for batch {i}. Retrying in {sleep_time} seconds (Attempt {attempt+1}/{max_retries})...")
-                    import time
-                    time.sleep(sleep_time)
-                else:
-                    logger.error(f"Failed to generate embeddings for batch {i} after {attempt + 1} attempts: {e}")
-                    embeddings = [] # Ensure embeddings is empty so we don't insert garbage
-                    break
-        
-        if not embeddings:
-            continue # Skip inserting if we never successfully got embeddings
-        
-        # Insert each embedding
-        for j, (text, embedding, metadata) in enumerate(zip(batch_texts, embeddings, batch_metadata)):
-            try:
-                supabase.table('embeddings').insert({
-                    'channel_id': channel_id,
-                    'source_id': source_id,
-                    'user_id': user_id,
-                    'video_id': metadata.get('video_id', f'chunk_{i+j}'),
-                    'embedding': embedding,
-                    'metadata': {
-                        **metadata,
-                        'chunk_text': text  # FIXED: Store full chunk (already sized by splitter)
-                    }
-                }).execute()
-                logger.info(f"Successfully inserted embedding {i+j}")
-            except Exception as e:
-                logger.error(f"Failed to insert embedding {i+j}: {e}")
-                # Continue with next embedding instead of failing completely
-        
-        logger.info(f"Processed {min(i+batch_size, total)}/{total} embeddings")
+# Per source type: chunk size/overlap (characters) and the boundaries tried first.
+# WhatsApp splits between messages (one per line), websites and PDFs between paragraphs, then sentences.
+CHUNK_STRATEGIES = {
+    'whatsapp': {'chunk_size': 500, 'chunk_overlap': 50, 'separators': ["\n", " ", ""]},
+    'website': {'chunk_size': 500, 'chunk_overlap': 50, 'separators': ["\n\n", "\n", ". ", " ", ""]},
+    'pdf': {'chunk_size': 500, 'chunk_overlap': 50, 'separators': ["\n\n", "\n", ". ", " ", ""]},
+}
+DEFAULT_STRATEGY = {'chunk_size': 500, 'chunk_overlap': 50}
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(source_type):
+    return RecursiveCharacterTextSplitter(
+        length_function=len,
+        **CHUNK_STRATEGIES.get(source_type, DEFAULT_STRATEGY)
+    )
+
+
+def source_document(text, video_id, source_type, additional_metadata=None):
+    """A unit of source content (chat block, web page, PDF page group) for IngestPipeline.put()."""
+    return {
+        'text': text,
+        'video_id': video_id,
+        'source_type': source_type,
+        'title': (additional_metadata or {}).get('title'),
+        'metadata': additional_metadata or {},
+    }
+
+
+def chunk_source_document(document):
+    """Chunker for IngestPipeline: (chunk text, metadata) pairs for one source document."""
+    chunks = get_text_splitter(document['source_type']).split_text(document['text'])
+    return [
+        (chunk, {
+            'source_type': document['source_type'],
+            'video_id': document['video_id'],
+            'chunk_index': idx,
+            'total_chunks': len(chunks),
+            **document['metadata'],
+            'chunk_text': chunk  # FIXED: Store full chunk (already sized by splitter)
+        })
+        for idx, chunk in enumerate(chunks)
+    ]
+
+
+def source_pipeline(channel_id, source_id, user_id, progress_callback=None):
+    """An IngestPipeline that chunks source documents and tags rows with source_id."""
+    return IngestPipeline(
+        user_id,
+        channel_id,
+        progress_callback=progress_callback,
+        chunker=chunk_source_document,
+        source_id=source_id,
+    )
 
 
 def chunk_and_embed_text(text, video_id, channel_id, source_id, user_id, source_type, additional_metadata=None):
     """
     Split text into chunks and create embeddings.
-    
+    Tasks with many documents should put them all into one source_pipeline() instead.
+
     Args:
         text: Text to chunk and embed
         video_id: Unique ID for this content
         channel_id: Channel/chatbot ID
         source_id: Data source ID
         user_id: User/creator ID
-        source_type: Type of source (whatsapp, website, youtube)
+        source_type: Type of source (whatsapp, website, pdf)
         additional_metadata: Extra metadata to include
     """
-    # Split text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-        length_function=len
-    )
-    
-    chunks = text_splitter.split_text(text)
-    logger.info(f"Split text into {len(chunks)} chunks")
-    
-    # Prepare metadata for each chunk
-    metadata_list = []
-    for idx, chunk in enumerate(chunks):
-        metadata = {
-            'source_type': source_type,
-            'video_id': video_id,
-            'chunk_index': idx,
-            'total_chunks': len(chunks),
-            **(additional_metadata or {})
-        }
-        metadata_list.append(metadata)
-    
-    # Create embeddings in batches
-    create_embeddings_batch(chunks, channel_id, source_id, user_id, metadata_list, batch_size=5)
-    
-    return len(chunks)
+    with source_pipeline(channel_id, source_id, user_id) as pipeline:
+        pipeline.put(source_document(text, video_id, source_type, additional_metadata))
+    logger.info(f"Split text into {pipeline.stats['chunks']} chunks")
+    return pipeline.stats['chunks']
@@ -9,11 +9,26 @@ from utils.whatsapp_parser import WhatsAppParser
 from utils.website_scraper import WebsiteScraper
 from utils.supabase_client import get_supabase_admin_client
 from utils.qa_utils import extract_speaking_style
+from utils import answer_cache
+from utils import persona_compiler
 import time
 
 logger = logging.getLogger(__name__)
 
 
+def _source_progress(supabase, source_id, low, high):
+    """IngestPipeline progress callback: maps stored/total chunks onto data_sources.progress in [low, high]."""
+    reported = {'pct': low}
+    def report(stats):
+        if not stats['chunks']:
+            return
+        pct = max(reported['pct'], low + int((high - low) * stats['written'] / stats['chunks']))
+        if pct != reported['pct']:
+            reported['pct'] = pct
+            supabase.table('data_sources').update({'progress': pct}).eq('id', source_id).execute()
+    return report
+
+
 def process_whatsapp_source(source_id: int, file_path: str, task_id: str = None, preferred_agent: str = None):
     """
     Process a WhatsApp chat export file as a data source.
@@ -70,57 +85,29 @@ def process_whatsapp_source(source_id: int, file_path: str, task_id: str = None,
         speaking_style_text = " ".join([msg['text'] for msg in primary_messages[:50]])  # First 50 messages
         speaking_style = extract_speaking_style(speaking_style_text, source_type='whatsapp') if speaking_style_text else None
         
-        # Create embeddings for each chunk
-        transcripts_format = []
-        for i, chunk in enumerate(chunks):
-            formatted_text = parser.format_chunk_for_embedding(chunk)
-            
-            transcripts_format.append({
-                'video_id': f"whatsapp_chunk_{i}",  # Using video_id field for compatibility
-                'title': f"WhatsApp Chat - {chunk['date_range']}",
-                'transcript': formatted_text,
-                'url': f"whatsapp://chunk/{i}",
-                'upload_date': chunk['messages'][0]['timestamp'],
-                'uploader': primary_user or 'WhatsApp User'
-            })
-            
-            # Update progress incrementally
-            progress = 50 + int((i / len(chunks)) * 40)
-            supabase.table('data_sources').update({'progress': progress}).eq('id', source_id).execute()
-        
-        # Store embeddings
-        logger.info(f"Creating embeddings for {len(transcripts_format)} chunks")
-        
         # Get chatbot owner (use creator_id, not user_id)
         chatbot_resp = supabase.table('channels').select('creator_id').eq('id', chatbot_id).maybe_single().execute()
         if not chatbot_resp or not chatbot_resp.data:
             raise ValueError(f"Chatbot {chatbot_id} not found - may have been deleted")
         user_id = chatbot_resp.data['creator_id']
         
-        # Create embeddings using batch-friendly approach
-        logger.info(f"Creating embeddings for {len(transcripts_format)} WhatsApp chunks")
-        from utils.multi_source_embed import chunk_and_embed_text
-        
-        total_embedded = 0
-        for transcript in transcripts_format:
-            chunks_created = chunk_and_embed_text(
-                text=transcript['transcript'],
-                video_id=transcript['video_id'],
-                channel_id=chatbot_id,
-                source_id=source_id,
-                user_id=user_id,
-                source_type='whatsapp',
-                additional_metadata={
-                    'title': transcript['title'],
-                    'primary_user': primary_user,
-                    'date': transcript['upload_date']
-                }
-            )
-            total_embedded += chunks_created
-            
-            # Update progress
-            progress = 50 + int((total_embedded / len(transcripts_format)) * 40)
-            supabase.table('data_sources').update({'progress': min(progress, 90)}).eq('id', source_id).execute()
+        # Create embeddings through the shared ingest pipeline, one document per conversation block
+        logger.info(f"Creating embeddings for {len(chunks)} WhatsApp chunks")
+        from utils.multi_source_embed import source_pipeline, source_document
+        
+        with source_pipeline(chatbot_id, source_id, user_id, progress_callback=_source_progress(supabase, source_id, 50, 90)) as pipeline:
+            for i, chunk in enumerate(chunks):
+                pipeline.put(source_document(
+                    text=parser.format_chunk_for_embedding(chunk),
+                    video_id=f"whatsapp_chunk_{i}",  # Using video_id field for compatibility
+                    source_type='whatsapp',
+                    additional_metadata={
+                        'title': f"WhatsApp Chat - {chunk['date_range']}",
+                        'primary_user': primary_user,
+                        'date': chunk['messages'][0]['timestamp']
+                    }
+                ))
+        total_embedded = pipeline.stats['written']
         
         logger.info(f"Created {total_embedded} embeddings for WhatsApp source")
         
@@ -233,35 +220,27 @@ def process_website_source(source_id: int, task_id: str = None):
             raise ValueError(f"Chatbot {chatbot_id} not found - may have been deleted")
         user_id = chatbot_resp.data['creator_id']
         
-        # Create embeddings using batch-friendly approach
+        # Create embeddings through the shared ingest pipeline, one document per page
         logger.info(f"Creating embeddings for {len(pages)} website pages")
-        from utils.multi_source_embed import chunk_and_embed_text
-        
-        total_chunks = 0
-        for page_idx, page in enumerate(pages):
-            if page.get('error'):
-                logger.warning(f"Skipping failed page: {page['url']}")
-                continue
-            
-            # Create embeddings for this page
-            chunks_created = chunk_and_embed_text(
-                text=page['text'],
-                video_id=f"website_page_{page_idx}",
-                channel_id=chatbot_id,
-                source_id=source_id,
-                user_id=user_id,
-                source_type='website',
-                additional_metadata={
-                    'title': page['title'] or f"Page {page_idx + 1}",
-                    'url': page['url'],
-                    'page_index': page_idx
-                }
-            )
-            total_chunks += chunks_created
-            
-            # Update progress incrementally
-            progress = 50 + int(((page_idx + 1) / len(pages)) * 45)
-            supabase.table('data_sources').update({'progress': min(progress, 95)}).eq('id', source_id).execute()
+        from utils.multi_source_embed import source_pipeline, source_document
+        
+        with source_pipeline(chatbot_id, source_id, user_id, progress_callback=_source_progress(supabase, source_id, 50, 95)) as pipeline:
+            for page_idx, page in enumerate(pages):
+                if page.get('error'):
+                    logger.warning(f"Skipping failed page: {page['url']}")
+                    continue
+                
+                pipeline.put(source_document(
+                    text=page['text'],
+                    video_id=f"website_page_{page_idx}",
+                    source_type='website',
+                    additional_metadata={
+                        'title': page['title'] or f"Page {page_idx + 1}",
+                        'url': page['url'],
+                        'page_index': page_idx
+                    }
+                ))
+        total_chunks = pipeline.stats['chunks']
         
         logger.info(f"Created {total_chunks} total chunks from website")
         
@@ -393,6 +372,18 @@ def update_chatbot_readiness(chatbot_id: int):
             update_data['speaking_style'] = speaking_style
         
         supabase.table('channels').update(update_data).eq('id', chatbot_id).execute()
+        # A source finished (or failed) and the channel's embeddings changed.
+        answer_cache.invalidate_channel(chatbot_id)
+        if speaking_style:
+            persona_compiler.recompile(chatbot_id, supabase)
+
+        if status == 'ready':
+            # Large channels get a dedicated partial HNSW index (built in the background).
+            try:
+                from tasks import ensure_channel_vector_index_task
+                ensure_channel_vector_index_task(chatbot_id)
+            except Exception as index_err:
+                logger.warning(f"Could not queue vector index check for chatbot {chatbot_id}: {index_err}")
         
         logger.info(f"Updated chatbot {chatbot_id}: ready={is_ready}, YouTube={has_youtube}, WhatsApp={has_whatsapp}, Website={has_website}, style={'extracted' if speaking_style else 'none'}")
         
@@ -410,7 +401,7 @@ def process_pdf_source(source_id: int, file_path: str, task_id: str = None):
         task_id: Optional task ID for progress tracking
     """
     from utils.pdf_parser import extract_text_from_pdf, chunk_pdf_pages
-    from utils.multi_source_embed import chunk_and_embed_text
+    from utils.multi_source_embed import source_pipeline, source_document
 
     supabase = get_supabase_admin_client()
     chatbot_id = None
@@ -454,24 +445,19 @@ def process_pdf_source(source_id: int, file_path: str, task_id: str = None):
 
         # --- Create embeddings ---
         logger.info(f"Creating embeddings for {len(chunks)} PDF chunks")
-        total_embedded = 0
-        for i, chunk in enumerate(chunks):
-            chunks_created = chunk_and_embed_text(
-                text=chunk['text'],
-                video_id=f"pdf_chunk_{i}",
-                channel_id=chatbot_id,
-                source_id=source_id,
-                user_id=user_id,
-                source_type='pdf',
-                additional_metadata={
-                    'title': doc_title,
-                    'page_range': chunk['page_range'],
-                    'chunk_index': i,
-                }
-            )
-            total_embedded += chunks_created
-            progress = 50 + int(((i + 1) / len(chunks)) * 45)
-            supabase.table('data_sources').update({'progress': min(progress, 95)}).eq('id', source_id).execute()
+        with source_pipeline(chatbot_id, source_id, user_id, progress_callback=_source_progress(supabase, source_id, 50, 95)) as pipeline:
+            for i, chunk in enumerate(chunks):
+                pipeline.put(source_document(
+                    text=chunk['text'],
+                    video_id=f"pdf_chunk_{i}",
+                    source_type='pdf',
+                    additional_metadata={
+                        'title': doc_title,
+                        'page_range': chunk['page_range'],
+                        'chunk_index': i,
+                    }
+                ))
+        total_embedded = pipeline.stats['written']
 
         logger.info(f"Created {total_embedded} embeddings for PDF source {source_id}")
 
@@ -0,0 +1,117 @@
+# In utils/onnx_reranker.py
+"""
+ONNX Runtime backend for the ms-marco MiniLM cross-encoder.
+
+Runs a dynamically int8-quantized export of the model with onnxruntime and a
+fast tokenizer, so the reranking hot path needs neither torch nor
+sentence-transformers. `predict()` mirrors CrossEncoder.predict, so the rest of
+qa_utils (and the micro-batcher) can use either backend interchangeably.
+
+Create the model directory once with:
+    python export_onnx_reranker.py --output models/ms-marco-MiniLM-L-6-v2-onnx-int8
+"""
+
+import os
+import logging
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CROSS_ENCODER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+DEFAULT_ONNX_MODEL_DIR = os.environ.get('RERANK_ONNX_MODEL_DIR', 'models/ms-marco-MiniLM-L-6-v2-onnx-int8')
+QUANTIZED_MODEL_FILENAME = 'model_quantized.onnx'
+FP32_MODEL_FILENAME = 'model.onnx'
+
+
+class OnnxCrossEncoder:
+    """Drop-in replacement for sentence_transformers.CrossEncoder backed by onnxruntime."""
+
+    def __init__(self, model_dir: str = DEFAULT_ONNX_MODEL_DIR, max_length: int = 512,
+                 intra_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILENAME)
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, FP32_MODEL_FILENAME)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No ONNX reranker model found in '{model_dir}'.")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = intra_op_threads or int(os.environ.get('RERANK_ONNX_THREADS', 0))
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.model_path = model_path
+        self.max_length = max_length
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        logger.info(f"Loaded ONNX cross-encoder from {model_path}")
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 32, apply_sigmoid: bool = True) -> np.ndarray:
+        """Scores (query, passage) pairs. Sigmoid matches CrossEncoder's default for single-label models."""
+        if not pairs:
+            return np.array([], dtype='float32')
+
+        logits = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            encoded = self.tokenizer(
+                [pair[0] for pair in batch],
+                [pair[1] for pair in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np',
+            )
+            feeds = {name: value.astype('int64') for name, value in encoded.items() if name in self.input_names}
+            output = self.session.run(None, feeds)[0]
+            logits.append(output[:, 0] if output.ndim == 2 else output)
+
+        scores = np.concatenate(logits).astype('float32')
+        return 1.0 / (1.0 + np.exp(-scores)) if apply_sigmoid else scores
+
+
+def export_quantized_model(output_dir: str = DEFAULT_ONNX_MODEL_DIR, model_name: str = CROSS_ENCODER_MODEL_NAME) -> str:
+    """
+    Exports the Hugging Face cross-encoder to ONNX and applies dynamic int8 quantization.
+    Needs torch + transformers at export time only. Returns the quantized model path.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(['what is the latest video about'], ['A sample transcript passage.'], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILENAME)
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+    logger.info(f"Exported int8 ONNX cross-encoder to {quantized_path}")
+    return quantized_path
@@ -0,0 +1,166 @@
+# In utils/persona_compiler.py
+"""
+Compiles a channel's persona into a fixed system-prompt prefix.
+
+The persona part of the prompt (who the bot is, its soul, voice, anti-patterns
+and rules) only changes when the channel's settings do, but it used to be rebuilt
+on every message, including a scan of creator_soul for the anti-pattern section.
+compile_persona_prefix() builds it once; recompile() stores the result on the
+channel row (`persona_prompt`, `persona_prompt_key`) whenever process_channel_task,
+sync_channel_task, regenerate_persona.py or the settings endpoints change a
+persona field.
+
+At answer time the prompt is laid out as
+
+    persona prefix | flow triggers | manager / lead-capture block | turn (date, history, context, question)
+
+so the prefix is byte-identical across turns and provider-side prompt caching
+(OpenAI cached input, Gemini implicit caching) can reuse it. persona_prompt_key
+is the bot_type, PERSONA_PROMPT_VERSION and the answer_cache persona fingerprint:
+a stored prefix whose key no longer matches (templates changed, or a persona
+field was written somewhere that doesn't recompile) is ignored and rebuilt in
+process instead.
+"""
+
+import logging
+from typing import Optional
+
+from cachetools import LRUCache
+
+from . import prompts
+from .answer_cache import PERSONA_FIELDS, persona_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a *_PREFIX template or the compile logic changes; stored prefixes are then rebuilt.
+PERSONA_PROMPT_VERSION = 1
+
+DEFAULT_SPEAKING_STYLE = 'Professional and helpful. Provide clear, accurate information.'
+DEFAULT_CREATOR_SOUL = "Not yet analyzed. Use speaking style and context to infer personality."
+ANTIPATTERN_MARKERS = (
+    '**language & style to avoid',
+    '**language to avoid',
+    '**anti-patterns',
+    '**what they never say',
+    '**style to avoid',
+)
+
+# Runtime fallback for channels whose stored prefix is missing or stale: (channel id, key) -> prefix
+_compiled = LRUCache(maxsize=1024)
+
+
+def bot_type_for(channel_data: dict) -> str:
+    return channel_data.get('bot_type') or 'youtuber'  # Default to youtuber for legacy bots
+
+
+def persona_key(channel_data: dict) -> str:
+    return f"{bot_type_for(channel_data)}:v{PERSONA_PROMPT_VERSION}:{persona_fingerprint(channel_data)}"
+
+
+def display_name(channel_data: dict) -> str:
+    return channel_data.get('creator_name', channel_data.get('channel_name', 'the creator'))
+
+
+def extract_antipatterns(creator_soul: str) -> str:
+    """
+    Pulls the 'LANGUAGE & STYLE TO AVOID' section added by the updated soul extraction prompt.
+    Returns '' for channels processed before that update.
+    """
+    if not creator_soul:
+        return ""
+    soul_lower = creator_soul.lower()
+    for marker in ANTIPATTERN_MARKERS:
+        idx = soul_lower.find(marker)
+        if idx == -1:
+            continue
+        section_start = creator_soul.find('\n', idx) + 1
+        next_section_idx = creator_soul.find('\n**', section_start)
+        if next_section_idx != -1:
+            raw_antipatterns = creator_soul[section_start:next_section_idx].strip()
+        else:
+            raw_antipatterns = creator_soul[section_start:section_start + 600].strip()
+        if raw_antipatterns:
+            return (
+                "\n**Additional Creator-Specific Anti-Patterns (from their actual content):**\n"
+                + raw_antipatterns
+            )
+        return ""
+    return ""
+
+
+def compile_persona_prefix(channel_data: dict) -> str:
+    name = display_name(channel_data)
+    speaking_style = channel_data.get('speaking_style') or DEFAULT_SPEAKING_STYLE
+    promotion_triggers = channel_data.get('promotion_triggers')
+    if promotion_triggers:
+        speaking_style += f"\n\nCRITICAL INSTRUCTIONS / PROMOTION TRIGGERS:\n{promotion_triggers}"
+
+    bot_type = bot_type_for(channel_data)
+    if bot_type == 'business':
+        prefix = prompts.BUSINESS_SUPPORT_PREFIX.format(business_name=name, speaking_style=speaking_style)
+    elif bot_type == 'general':
+        prefix = prompts.GENERAL_ASSISTANT_PREFIX.format(bot_name=name, speaking_style=speaking_style)
+    else:
+        creator_soul = channel_data.get('creator_soul', '')
+        prefix = prompts.HYBRID_PERSONA_PREFIX.format(
+            creator_name=name,
+            creator_soul=creator_soul or DEFAULT_CREATOR_SOUL,
+            speaking_style=speaking_style,
+            creator_antipatterns=extract_antipatterns(creator_soul),
+        )
+    return prefix.strip('\n')
+
+
+def turn_template(channel_data: dict) -> str:
+    bot_type = bot_type_for(channel_data)
+    if bot_type == 'business':
+        return prompts.BUSINESS_SUPPORT_TURN
+    if bot_type == 'general':
+        return prompts.GENERAL_ASSISTANT_TURN
+    return prompts.HYBRID_PERSONA_TURN
+
+
+def get_persona_prefix(channel_data: dict) -> str:
+    """The stored prefix when it is current for this channel, otherwise a compiled (and cached) one."""
+    key = persona_key(channel_data)
+    stored = channel_data.get('persona_prompt')
+    if stored and channel_data.get('persona_prompt_key') == key:
+        return stored
+
+    cache_key = (channel_data.get('id'), key)
+    prefix = _compiled.get(cache_key)
+    if prefix is None:
+        prefix = compile_persona_prefix(channel_data)
+        _compiled[cache_key] = prefix
+        print(f"[PERSONA] Compiled {bot_type_for(channel_data)} prefix for channel {channel_data.get('id')} "
+              f"at answer time ({'stale' if stored else 'no'} stored prefix, {len(prefix)} chars)")
+    return prefix
+
+
+def compiled_columns(channel_data: dict) -> dict:
+    return {
+        'persona_prompt': compile_persona_prefix(channel_data),
+        'persona_prompt_key': persona_key(channel_data),
+    }
+
+
+def recompile(channel_id, supabase=None) -> Optional[str]:
+    """
+    Rebuilds and stores the persona prefix for a channel. Call it after any write to a
+    PERSONA_FIELDS column. Failures are logged, not raised: answers fall back to compiling
+    in process.
+    """
+    try:
+        if supabase is None:
+            from .supabase_client import get_supabase_admin_client
+            supabase = get_supabase_admin_client()
+        res = supabase.table('channels').select(', '.join(('id',) + PERSONA_FIELDS)).eq('id', channel_id).maybe_single().execute()
+        if not res or not res.data:
+            return None
+        columns = compiled_columns(res.data)
+        supabase.table('channels').update(columns).eq('id', channel_id).execute()
+        print(f"[PERSONA] Stored {bot_type_for(res.data)} prefix for channel {channel_id} ({len(columns['persona_prompt'])} chars)")
+        return columns['persona_prompt']
+    except Exception as e:
+        logger.warning(f"[PERSONA] Could not store the compiled persona for channel {channel_id}: {e}")
+        return None
@@ -0,0 +1,96 @@
+# In utils/prefetch_utils.py
+"""
+Concurrent prefetch of independent prompt inputs.
+
+answer_question_stream needs several remote results before it can build the
+prompt (query limits, user status, retrieval, channel flows). Each is a
+100-800 ms round trip to Supabase; StagedPrefetch starts them all at once on a
+shared thread pool and joins them where they are needed, recording how long
+each stage ran and how long the request actually waited for it.
+
+Each task runs in a copy of the caller's contextvars, so Flask's request/app
+context is still visible inside the worker threads.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict
+
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+PREFETCH_MAX_WORKERS = int(os.environ.get('PREFETCH_MAX_WORKERS', 32))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix='prefetch')
+    return _executor
+
+
+class StagedPrefetch:
+    """
+    Submit named stages up front, then call result(name) where each value is needed.
+    With PREFETCH_ENABLED=false stages run inline on submit (the old sequential behaviour).
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, Future] = {}
+        self.durations: Dict[str, float] = {}
+        self.waits: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> None:
+        def run():
+            stage_start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.durations[name] = time.perf_counter() - stage_start
+
+        if PREFETCH_ENABLED:
+            context = contextvars.copy_context()
+            self._futures[name] = get_prefetch_executor().submit(context.run, run)
+            return
+
+        future = Future()
+        try:
+            future.set_result(run())
+        except Exception as e:
+            future.set_exception(e)
+        self._futures[name] = future
+
+    def submitted(self, name: str) -> bool:
+        return name in self._futures
+
+    def result(self, name: str, default: Any = None) -> Any:
+        """Blocks until the stage finishes. Re-raises the stage's exception."""
+        future = self._futures.get(name)
+        if future is None:
+            return default
+        wait_start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            self.waits.setdefault(name, time.perf_counter() - wait_start)
+
+    def log_timings(self, label: str = 'Prompt inputs') -> None:
+        if not self._futures:
+            return
+        parts = []
+        for name in self._futures:
+            duration = self.durations.get(name)
+            if duration is None:
+                parts.append(f"{name}=pending")
+            else:
+                parts.append(f"{name}={duration:.3f}s (waited {self.waits.get(name, 0.0):.3f}s)")
+        elapsed = time.perf_counter() - self._start
+        serial = sum(self.durations.values())
+        print(f"[TIME_LOG] {label}: {', '.join(parts)} | wall {elapsed:.3f}s vs {serial:.3f}s sequential")
@@ -0,0 +1,197 @@
+# In utils/provider_clients.py
+"""
+Long-lived, pooled clients for the LLM and embedding providers.
+
+Building an `openai.OpenAI(...)` client, calling `genai.configure(...)` or using a
+bare `requests.post` on every call means every message pays for a fresh TCP +
+TLS (+ HTTP/2) handshake — 150-300 ms per LLM call from our region. This
+registry keeps one thread-safe, keep-alive client per (provider, base_url, key):
+
+    get_openai_client(api_key, base_url)  OpenAI-compatible endpoints (OpenAI, Groq, custom)
+    get_http_session()                    raw HTTP calls (Groq SSE, Ollama) via a pooled requests.Session
+    configure_gemini(api_key)             only re-configures google.generativeai when the key changes
+    get_async_openai_client / get_async_http_client
+                                          asyncio counterparts for utils/async_answer.py (one per event loop)
+
+Pool sizes, timeouts and retry policy come from the environment:
+    LLM_POOL_MAX_CONNECTIONS, LLM_POOL_MAX_KEEPALIVE, LLM_KEEPALIVE_EXPIRY,
+    LLM_CONNECT_TIMEOUT, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF, LLM_HTTP2
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_POOL_MAX_CONNECTIONS = int(os.environ.get('LLM_POOL_MAX_CONNECTIONS', 100))
+LLM_POOL_MAX_KEEPALIVE = int(os.environ.get('LLM_POOL_MAX_KEEPALIVE', 20))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_KEEPALIVE_EXPIRY', 120))  # seconds
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))
+LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT', 60))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BACKOFF = float(os.environ.get('LLM_RETRY_BACKOFF', 0.5))
+LLM_HTTP2 = os.environ.get('LLM_HTTP2', 'true').lower() == 'true'
+
+_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+_http_session = None
+_gemini_api_key = None
+
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401  (installed by httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None):
+    """Returns the shared OpenAI SDK client for this key/base_url (OpenAI clients are thread-safe)."""
+    key = ('openai', base_url or '', api_key or '')
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            import openai
+            http_client = httpx.Client(
+                http2=_http2_available(),
+                limits=httpx.Limits(
+                    max_connections=LLM_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=http_client,
+                max_retries=LLM_MAX_RETRIES,
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+            _clients[key] = client
+            logger.info(f"[PROVIDER_CLIENTS] Created pooled OpenAI client for {base_url or 'api.openai.com'}")
+    return client
+
+
+def _httpx_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _get_async_client(key: tuple, factory):
+    # httpx async pools are bound to the loop that opened them, so clients are kept per loop.
+    key = (id(asyncio.get_running_loop()),) + key
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = factory()
+                _async_clients[key] = client
+    return client
+
+
+def get_async_http_client():
+    """Shared httpx.AsyncClient for raw async provider calls (Groq SSE, Ollama). Must be called inside a running loop."""
+    def factory():
+        import httpx
+        # Pool settings live on the transport; it also retries failed connects.
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(retries=LLM_MAX_RETRIES, http2=_http2_available(), limits=_httpx_limits()),
+        )
+    return _get_async_client(('http',), factory)
+
+
+def get_async_openai_client(api_key: str, base_url: Optional[str] = None):
+    """openai.AsyncOpenAI counterpart of get_openai_client. Must be called inside a running loop."""
+    def factory():
+        import httpx
+        import openai
+        logger.info(f"[PROVIDER_CLIENTS] Created pooled AsyncOpenAI client for {base_url or 'api.openai.com'}")
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(
+                http2=_http2_available(),
+                limits=_httpx_limits(),
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            ),
+            max_retries=LLM_MAX_RETRIES,
+            timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+    return _get_async_client(('openai', base_url or '', api_key or ''), factory)
+
+
+def get_http_session():
+    """
+    Shared requests.Session with a keep-alive connection pool for raw provider calls.
+    Retries connection errors and 429/502/503/504 responses with exponential backoff;
+    a streamed response is only retried before its body starts.
+    """
+    global _http_session
+    if _http_session is not None:
+        return _http_session
+    with _lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=LLM_MAX_RETRIES,
+                connect=LLM_MAX_RETRIES,
+                read=0,
+                status=LLM_MAX_RETRIES,
+                backoff_factor=LLM_RETRY_BACKOFF,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset(['GET', 'POST']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=LLM_POOL_MAX_CONNECTIONS, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+    return _http_session
+
+
+def request_timeout(read_timeout: Optional[float] = None) -> tuple:
+    """(connect, read) timeout tuple for get_http_session() calls."""
+    return (LLM_CONNECT_TIMEOUT, read_timeout if read_timeout is not None else LLM_REQUEST_TIMEOUT)
+
+
+def configure_gemini(api_key: str):
+    """
+    Configures google.generativeai once per key and returns the module.
+    genai.configure() drops the SDK's cached client (and its gRPC channel), so calling it
+    on every request throws the warm connection away.
+    """
+    global _gemini_api_key
+    import google.generativeai as genai
+    if api_key != _gemini_api_key:
+        with _lock:
+            if api_key != _gemini_api_key:
+                genai.configure(api_key=api_key)
+                _gemini_api_key = api_key
+    return genai
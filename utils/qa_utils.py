@@ -6,23 +6,44 @@ import logging
 import numpy as np
 import requests
 from functools import lru_cache
+from cachetools import TTLCache
 from typing import Iterator, List, Optional, Dict, Any
 from dotenv import load_dotenv
-from sentence_transformers import CrossEncoder
 from . import prompts
 from .supabase_client import get_supabase_client, get_supabase_admin_client
 import re
 import threading
 from . import prompts 
 from utils.supabase_client import get_supabase_admin_client
-import tiktoken
 import datetime
 from flask import session
 from .subscription_utils import get_user_status
+from . import embedding_cache
+from . import answer_cache
+from . import rerank_utils
+from .prefetch_utils import StagedPrefetch
+from . import flow_registry
+from . import provider_clients
+from . import llm_hedging
+from . import sse_utils
+from . import context_assembler
+from . import persona_compiler
+from . import intent_router
+from . import mmr_utils
+from . import rate_limiter
+from .answer_api import (
+    AnswerEvent, EVENT_SOURCES, EVENT_DELTA, EVENT_QUERY_STRING, EVENT_ERROR, EVENT_DONE
+)
 # Load environment variables from .env file
 load_dotenv()
 cross_encoder = None
 _cross_encoder_lock = threading.Lock()  # Prevent race condition in multi-threaded context
+_rerank_batcher = None
+_remote_reranker = None
+_lean_rpc_available = True
+_hybrid_rpc_available = True
+# (channel_id, source_id, video_id) -> citation fields; they never change for a given video
+_video_citation_cache = TTLCache(maxsize=20000, ttl=3600)
 
 DEFAULT_REQUEST_TIMEOUT = 30  # seconds
 REQUEST_RETRY_COUNT = 2
@@ -48,7 +69,7 @@ def _post_with_retries(url: str, json_payload: dict, headers: dict = None, timeo
     attempt = 0
     while attempt <= REQUEST_RETRY_COUNT:
         try:
-            response = requests.post(url, json=json_payload, headers=headers or {}, timeout=timeout)
+            response = provider_clients.get_http_session().post(url, json=json_payload, headers=headers or {}, timeout=timeout)
             return response
         except requests.RequestException as e:
             logging.warning(f"Request to {url} failed on attempt {attempt + 1}/{REQUEST_RETRY_COUNT + 1}: {e}")
@@ -61,11 +82,12 @@ def _post_with_retries(url: str, json_payload: dict, headers: dict = None, timeo
 def _create_openai_embedding(texts: List[str], model: str, api_key: str) -> Optional[List[Optional[np.ndarray]]]:
     """
     Returns a list of numpy arrays (float32) aligned with input texts.
-    If an item failed, the corresponding position will be None.
+    If an item failed, the corresponding position will be None. Rate-limit errors are
+    reported to rate_limiter and re-raised, so callers can retry after the shared backoff.
     """
     try:
-        import openai
-        client = openai.OpenAI(api_key=api_key)
+        rate_limiter.acquire('openai', api_key)
+        client = provider_clients.get_openai_client(api_key)
         response = client.embeddings.create(input=texts, model=model)
         # response.data should be a list aligned to `texts`
         embeddings = []
@@ -74,6 +96,10 @@ def _create_openai_embedding(texts: List[str], model: str, api_key: str) -> Opti
             embeddings.append(emb)
         return embeddings
     except Exception as e:
+        if rate_limiter.is_rate_limit_error(e):
+            rate_limiter.report_throttled('openai', api_key)
+            logging.warning(f"OpenAI embedding request was rate limited: {e}")
+            raise
         logging.error(f"Failed to create OpenAI batch embedding: {e}", exc_info=True)
         return [None] * len(texts)
 
@@ -85,23 +111,23 @@ def _create_gemini_embedding(texts: List[str], model: str, api_key: str) -> Opti
     """
     Uses Google Gemini embed_content with configurable output dimensions.
     Normalizes output to a list aligned with inputs.
-    Includes a retry mechanism with exponential backoff for rate limit errors.
+    Rate-limited requests are retried after rate_limiter's shared backoff; once the
+    retries are used up the rate-limit error is re-raised, as for OpenAI.
     """
     try:
         import google.generativeai as genai
-        import time
         from google.api_core import exceptions
 
-        genai.configure(api_key=api_key)
+        provider_clients.configure_gemini(api_key)
         model_name = f"models/{model}" if not model.startswith('models/') else model
         
         output_dimensions = int(os.environ.get('GEMINI_EMBED_DIMENSIONS', '1536'))
         
         max_retries = 5
-        backoff_factor = 2
 
         for i in range(max_retries):
             try:
+                rate_limiter.acquire('gemini', api_key)
                 result = genai.embed_content(
                     model=model_name, 
                     content=texts, 
@@ -129,10 +155,10 @@ def _create_gemini_embedding(texts: List[str], model: str, api_key: str) -> Opti
                 return embeddings
 
             except exceptions.ResourceExhausted as e:
+                # Slows every process using this key; the next attempt waits for the reduced quota
+                rate_limiter.report_throttled('gemini', api_key)
                 if i < max_retries - 1:
-                    sleep_time = backoff_factor ** i
-                    logging.warning(f"Gemini API rate limit exceeded. Retrying in {sleep_time} seconds... (Attempt {i + 1}/{max_retries})")
-                    time.sleep(sleep_time)
+                    logging.warning(f"Gemini API rate limit exceeded. Retrying when quota allows... (Attempt {i + 1}/{max_retries})")
                 else:
                     logging.error(f"Failed to create Gemini batch embedding after {max_retries} retries due to rate limiting.")
                     raise e
@@ -143,6 +169,8 @@ def _create_gemini_embedding(texts: List[str], model: str, api_key: str) -> Opti
         return [None] * len(texts)
 
     except Exception as e:
+        if rate_limiter.is_rate_limit_error(e):
+            raise
         logging.error(f"Failed to create Gemini batch embedding: {e}", exc_info=True)
         return [None] * len(texts)
 
@@ -220,74 +248,22 @@ EMBEDDING_PROVIDER_MAP = {
 def get_routed_context(question: str, channel_data: Optional[dict], user_id: str, access_token: str):
     """
     Intelligently builds a context list based on user intent.
-    For "latest video" queries, it fetches transcript chunks and generates a live summary
-    to be used as context for the main LLM.
+    utils/intent_router.py matches the query embedding against intent centroids; latest-video
+    and flow-trigger questions are answered from cached handlers without retrieval, and
+    identity questions get the identity card in front of the search results.
     """
-    question_lower = question.lower()
-    
-    # --- Intent 1: Direct request for the latest video ---
-    if any(phrase in question_lower for phrase in ['latest video', 'newest video', 'recent video', 'most recent video', 'your last video', 'new video']):
-        print("Query routed to: get_latest_video_summary")
-        if channel_data and channel_data.get('videos'):
-            videos = channel_data['videos']
-            if videos:
-                try:
-                    latest_video = sorted(videos, key=lambda v: v.get('upload_date'), reverse=True)[0]
-                    title = latest_video.get('title', 'My Latest Video')
-                    video_id = latest_video.get('video_id')
-                    summary = ""
-
-                    # Fetch the first 3 chunks of the transcript from the database
-                    admin_supabase = get_supabase_admin_client()
-                    response = admin_supabase.table('embeddings').select('metadata').eq('video_id', video_id).order('metadata->>chunk_index', desc=False).limit(3).execute()
-                    
-                    if getattr(response, 'data', None):
-                        # Combine the text and generate a summary
-                        first_chunks_text = " ".join([row['metadata']['chunk_text'] for row in response.data])
-                        summary = _get_transcript_summary(first_chunks_text)
-                    else:
-                        # Fallback to the stored description only if no transcript chunks are found
-                        summary = latest_video.get('description') or "I can't seem to find the details for this video right now, but I hope you check it out!"
-                    
-                    # Create the synthetic context chunk using our high-quality summary
-                    context_chunk = {
-                        'chunk_text': f"My latest video is titled '{title}'. Here is a quick summary of what it is about: {summary}",
-                        'video_title': title,
-                        'video_url': latest_video.get('url'),
-                        'video_id': video_id,
-                        'upload_date': latest_video.get('upload_date'),
-                    }
-                    print(f"Crafted summary context for main LLM: {context_chunk['chunk_text'][:100]}...")
-                    return [context_chunk]
-                except Exception as e:
-                    logging.warning(f"Could not determine latest video or generate summary: {e}. Falling back to semantic search.")
-
-    # --- Intent 2: Identity questions (no changes needed here) ---
-    identity_keywords = ['who are you', 'what is your name', 'introduce yourself','your email']
-    if any(keyword in question_lower for keyword in identity_keywords):
-        # ... (this part remains the same)
-        print("Intent Detected: Identity. Prepending intro context.")
-        identity_context = []
-        if channel_data:
-            creator_name = channel_data.get('channel_name', 'the creator')
-            summary = channel_data.get('summary', 'a content creator who makes videos on YouTube.')
-            identity_context.append({
-                'video_title': 'Introduction',
-                'chunk_text': f"My name is {creator_name}. I run this channel where {summary}",
-                'video_url': channel_data.get('channel_url', '#'),
-                'video_id': 'intro_chunk'
-            })
-        video_ids = {v['video_id'] for v in (channel_data.get('videos') or [])} if channel_data else None
-        
-        # If multi-source, search everything (don't restrict to YouTube IDs)
-        if channel_data and (channel_data.get('has_website') or channel_data.get('has_whatsapp')):
-            video_ids = None
-        
-        # Always pass channel_id to ensure data isolation between different chatbots.
-        effective_channel_id = channel_data.get('id') if channel_data else None
-            
-        semantic_chunks = search_and_rerank_chunks(question, user_id, access_token, video_ids, effective_channel_id)
-        return identity_context + semantic_chunks
+    prefix_chunks = []
+    intent = intent_router.route(question, channel_data)
+    if intent:
+        print(f"Query routed to: {intent.name}")
+        try:
+            routed_chunks = intent_router.handle(intent, channel_data)
+            if routed_chunks and intent.name in intent_router.AUGMENTING_INTENTS:
+                prefix_chunks = routed_chunks
+            elif routed_chunks:
+                return routed_chunks
+        except Exception as e:
+            logging.warning(f"Intent handler '{intent.name}' failed: {e}. Falling back to semantic search.")
 
     print("Query routed to: semantic_search")
     video_ids = {v['video_id'] for v in (channel_data.get('videos') or [])} if channel_data else None
@@ -299,7 +275,10 @@ def get_routed_context(question: str, channel_data: Optional[dict], user_id: str
     # Always pass channel_id to ensure data isolation between different chatbots.
     effective_channel_id = channel_data.get('id') if channel_data else None
 
-    return search_and_rerank_chunks(question, user_id, access_token, video_ids, effective_channel_id)
+    semantic_chunks = search_and_rerank_chunks(question, user_id, access_token, video_ids, effective_channel_id)
+    if prefix_chunks and isinstance(semantic_chunks, list):
+        return prefix_chunks + semantic_chunks
+    return semantic_chunks
 
 # --- Provider-Specific LLM STREAMING FUNCTIONS ---
 def _get_openai_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
@@ -308,7 +287,8 @@ def _get_openai_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
         base_url = kwargs.get('base_url')
         temperature = kwargs.get('temperature', 1)
         max_tokens = kwargs.get('max_tokens', 1024)
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        client = provider_clients.get_openai_client(api_key, base_url)
+        rate_limiter.acquire('openai', api_key)
         
         try:
             image_base64 = kwargs.get('image_base64')
@@ -339,15 +319,16 @@ def _get_openai_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
                 temperature=temperature,
                 stream=True
             )
-            for chunk in response_stream:
-                # compatibility with different SDK response shapes
-                content = None
-                if hasattr(chunk.choices[0].delta, 'content'):
-                    content = chunk.choices[0].delta.content
-                elif 'choices' in chunk and chunk['choices'][0].get('delta', {}).get('content'):
-                    content = chunk['choices'][0]['delta']['content']
-                if content:
-                    yield content
+            with llm_hedging.tracked(response_stream):
+                for chunk in response_stream:
+                    # compatibility with different SDK response shapes
+                    content = None
+                    if hasattr(chunk.choices[0].delta, 'content'):
+                        content = chunk.choices[0].delta.content
+                    elif 'choices' in chunk and chunk['choices'][0].get('delta', {}).get('content'):
+                        content = chunk['choices'][0]['delta']['content']
+                    if content:
+                        yield content
                     
         except openai.APIError as e:
             if "streaming the response from the model provider" in str(e):
@@ -377,6 +358,10 @@ def _get_openai_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
                 raise  # Re-raise if it's a different API error
                 
     except Exception as e:
+        if llm_hedging.stream_aborted():
+            return
+        if rate_limiter.is_rate_limit_error(e):
+            rate_limiter.report_throttled('openai', api_key)
         logging.error(f"Failed to get OpenAI stream: {e}", exc_info=True)
         yield "Error: Could not get a response from the provider."
 
@@ -385,9 +370,12 @@ def _get_groq_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
         headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
         max_tokens = kwargs.get('max_tokens')
         data = {'model': model, 'messages': [{"role": "user", "content": prompt}], 'max_tokens': max_tokens, 'temperature': 1, 'stream': True}
-        with requests.post('https://api.groq.com/openai/v1/chat/completions', headers=headers, json=data, stream=True, timeout=DEFAULT_REQUEST_TIMEOUT) as response:
+        rate_limiter.acquire('groq', api_key)
+        with provider_clients.get_http_session().post('https://api.groq.com/openai/v1/chat/completions', headers=headers, json=data, stream=True, timeout=DEFAULT_REQUEST_TIMEOUT) as response, llm_hedging.tracked(response):
             # Check for non-200 responses and surface the error clearly
             if response.status_code != 200:
+                if response.status_code == 429:
+                    rate_limiter.report_throttled('groq', api_key)
                 error_body = response.text
                 logging.error(f"Groq API returned HTTP {response.status_code} for model '{model}': {error_body}")
                 yield f"Error: Groq API error {response.status_code}. Model '{model}' may be unavailable or the API key is invalid. Details: {error_body[:200]}"
@@ -404,6 +392,8 @@ def _get_groq_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
                         except json.JSONDecodeError:
                             continue
     except Exception as e:
+        if llm_hedging.stream_aborted():
+            return
         logging.error(f"Failed to get Groq stream: {e}", exc_info=True)
         yield "Error: Could not get a response from the provider."
 
@@ -412,7 +402,8 @@ def _get_gemini_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
     try:
         import google.generativeai as genai
         from google.generativeai.types import generation_types
-        genai.configure(api_key=api_key)
+        provider_clients.configure_gemini(api_key)
+        rate_limiter.acquire('gemini', api_key)
         gemini_model = genai.GenerativeModel(model)
         max_tokens = kwargs.get('max_tokens', 1024) # Get max_tokens from kwargs
         
@@ -493,25 +484,30 @@ def _get_gemini_answer_stream(prompt: str, model: str, api_key: str, **kwargs):
     except GeneratorExit:
         print("[Gemini] WARNING: GeneratorExit received — stream was closed before completion!")
     except Exception as e:
+        if rate_limiter.is_rate_limit_error(e):
+            rate_limiter.report_throttled('gemini', api_key)
         logging.error(f"Failed to get Gemini stream: {e}", exc_info=True)
         yield "Error: Could not get a response from the provider."
         
 def _get_ollama_answer_stream(prompt: str, model: str, ollama_url: str, **kwargs):
     try:
-        response = requests.post(f"{ollama_url}/api/chat", json={"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}, timeout=DEFAULT_REQUEST_TIMEOUT, stream=True)
-        for chunk in response.iter_lines():
-            if chunk:
-                try:
-                    json_data = json.loads(chunk)
-                    # Ollama stream shape might differ; try multiple fallbacks
-                    content = None
-                    if isinstance(json_data, dict):
-                        content = json_data.get('message', {}).get('content') or json_data.get('content') or json_data.get('text')
-                    if content:
-                        yield content
-                except ValueError:
-                    continue
+        response = provider_clients.get_http_session().post(f"{ollama_url}/api/chat", json={"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}, timeout=DEFAULT_REQUEST_TIMEOUT, stream=True)
+        with llm_hedging.tracked(response):
+            for chunk in response.iter_lines():
+                if chunk:
+                    try:
+                        json_data = json.loads(chunk)
+                        # Ollama stream shape might differ; try multiple fallbacks
+                        content = None
+                        if isinstance(json_data, dict):
+                            content = json_data.get('message', {}).get('content') or json_data.get('content') or json_data.get('text')
+                        if content:
+                            yield content
+                    except ValueError:
+                        continue
     except Exception as e:
+        if llm_hedging.stream_aborted():
+            return
         logging.error(f"Failed to get Ollama stream: {e}", exc_info=True)
         yield "Error: Could not get a response from the provider."
 
@@ -522,33 +518,110 @@ LLM_STREAM_PROVIDER_MAP = {
     'ollama': _get_ollama_answer_stream
 }
 
-def rerank_with_cross_encoder(query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _load_cross_encoder():
     """
-    Re-ranks chunks using a Cross-Encoder model, lazy-loaded on first call.
-    Thread-safe lazy initialization is used to avoid race conditions.
+    Loads the reranker for the configured RERANK_BACKEND.
+    'onnx' uses the int8 ONNX Runtime export. If it can't be loaded, the PyTorch model is used
+    and the failure is logged as an error, since the backend was asked for explicitly.
     """
+    if os.environ.get('RERANK_BACKEND', 'torch').lower() == 'onnx':
+        try:
+            from .onnx_reranker import OnnxCrossEncoder
+            model = OnnxCrossEncoder()
+            print("ONNX Cross-Encoder (int8) loaded successfully.")
+            return model
+        except Exception as e:
+            logging.error(f"RERANK_BACKEND=onnx but the ONNX Cross-Encoder could not be loaded: {e}. "
+                          f"Falling back to the PyTorch model; check onnxruntime/transformers and RERANK_ONNX_MODEL_DIR.", exc_info=True)
+
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+    print("Cross-Encoder model loaded successfully.")
+    return model
+
+def _get_cross_encoder():
+    """Thread-safe lazy load of the Cross-Encoder. Returns 'failed_to_load' if it could not be loaded."""
     global cross_encoder
     if cross_encoder is None:
         with _cross_encoder_lock:
             if cross_encoder is None:
                 try:
                     print("Loading Cross-Encoder model for the first time...")
-                    cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-                    print("Cross-Encoder model loaded successfully.")
+                    cross_encoder = _load_cross_encoder()
                 except Exception as e:
                     logging.warning(f"Could not load Cross-Encoder model: {e}. Re-ranking will be disabled.")
                     cross_encoder = 'failed_to_load'
-    if cross_encoder == 'failed_to_load' or not chunks:
+    return cross_encoder
+
+def warm_up_reranker():
+    """
+    Loads the reranker at worker boot and runs one tiny prediction, so the first
+    user question doesn't pay the multi-second model load.
+    Skipped when reranking is disabled or served by the standalone rerank service.
+    """
+    if os.environ.get('ENABLE_RERANKING', 'true').lower() != 'true' or rerank_utils.RERANK_SERVICE_ADDRESS:
+        return
+    start_time = time.perf_counter()
+    model = _get_cross_encoder()
+    if model == 'failed_to_load':
+        return
+    try:
+        model.predict([['warm up', 'warm up']])
+    except Exception as e:
+        logging.warning(f"Reranker warm-up prediction failed: {e}")
+    print(f"[TIME_LOG] Reranker warm start took {time.perf_counter() - start_time:.4f} seconds.")
+
+def _predict_cross_encoder_batch(pairs: List[List[str]]):
+    """Scores one coalesced batch. batch_size=len(pairs) pads the whole flush as a single batch."""
+    return _get_cross_encoder().predict(pairs, batch_size=max(len(pairs), 1))
+
+def get_rerank_batcher() -> Optional[rerank_utils.RerankBatcher]:
+    """Process-wide micro-batcher shared by every thread in this worker."""
+    global _rerank_batcher
+    if _rerank_batcher is None:
+        with _cross_encoder_lock:
+            if _rerank_batcher is None:
+                _rerank_batcher = rerank_utils.RerankBatcher(_predict_cross_encoder_batch)
+    return _rerank_batcher
+
+def _score_pairs(pairs: List[List[str]]):
+    """
+    Routes scoring to the shared rerank service (RERANK_SERVICE_ADDRESS), the
+    in-process micro-batcher (RERANK_BATCHING), or a direct predict call.
+    """
+    global _remote_reranker
+    if rerank_utils.RERANK_SERVICE_ADDRESS:
+        try:
+            if _remote_reranker is None:
+                _remote_reranker = rerank_utils.RemoteReranker()
+            return _remote_reranker.score(pairs)
+        except Exception as e:
+            logging.warning(f"Rerank service unavailable ({e}). Falling back to in-process scoring.")
+
+    if _get_cross_encoder() == 'failed_to_load':
+        return None
+    if os.environ.get('RERANK_BATCHING', 'true').lower() == 'true':
+        return get_rerank_batcher().score(pairs)
+    return cross_encoder.predict(pairs)
+
+def rerank_with_cross_encoder(query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Re-ranks chunks using a Cross-Encoder model, lazy-loaded on first call.
+    Scoring goes through the micro-batcher so concurrent requests share one padded batch.
+    """
+    if not chunks:
         return chunks
 
     start_time = time.perf_counter()
     print(f"Re-ranking {len(chunks)} chunks for query: '{query[:50]}...'")
     pairs = [[query, chunk.get('chunk_text', '')] for chunk in chunks]
     try:
-        scores = cross_encoder.predict(pairs)
+        scores = _score_pairs(pairs)
     except Exception as e:
         logging.error(f"Cross-Encoder prediction failed: {e}", exc_info=True)
         return chunks
+    if scores is None:
+        return chunks
     for chunk, score in zip(chunks, scores):
         chunk['relevance_score'] = float(score)
     sorted_chunks = sorted(chunks, key=lambda x: x.get('relevance_score', 0), reverse=True)
@@ -556,32 +629,194 @@ def rerank_with_cross_encoder(query: str, chunks: List[Dict[str, Any]]) -> List[
     print(f"[TIME_LOG] Re-ranking with Cross-Encoder took {end_time - start_time:.4f} seconds.")
     return sorted_chunks
 
-def search_and_rerank_chunks(query: str, user_id: str, access_token: str, video_ids: Optional[set] = None, channel_id: Optional[int] = None):
-    total_start_time = time.perf_counter()
-    
-    def create_query_embedding(query_text: str):
-        provider = os.environ.get('EMBED_PROVIDER', 'openai')
-        model = os.environ.get('EMBED_MODEL')
-        if not model:
-            logging.error("EMBED_MODEL is not set in environment variables.")
-            return None
-        api_key = _get_api_key(provider)
-        ollama_url = os.environ.get('OLLAMA_URL')
-        embedding_function = EMBEDDING_PROVIDER_MAP.get(provider)
-        if not embedding_function:
-            logging.error(f"Unsupported embedding provider: {provider}")
-            return None
-        embeddings = None
+def create_query_embedding(query_text: str) -> Optional[np.ndarray]:
+    """
+    Embeds a search query with the configured provider.
+    Checks the two-tier query-embedding cache first, so repeated FAQ-style
+    questions skip the provider round trip entirely.
+    """
+    provider = os.environ.get('EMBED_PROVIDER', 'openai')
+    model = os.environ.get('EMBED_MODEL')
+    if not model:
+        logging.error("EMBED_MODEL is not set in environment variables.")
+        return None
+    dimensions = embedding_cache.get_embedding_dimensions(provider)
+
+    cached = embedding_cache.get_cached_query_embedding(provider, model, dimensions, query_text)
+    if cached is not None:
+        print("[CACHE] Query embedding served from cache.")
+        return cached
+
+    api_key = _get_api_key(provider)
+    ollama_url = os.environ.get('OLLAMA_URL')
+    embedding_function = EMBEDDING_PROVIDER_MAP.get(provider)
+    if not embedding_function:
+        logging.error(f"Unsupported embedding provider: {provider}")
+        return None
+    embeddings = None
+    if provider != 'ollama' and not api_key:
+        logging.error(f"API key for {provider} not found in environment variables.")
+        return None
+    try:
         if provider == 'ollama':
             embeddings = embedding_function([query_text], model, ollama_url=ollama_url)
         else:
-            if not api_key:
-                logging.error(f"API key for {provider} not found in environment variables.")
-                return None
             embeddings = embedding_function([query_text], model, api_key=api_key)
-        if not embeddings:
-            return None
-        return embeddings[0]  # may be None if provider failed for this item
+    except Exception as e:
+        # Rate-limit errors surface here; a live question doesn't wait for the quota to recover
+        logging.error(f"Query embedding failed: {e}")
+        return None
+    if not embeddings:
+        return None
+    query_embedding = embeddings[0]  # may be None if provider failed for this item
+    if query_embedding is not None:
+        embedding_cache.set_cached_query_embedding(provider, model, dimensions, query_text, query_embedding)
+    return query_embedding
+
+def _resolve_video_citations(supabase, channel_id: Optional[int], rows: List[dict]) -> Dict[tuple, dict]:
+    """
+    Returns {(source_id, video_id): {'title', 'url', 'upload_date'}} for the given rows.
+    Citation fields are identical for every chunk of a video, so they are cached
+    per video and only the misses are fetched (one get_video_citations call).
+    """
+    citations = {}
+    missing_video_ids = set()
+    for row in rows:
+        key = (row.get('source_id'), row.get('video_id'))
+        cached = _video_citation_cache.get((channel_id,) + key)
+        if cached is not None:
+            citations[key] = cached
+        else:
+            missing_video_ids.add(row.get('video_id'))
+
+    if missing_video_ids:
+        start_time = time.perf_counter()
+        response = supabase.rpc('get_video_citations', {
+            'p_channel_id': channel_id,
+            'p_video_ids': list(missing_video_ids)
+        }).execute()
+        for row in getattr(response, 'data', None) or []:
+            key = (row.get('source_id'), row.get('video_id'))
+            citation = {'title': row.get('title'), 'url': row.get('url'), 'upload_date': row.get('upload_date')}
+            _video_citation_cache[(channel_id,) + key] = citation
+            citations[key] = citation
+        print(f"[TIME_LOG] Resolved {len(missing_video_ids)} uncached video citations in {time.perf_counter() - start_time:.4f} seconds.")
+    return citations
+
+# Question words that would make every chunk a lexical match under the 'simple' text search config.
+LEXICAL_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in is it its me my of on or our
+please so tell than that the their them then there these they this to us was we what when where which who
+why will with would you your
+""".split())
+
+def _lexical_query_text(query: str) -> str:
+    """Keeps only the specific terms of a question (names, SKUs, numbers) for the full-text leg."""
+    tokens = re.findall(r"[\w][\w\-\.@+]*", query or "", flags=re.UNICODE)
+    return " ".join(t for t in tokens if t.lower() not in LEXICAL_STOPWORDS and (len(t) > 2 or t.isdigit()))
+
+def _lean_rows_to_chunks(supabase, channel_id: Optional[int], rows: List[dict]) -> List[Dict[str, Any]]:
+    citations = _resolve_video_citations(supabase, channel_id, rows) if rows else {}
+    results = []
+    for row in rows:
+        citation = citations.get((row.get('source_id'), row.get('video_id'))) or {}
+        chunk = {
+            'id': row.get('id'),
+            'video_id': row.get('video_id'),
+            'source_id': row.get('source_id'),
+            'source_type': row.get('source_type'),
+            'chunk_index': row.get('chunk_index'),
+            'chunk_text': row.get('chunk_text') or '',
+            'video_title': citation.get('title'),
+            'title': citation.get('title'),
+            'video_url': citation.get('url'),
+            'url': citation.get('url'),
+            'upload_date': citation.get('upload_date'),
+            'similarity_score': row.get('similarity'),
+        }
+        if 'rrf_score' in row:
+            chunk['rrf_score'] = row.get('rrf_score')
+            chunk['lexical_score'] = row.get('lexical_score')
+        results.append(chunk)
+    return results
+
+def _fetch_hybrid_candidates(supabase, match_params: dict, channel_id: Optional[int], query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Vector + full-text candidates merged with reciprocal rank fusion in one RPC
+    (match_embeddings_hybrid). Returns None when the hybrid path is unavailable
+    so the caller can fall back to pure vector search.
+    """
+    global _hybrid_rpc_available
+    lexical_text = _lexical_query_text(query)
+    if not lexical_text:
+        return None
+
+    rpc_start_time = time.perf_counter()
+    try:
+        response = supabase.rpc('match_embeddings_hybrid', {
+            **match_params,
+            'query_text': lexical_text,
+            'p_lexical_count': int(os.environ.get('HYBRID_LEXICAL_COUNT', 20)),
+            'p_lexical_candidates': int(os.environ.get('HYBRID_LEXICAL_CANDIDATES', 1000)),
+            'p_rrf_k': int(os.environ.get('HYBRID_RRF_K', 60)),
+        }).execute()
+    except Exception as e:
+        if 'JWT expired' in str(e):
+            raise
+        if 'match_embeddings_hybrid' in str(e) or 'PGRST202' in str(e) or 'chunk_tsv' in str(e):
+            logging.warning("Hybrid retrieval RPC is not installed (run hybrid_search.sql). Using vector search only.")
+            _hybrid_rpc_available = False
+        else:
+            logging.warning(f"Hybrid retrieval failed ({e}). Falling back to vector search for this query.")
+        return None
+
+    rows = getattr(response, 'data', None) or []
+    lexical_hits = sum(1 for row in rows if row.get('lexical_score') is not None)
+    print(f"[TIME_LOG] Supabase 'match_embeddings_hybrid' RPC call took {time.perf_counter() - rpc_start_time:.4f} seconds ({lexical_hits} lexical hits).")
+    return _lean_rows_to_chunks(supabase, channel_id, rows)
+
+def _fetch_match_candidates(supabase, match_params: dict, channel_id: Optional[int], query: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Runs the first-stage search and returns chunk dicts in the shape answer_question_stream expects.
+    Prefers hybrid (vector + full-text, RRF-fused), then the lean vector RPC (no full metadata
+    jsonb per row), and finally match_embeddings if the newer functions haven't been migrated yet.
+    """
+    global _lean_rpc_available
+    lean_enabled = _lean_rpc_available and os.environ.get('RETRIEVAL_LEAN_RPC', 'true').lower() == 'true'
+
+    if lean_enabled and query and _hybrid_rpc_available and os.environ.get('RETRIEVAL_HYBRID', 'true').lower() == 'true':
+        results = _fetch_hybrid_candidates(supabase, match_params, channel_id, query)
+        if results is not None:
+            return results
+
+    rpc_start_time = time.perf_counter()
+    if lean_enabled:
+        try:
+            response = supabase.rpc('match_embeddings_lean', match_params).execute()
+            rows = getattr(response, 'data', None) or []
+            print(f"[TIME_LOG] Supabase 'match_embeddings_lean' RPC call took {time.perf_counter() - rpc_start_time:.4f} seconds.")
+            return _lean_rows_to_chunks(supabase, channel_id, rows)
+        except Exception as e:
+            if 'JWT expired' in str(e):
+                raise
+            if 'match_embeddings_lean' in str(e) or 'get_video_citations' in str(e) or 'PGRST202' in str(e):
+                logging.warning("Lean retrieval RPCs are not installed (run lean_match_embeddings.sql). Using match_embeddings.")
+                _lean_rpc_available = False
+            else:
+                logging.warning(f"Lean retrieval failed ({e}). Falling back to match_embeddings for this query.")
+            rpc_start_time = time.perf_counter()
+
+    response = supabase.rpc('match_embeddings', match_params).execute()
+    print(f"[TIME_LOG] Supabase 'match_embeddings' RPC call took {time.perf_counter() - rpc_start_time:.4f} seconds.")
+    results = []
+    for row in getattr(response, 'data', None) or []:
+        chunk_data = row.get('metadata') or {}
+        chunk_data['similarity_score'] = row.get('similarity')
+        results.append(chunk_data)
+    return results
+
+def search_and_rerank_chunks(query: str, user_id: str, access_token: str, video_ids: Optional[set] = None, channel_id: Optional[int] = None):
+    total_start_time = time.perf_counter()
 
     try:
         embedding_start_time = time.perf_counter()
@@ -606,21 +841,11 @@ def search_and_rerank_chunks(query: str, user_id: str, access_token: str, video_
         print(f"  - channel_id: {channel_id}")
         print(f"  - match_threshold: {match_params['match_threshold']}")
         
-        rpc_start_time = time.perf_counter()
-        response = supabase.rpc('match_embeddings', match_params).execute()
-        rpc_end_time = time.perf_counter()
-        print(f"[TIME_LOG] Supabase 'match_embeddings' RPC call took {rpc_end_time - rpc_start_time:.4f} seconds.")
-        
-        if not getattr(response, 'data', None):
+        initial_results = _fetch_match_candidates(supabase, match_params, channel_id, query)
+        if not initial_results:
             logging.warning("Supabase RPC call returned no data.")
             return []
-        print(f"SUCCESS: Received {len(response.data)} results from Supabase.")
-
-        initial_results = []
-        for row in response.data:
-            chunk_data = row.get('metadata') or {}
-            chunk_data['similarity_score'] = row.get('similarity')
-            initial_results.append(chunk_data)
+        print(f"SUCCESS: Received {len(initial_results)} results from Supabase.")
 
         CHUNKS_TO_RERANK = int(os.environ.get('CHUNKS_TO_RERANK', 55))
         top_k = int(os.environ.get('TOP_K', 5))
@@ -629,22 +854,27 @@ def search_and_rerank_chunks(query: str, user_id: str, access_token: str, video_
             print(f"Passing the top {CHUNKS_TO_RERANK} results to the re-ranker.")
             reranked_results = rerank_with_cross_encoder(query, initial_results[:CHUNKS_TO_RERANK])
             
-            filtering_start_time = time.perf_counter()
-            final_results = []
-            video_counts = {}
-            for chunk in reranked_results:
-                video_id = chunk.get('video_id')
-                if video_counts.get(video_id, 0) < 2:
-                    final_results.append(chunk)
-                    video_counts[video_id] = video_counts.get(video_id, 0) + 1
-                if len(final_results) >= top_k:
-                    break
-            filtering_end_time = time.perf_counter()
-            print(f"[TIME_LOG] Final result diversification/filtering took {filtering_end_time - filtering_start_time:.4f} seconds.")
+            # Optional MMR over the candidates' embeddings; falls back to the per-video cap
+            final_results = mmr_utils.diversify(supabase, reranked_results, top_k) if mmr_utils.MMR_ENABLED else None
+            if final_results is None:
+                filtering_start_time = time.perf_counter()
+                final_results = []
+                video_counts = {}
+                for chunk in reranked_results:
+                    video_id = chunk.get('video_id')
+                    if video_counts.get(video_id, 0) < 2:
+                        final_results.append(chunk)
+                        video_counts[video_id] = video_counts.get(video_id, 0) + 1
+                    if len(final_results) >= top_k:
+                        break
+                filtering_end_time = time.perf_counter()
+                print(f"[TIME_LOG] Final result diversification/filtering took {filtering_end_time - filtering_start_time:.4f} seconds.")
             print(f"Selected {len(final_results)} diverse, highly relevant chunks for the context.")
         else:
             print("Re-ranking is disabled via environment variable. Using pure semantic search.")
-            final_results = initial_results[:top_k]
+            final_results = mmr_utils.diversify(supabase, initial_results, top_k) if mmr_utils.MMR_ENABLED else None
+            if final_results is None:
+                final_results = initial_results[:top_k]
             print(f"Selected top {len(final_results)} chunks from semantic search.")
         
         total_end_time = time.perf_counter()
@@ -663,16 +893,36 @@ def count_tokens(text: str, model: str = "gpt-4") -> int:
     Counts the number of tokens in a text string using tiktoken.
     Falls back to a default encoder if the model name is not recognized.
     """
-    try:
-        # Get the encoding for a specific model
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        # If the model is not found, use a general-purpose encoding
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
-    return len(encoding.encode(text))
+    # The encoder is cached per model; looking it up costs more than encoding a prompt
+    return len(context_assembler.get_encoder(model).encode(text))
+
+def _check_and_record_bot_query(user_id: str, channel_data: Optional[dict], active_community_id: Optional[str]):
+    """Checks the integration query limits and deducts one query. Returns (allowed, error_msg)."""
+    from . import db_utils
+    allowed, error_msg, resolved_community_id, seller_id_to_charge = db_utils.check_bot_query_allowed(
+        user_id, channel_data, active_community_id
+    )
+    if not allowed:
+        return False, error_msg
+
+    # Deduct from seller if marketplace allocation is active and seller has credits,
+    # otherwise deduct from buyer's personal pool.
+    if seller_id_to_charge == 'skip_charge':
+        pass
+    elif seller_id_to_charge:
+        db_utils.record_bot_query_usage(seller_id_to_charge, resolved_community_id)
+    else:
+        db_utils.record_bot_query_usage(user_id, resolved_community_id)
+    return True, None
 
-def answer_question_stream(
+
+MANAGER_INSTRUCTION = (
+    "You are the business assistant. The person speaking to you right now is the OWNER/MANAGER of the business. "
+    "Do not try to sell to them. Be concise, report facts, and assist them administratively."
+)
+
+
+def _prepare_answer(
     question_for_prompt: str, 
     question_for_search: str, 
     channel_data: dict = None, 
@@ -688,46 +938,80 @@ def answer_question_stream(
     image_base64: str = None,
     image_mime_type: str = None,
     integration_source: str = 'web'
-) -> Iterator[str]:
+) -> dict:
     """
-    Finds relevant context and streams an answer, optionally including an image. Now deducts bot queries synchronously.
+    Everything answer_question_stream does before the LLM call: limits, user status,
+    answer cache, retrieval and prompt assembly. Returns a plan dict:
+
+        events  AnswerEvents to send before generation
+        done    True when the request already finished (error, no context, cache hit)
+
+    plus, when not done, what the stream and _finish_answer need (prompt, model,
+    stream_kwargs, formatted_sources, ...). Shared by the sync and async generators.
     """
     from tasks import post_answer_processing_task
-    from . import db_utils 
 
-    if on_complete is None and user_id:
+    total_request_start_time = time.perf_counter()
+
+    chat_history_for_prompt = ""
+    original_question = question_for_prompt 
+    history_marker = "Now, answer this new question, considering the history as context:\n"
+    if history_marker in question_for_prompt:
+        parts = question_for_prompt.split(history_marker)
+        history_section = parts[0]
+        original_question = parts[1]
+        chat_history_for_prompt = history_section.replace("Given the following conversation history:\n", "").replace("--- End History ---\n\n", "")
+
+    # Only first-turn, text-only questions are cacheable: history, images, manager
+    # mode and lead capture all make the answer depend on more than the question.
+    cache_eligible = (
+        answer_cache.ANSWER_CACHE_ENABLED and bool(channel_data) and bool(user_id)
+        and not chat_history_for_prompt and not image_base64 and not is_manager
+        and not channel_data.get('lead_capture_enabled')
+    )
+
+    # --- PERFORMANCE: Start every independent remote fetch at once; join them before prompt assembly ---
+    # Retrieval is speculative unless the answer cache could short-circuit it, in which case it
+    # starts right after the cache lookup (which needs the plan tier and the query embedding).
+    prefetch = StagedPrefetch()
+    check_query_limits = on_complete is None and bool(user_id)
+    if check_query_limits:
         # Integration path: check limits before proceeding
-        allowed, error_msg, resolved_community_id, seller_id_to_charge = db_utils.check_bot_query_allowed(
-            user_id, channel_data, active_community_id
-        )
+        prefetch.submit('query_limits', _check_and_record_bot_query, user_id, channel_data, active_community_id)
+    if user_status is None:
+        prefetch.submit('user_status', get_user_status, user_id, active_community_id)
+    if channel_data and channel_data.get('id'):
+        prefetch.submit('flows', flow_registry.get_trigger_prompt, channel_data['id'])
+
+    # Embedding and retrieval cost provider calls and an RPC, so over-quota integration
+    # requests are turned away before either starts.
+    if check_query_limits:
+        allowed, error_msg = prefetch.result('query_limits')
         if not allowed:
-            yield f"data: {json.dumps({'error': 'QUERY_LIMIT_REACHED', 'message': error_msg})}\n\n"
-            yield "data: [DONE]\n\n"
-            return
-        
-        # Deduct from seller if marketplace allocation is active and seller has credits,
-        # otherwise deduct from buyer's personal pool.
-        if seller_id_to_charge == 'skip_charge':
-            pass
-        elif seller_id_to_charge:
-            db_utils.record_bot_query_usage(seller_id_to_charge, resolved_community_id)
-        else:
-            db_utils.record_bot_query_usage(user_id, resolved_community_id)
-    
-    total_request_start_time = time.perf_counter()
+            return {'done': True, 'events': [
+                AnswerEvent(EVENT_ERROR, {'error': 'QUERY_LIMIT_REACHED', 'message': error_msg}),
+                AnswerEvent(EVENT_DONE),
+            ]}
+
+    if cache_eligible:
+        prefetch.submit('query_embedding', create_query_embedding, question_for_search)
+    elif user_id:
+        prefetch.submit('context', get_routed_context, question_for_search, channel_data, user_id, access_token)
 
-    # --- PERFORMANCE: Use pre-fetched user_status if available, otherwise fetch ---
     if user_status is None:
-        user_status = get_user_status(user_id, active_community_id)
+        user_status = prefetch.result('user_status')
     plan_id = user_status.get('plan_name', 'Free') if user_status else 'Free'
     print(f"<<<<<<<<<<<<DEBUG: Answering for user {user_id}. Detected plan_id: '{plan_id}'>>>>>>>>>>>>>>>>>")
     if 'Creator' in plan_id:
+        plan_tier = 'creator'
         max_tokens = 4096
         word_count_guideline = "around 800-1000 words"
     elif any(p in plan_id for p in ['Personal', 'pro', 'rich']):
+        plan_tier = 'personal'
         max_tokens = 2048
         word_count_guideline = "around 400-500 words"
     else:
+        plan_tier = 'free'
         max_tokens = 1024
         word_count_guideline = "around 200-250 words"
 
@@ -750,31 +1034,48 @@ def answer_question_stream(
     print("---------------------------------------------------------")
 
     current_date = datetime.datetime.utcnow().strftime("%B %d, %Y")
-
-    chat_history_for_prompt = ""
-    original_question = question_for_prompt 
-    history_marker = "Now, answer this new question, considering the history as context:\n"
-    if history_marker in question_for_prompt:
-        parts = question_for_prompt.split(history_marker)
-        history_section = parts[0]
-        original_question = parts[1]
-        chat_history_for_prompt = history_section.replace("Given the following conversation history:\n", "").replace("--- End History ---\n\n", "")
     print(f"Answering question for user {user_id}: '{original_question[:100]}...'")
     
     if not user_id:
-        yield "data: {\"error\": \"User not identified. Please log in.\"}\n\n"
-        return
+        return {'done': True, 'events': [AnswerEvent(EVENT_ERROR, {'error': 'User not identified. Please log in.'})]}
+
+    # --- PERFORMANCE: Semantic answer cache ---
+    cache_query_embedding = None
+    if cache_eligible:
+        cache_query_embedding = prefetch.result('query_embedding')
+        cached = answer_cache.lookup(channel_data, plan_tier, cache_query_embedding)
+        if cached:
+            print(f"[ANSWER_CACHE] Hit (distance={cached['distance']:.4f}) for: '{cached['question'][:80]}'")
+            events = [AnswerEvent(EVENT_SOURCES, cached['sources']), AnswerEvent(EVENT_DELTA, cached['answer'])]
+            events.extend(_completion_events(on_complete))
+            events.append(AnswerEvent(EVENT_DONE))
+            try:
+                channel_name_for_history = conversation_id or channel_data.get('channel_name', 'general')
+                post_answer_processing_task(
+                    user_id=user_id,
+                    channel_name=channel_name_for_history,
+                    question=original_question,
+                    answer=cached['answer'],
+                    sources=cached['sources'],
+                    integration_source=integration_source
+                )
+            except Exception as e:
+                logging.error(f"post_answer_processing_task failed: {e}", exc_info=True)
+            print(f"[TIME_LOG] Total answer_question_stream request (answer cache hit) took {time.perf_counter() - total_request_start_time:.4f} seconds.")
+            return {'done': True, 'events': events}
 
-    relevant_chunks = get_routed_context(question_for_search, channel_data, user_id, access_token)
+        prefetch.submit('context', get_routed_context, question_for_search, channel_data, user_id, access_token)
+
+    relevant_chunks = prefetch.result('context')
 
     if relevant_chunks == "JWT_EXPIRED":
-        yield 'data: {"error": "JWT_EXPIRED"}\n\n'
-        return
+        return {'done': True, 'events': [AnswerEvent(EVENT_ERROR, {'error': 'JWT_EXPIRED'})]}
     
     if not relevant_chunks:
-        yield "data: {\"answer\": \"I couldn't find any relevant information in the documents to answer your question.\"}\n\n"
-        yield "data: [DONE]\n\n"
-        return
+        return {'done': True, 'events': [
+            AnswerEvent(EVENT_DELTA, "I couldn't find any relevant information in the documents to answer your question."),
+            AnswerEvent(EVENT_DONE),
+        ]}
 
     sources_dict = {}
     for chunk in relevant_chunks:
@@ -797,155 +1098,66 @@ def answer_question_stream(
         except Exception:
             continue
     formatted_sources = sorted(list(sources_dict.values()), key=lambda s: s['title'])
-    yield f"data: {json.dumps({'sources': formatted_sources})}\n\n"
-
-    # Format context based on source type
-    context_parts = []
-    for chunk in relevant_chunks:
-        source_type = chunk.get('source_type', 'youtube')
-        title = chunk.get('video_title') or chunk.get('title') or 'Unknown Source'
-        date = chunk.get('upload_date') or chunk.get('date') or 'N/A'
-        text = chunk.get('chunk_text', '')
-
-        if source_type == 'whatsapp':
-            context_parts.append(f"[WhatsApp Chat: \"{title}\" | {date}]\n{text}")
-        elif source_type == 'website':
-            context_parts.append(f"[Website: \"{title}\" | {chunk.get('url')}]\n{text}")
-        else:
-            context_parts.append(f"[Video: \"{title}\" | {date}]\n{text}")
-    context = '\n\n'.join(context_parts)
+    events = [AnswerEvent(EVENT_SOURCES, formatted_sources)]
+
+    # Format context based on source type; adjacent chunks are merged and the total fits the plan's token budget
+    context, _ = context_assembler.assemble_context(
+        relevant_chunks,
+        token_budget=context_assembler.token_budget_for_plan(plan_tier),
+        model=os.environ.get('MODEL_NAME')
+    )
     
     if channel_data:
-        creator_name = channel_data.get('creator_name', channel_data.get('channel_name', 'the creator'))
-        speaking_style = channel_data.get('speaking_style', 'Professional and helpful. Provide clear, accurate information.')
-        bot_type = channel_data.get('bot_type', 'youtuber')  # Default to youtuber for legacy bots
-        promotion_triggers = channel_data.get('promotion_triggers')
-        
-        if promotion_triggers:
-            speaking_style += f"\n\nCRITICAL INSTRUCTIONS / PROMOTION TRIGGERS:\n{promotion_triggers}"
-        
-        # Select prompt based on bot type
-        if bot_type == 'business':
-            prompt_template = prompts.BUSINESS_SUPPORT_PROMPT
-            print("Using BUSINESS SUPPORT Persona Prompt")
-            prompt = prompt_template.format(
-                business_name=creator_name,
-                context=context,
-                current_date=current_date,
-                question=original_question,
-                chat_history=chat_history_for_prompt or "This is the first message in the conversation.",
-                word_count=word_count_guideline,
-                speaking_style=speaking_style
-            )
-        elif bot_type == 'general':
-            prompt_template = prompts.GENERAL_ASSISTANT_PROMPT
-            print("Using GENERAL ASSISTANT Persona Prompt")
-            prompt = prompt_template.format(
-                bot_name=creator_name,
-                context=context,
-                current_date=current_date,
-                question=original_question,
-                chat_history=chat_history_for_prompt or "This is the first message in the conversation.",
-                word_count=word_count_guideline,
-                speaking_style=speaking_style
-            )
-        else:  # youtuber (default)
-            prompt_template = prompts.HYBRID_PERSONA_PROMPT
-            print("Using YOUTUBER/CREATOR Persona Prompt with Soul + Style Guidance")
-            creator_soul = channel_data.get('creator_soul', '')
-
-            # --- Extract creator-specific anti-patterns from soul profile at runtime ---
-            # Looks for the 'LANGUAGE & STYLE TO AVOID' section added by the updated extraction prompt.
-            # Backward-compatible: returns empty string for channels processed before this update.
-            creator_antipatterns = ""
-            if creator_soul:
-                soul_lower = creator_soul.lower()
-                antipattern_markers = [
-                    '**language & style to avoid',
-                    '**language to avoid',
-                    '**anti-patterns',
-                    '**what they never say',
-                    '**style to avoid',
-                ]
-                for marker in antipattern_markers:
-                    idx = soul_lower.find(marker)
-                    if idx != -1:
-                        section_start = creator_soul.find('\n', idx) + 1
-                        next_section_idx = creator_soul.find('\n**', section_start)
-                        if next_section_idx != -1:
-                            raw_antipatterns = creator_soul[section_start:next_section_idx].strip()
-                        else:
-                            raw_antipatterns = creator_soul[section_start:section_start + 600].strip()
-                        if raw_antipatterns:
-                            creator_antipatterns = (
-                                "\n**Additional Creator-Specific Anti-Patterns (from their actual content):**\n"
-                                + raw_antipatterns
-                            )
-                            print(f"[PERSONA] Injected creator anti-patterns ({len(creator_antipatterns)} chars)")
-                        break
-
-            prompt = prompt_template.format(
-                creator_name=creator_name,
-                context=context,
-                current_date=current_date,
-                question=original_question,
-                chat_history=chat_history_for_prompt or "This is the first message in the conversation.",
-                word_count=word_count_guideline,
-                speaking_style=speaking_style,
-                creator_soul=creator_soul or "Not yet analyzed. Use speaking style and context to infer personality.",
-                creator_antipatterns=creator_antipatterns
-            )
-    else:
-        prompt = prompts.NEUTRAL_ASSISTANT_PROMPT.format(context=context, question=original_question)
+        # The persona prefix is compiled when the channel's settings change (persona_compiler);
+        # everything per-turn goes after it so the prompt starts with the same bytes every time.
+        persona_prefix = persona_compiler.get_persona_prefix(channel_data)
+        prompt_blocks = [persona_prefix]
 
-    # --- Manager Persona Mode vs Lead Capture Mode ---
-    if is_manager:
-        manager_instruction = (
-            "You are the business assistant. The person speaking to you right now is the OWNER/MANAGER of the business. "
-            "Do not try to sell to them. Be concise, report facts, and assist them administratively."
-        )
-        prompt = manager_instruction + "\n\n" + prompt
-        print("[MANAGER_MODE] Manager persona active — instructions prepended to prompt.")
-    elif channel_data and channel_data.get('lead_capture_enabled'):
-        lead_fields = channel_data.get('lead_capture_fields') or []
-        lead_custom_prompt = channel_data.get('lead_capture_prompt', '')
+        # --- AI Flow Trigger Settings ---
         try:
-            from utils.lead_capture_utils import build_lead_prompt
-            lead_instructions = build_lead_prompt(lead_fields, custom_intro=lead_custom_prompt)
-            if lead_instructions:
-                prompt = lead_instructions + "\n" + prompt
-                print("[LEAD_CAPTURE] Lead capture mode active — instructions prepended to prompt.")
-        except Exception as lc_err:
-            logging.warning(f"[LEAD_CAPTURE] Could not build lead prompt: {lc_err}")
-
-    # --- AI Flow Trigger Settings ---
-    if channel_data:
-        try:
-            from . import db_utils
-            # Let's see if we have flow tools
-            flow_res = get_supabase_admin_client().table('channel_flows').select('id, name, flow_data').eq('channel_id', channel_data['id']).eq('is_active', True).execute()
-            if flow_res.data:
-                flows_list = []
-                for f in flow_res.data:
-                    instructions = ""
-                    if f.get('flow_data') and f['flow_data'].get('ai_instructions'):
-                        instructions = f" (TRIGGER WHEN: {f['flow_data']['ai_instructions']})"
-                    flows_list.append(f"- Name: \"{f['name']}\" | ID: {f['id']}{instructions}")
-
-                flows_list_str = "\n".join(flows_list)
-                flow_instruction = (
-                    "\n\n--- VISUAL FLOW TRIGGERS ---\n"
-                    "You have the ability to hand over the conversation to specific visual workflows configured by the user, if the user's intent matches.\n"
-                    f"Available Flows:\n{flows_list_str}\n\n"
-                    "If the user asks to start one of these flows, or their intent precisely matches the general purpose of one of these flows (e.g., booking, support, survey), or if their message matches the 'TRIGGER WHEN' rules defined above, you MUST STOP answering their prompt directly, and instead trigger the workflow.\n"
-                    "To trigger a flow, simply append the exact tag: [TRIGGER_FLOW: \"<FLOW_NAME>\"] at the very end of your response.\n"
-                    "IMPORTANT: Use only the exact name exactly as written in the Available Flows list above.\n"
-                    "Example: \"I'll redirect you to our booking system now! [TRIGGER_FLOW: \"Booking\"]\"\n"
-                )
-                prompt = flow_instruction + "\n" + prompt
+            # Compiled per channel by the flow registry (cached, invalidated when flows change)
+            flow_instruction = prefetch.result('flows')
+            if flow_instruction:
+                prompt_blocks.append(flow_instruction.strip('\n'))
         except Exception as f_err:
             logging.warning(f"Could not load channel flows for AI context: {f_err}")
 
+        # --- Manager Persona Mode vs Lead Capture Mode ---
+        if is_manager:
+            prompt_blocks.append("# ---\n# MANAGER MODE\n" + MANAGER_INSTRUCTION)
+            print("[MANAGER_MODE] Manager persona active — instructions added to prompt.")
+        elif channel_data.get('lead_capture_enabled'):
+            lead_fields = channel_data.get('lead_capture_fields') or []
+            lead_custom_prompt = channel_data.get('lead_capture_prompt', '')
+            try:
+                from utils.lead_capture_utils import build_lead_prompt
+                lead_instructions = build_lead_prompt(lead_fields, custom_intro=lead_custom_prompt)
+                if lead_instructions:
+                    prompt_blocks.append(lead_instructions.strip('\n'))
+                    print("[LEAD_CAPTURE] Lead capture mode active — instructions added to prompt.")
+            except Exception as lc_err:
+                logging.warning(f"[LEAD_CAPTURE] Could not build lead prompt: {lc_err}")
+
+        turn = persona_compiler.turn_template(channel_data).format(
+            creator_name=persona_compiler.display_name(channel_data),
+            context=context,
+            current_date=current_date,
+            question=original_question,
+            chat_history=chat_history_for_prompt or "This is the first message in the conversation.",
+            word_count=word_count_guideline,
+        )
+        prompt_blocks.append(turn.lstrip('\n'))
+        prompt = '\n\n'.join(prompt_blocks)
+        print(f"Using {persona_compiler.bot_type_for(channel_data).upper()} persona prompt "
+              f"(prefix {len(persona_prefix)} chars, turn {len(prompt) - len(persona_prefix)} chars)")
+    else:
+        prompt = prompts.NEUTRAL_ASSISTANT_PROMPT.format(context=context, question=original_question)
+        if is_manager:
+            prompt = MANAGER_INSTRUCTION + "\n\n" + prompt
+            print("[MANAGER_MODE] Manager persona active — instructions prepended to prompt.")
+
+    prefetch.log_timings()
+
     model = os.environ.get('MODEL_NAME')
     ollama_url = os.environ.get('OLLAMA_URL')
     openai_base_url = os.environ.get('OPENAI_API_BASE_URL', 'https://api.openai.com/v1')
@@ -953,16 +1165,11 @@ def answer_question_stream(
     prompt_token_count = count_tokens(prompt, model)
     print(f"  Prompt Token Count:     {prompt_token_count}")
     
-    stream_function = LLM_STREAM_PROVIDER_MAP.get(llm_provider)
-    if not stream_function:
-        yield "data: {\"answer\": \"Error: The selected LLM provider does not support streaming.\"}\n\n"
-        yield "data: [DONE]\n\n"
-        return
+    if llm_provider not in LLM_STREAM_PROVIDER_MAP:
+        events.append(AnswerEvent(EVENT_DELTA, "Error: The selected LLM provider does not support streaming."))
+        events.append(AnswerEvent(EVENT_DONE))
+        return {'done': True, 'events': events}
 
-    full_answer = ""
-    llm_stream_start_time = time.perf_counter()
-    first_token_time_logged = False
-    
     stream_kwargs = {
         'api_key': api_key,
         'ollama_url': ollama_url,
@@ -973,15 +1180,108 @@ def answer_question_stream(
         'image_mime_type': image_mime_type
     }
 
+    return {
+        'done': False,
+        'events': events,
+        'llm_provider': llm_provider,
+        'model': model,
+        'prompt': prompt,
+        'stream_kwargs': stream_kwargs,
+        'formatted_sources': formatted_sources,
+        'cache_query_embedding': cache_query_embedding,
+        'plan_tier': plan_tier,
+        'original_question': original_question,
+        'question_for_search': question_for_search,
+        'channel_data': channel_data,
+        'user_id': user_id,
+        'conversation_id': conversation_id,
+        'integration_source': integration_source,
+        'on_complete': on_complete,
+        'start_time': total_request_start_time,
+    }
+
+
+def _completion_events(on_complete) -> list:
+    """Runs the caller's on_complete hook; the updated query string (if any) is sent to the client."""
+    if not on_complete:
+        return []
+    query_string = on_complete()
+    if query_string:
+        return [AnswerEvent(EVENT_QUERY_STRING, query_string)]
+    return []
+
+
+def _finish_answer(plan: dict, full_answer: str) -> None:
+    """Caches the answer and queues history/post-processing once the stream has ended."""
+    from tasks import post_answer_processing_task
+
+    channel_data = plan['channel_data']
+    if full_answer and "Error:" not in full_answer:
+        if plan['cache_query_embedding'] is not None and '[TRIGGER_FLOW' not in full_answer:
+            answer_cache.store(channel_data, plan['plan_tier'], plan['question_for_search'], plan['cache_query_embedding'], full_answer, plan['formatted_sources'])
+        try:
+            channel_name_for_history = plan['conversation_id'] or (channel_data.get('channel_name', 'general') if channel_data else 'general')
+            post_answer_processing_task(
+                user_id=plan['user_id'],
+                channel_name=channel_name_for_history,
+                question=plan['original_question'],
+                answer=full_answer,
+                sources=plan['formatted_sources'],
+                integration_source=plan['integration_source']
+            )
+        except Exception as e:
+            logging.error(f"post_answer_processing_task failed: {e}", exc_info=True)
+    
+    total_request_end_time = time.perf_counter()
+    print(f"[TIME_LOG] Total answer_question_stream request (end-to-end) took {total_request_end_time - plan['start_time']:.4f} seconds.")
+
+
+def answer_question_events(
+    question_for_prompt: str, 
+    question_for_search: str, 
+    channel_data: dict = None, 
+    video_ids: set = None, 
+    user_id: str = None, 
+    access_token: str = None, 
+    tone: str = 'Casual', 
+    on_complete: callable = None, 
+    conversation_id: str = None, 
+    active_community_id: str = None, 
+    user_status: dict = None, 
+    is_manager: bool = False,
+    image_base64: str = None,
+    image_mime_type: str = None,
+    integration_source: str = 'web'
+) -> Iterator[AnswerEvent]:
+    """
+    Finds relevant context and streams an answer, optionally including an image. Now deducts bot queries synchronously.
+    Yields typed AnswerEvents (see answer_api) with one delta event per provider chunk.
+    Integrations should use answer_api.answer() or this iterator rather than re-parsing
+    SSE frames, and should drain it: history is saved after the done event.
+    """
+    plan = _prepare_answer(
+        question_for_prompt, question_for_search, channel_data, video_ids, user_id, access_token,
+        tone, on_complete, conversation_id, active_community_id, user_status, is_manager,
+        image_base64, image_mime_type, integration_source
+    )
+    yield from plan['events']
+    if plan['done']:
+        return
+
+    full_answer = ""
+    llm_stream_start_time = time.perf_counter()
+    first_token_time_logged = False
+
     try:
-        for chunk in stream_function(prompt, model, **stream_kwargs):
+        # Hedges to LLM_HEDGE_PROVIDER when the primary is slow to its first token (plain stream otherwise)
+        for chunk in llm_hedging.hedged_stream(plan['llm_provider'], plan['prompt'], plan['model'], plan['stream_kwargs']):
             if not first_token_time_logged:
                 first_token_end_time = time.perf_counter()
                 print(f"[TIME_LOG] LLM time to first token: {first_token_end_time - llm_stream_start_time:.4f} seconds.")
                 first_token_time_logged = True
 
             full_answer += chunk
-            yield f"data: {json.dumps({'answer': chunk})}\n\n"
+            yield AnswerEvent(EVENT_DELTA, chunk)
 
         llm_stream_end_time = time.perf_counter()
         if not first_token_time_logged and not full_answer:
@@ -989,46 +1289,74 @@ def answer_question_stream(
         else:
             print(f"[TIME_LOG] Full LLM stream generation took {llm_stream_end_time - llm_stream_start_time:.4f} seconds.")
 
-        if on_complete:
-            query_string = on_complete()
-            if query_string:
-                yield f"data: {json.dumps({'updated_query_string': query_string})}\n\n"
+        yield from _completion_events(plan['on_complete'])
 
     except Exception as e:
         logging.error(f"Streaming error in answer_question_stream: {e}", exc_info=True)
-        yield f"data: {json.dumps({'error': 'An error occurred while generating the answer.'})}\n\n"
+        yield AnswerEvent(EVENT_ERROR, {'error': 'An error occurred while generating the answer.'})
+
+    # Not in a finally: a consumer that stops early closes the generator here.
+    yield AnswerEvent(EVENT_DONE)
+
+    _finish_answer(plan, full_answer)
 
-    finally:
-        yield "data: [DONE]\n\n"
-    
-    if full_answer and "Error:" not in full_answer:
-        try:
-            channel_name_for_history = conversation_id or (channel_data.get('channel_name', 'general') if channel_data else 'general')
-            post_answer_processing_task(
-                user_id=user_id,
-                channel_name=channel_name_for_history,
-                question=original_question,
-                answer=full_answer,
-                sources=formatted_sources,
-                integration_source=integration_source
-            )
-        except Exception as e:
-            logging.error(f"post_answer_processing_task failed: {e}", exc_info=True)
-    
-    total_request_end_time = time.perf_counter()
-    print(f"[TIME_LOG] Total answer_question_stream request (end-to-end) took {total_request_end_time - total_request_start_time:.4f} seconds.")
+
+def answer_question_stream(
+    question_for_prompt: str, 
+    question_for_search: str, 
+    channel_data: dict = None, 
+    video_ids: set = None, 
+    user_id: str = None, 
+    access_token: str = None, 
+    tone: str = 'Casual', 
+    on_complete: callable = None, 
+    conversation_id: str = None, 
+    active_community_id: str = None, 
+    user_status: dict = None, 
+    is_manager: bool = False,
+    image_base64: str = None,
+    image_mime_type: str = None,
+    integration_source: str = 'web'
+) -> Iterator[str]:
+    """
+    answer_question_events encoded as SSE `data:` frames, with answer deltas coalesced.
+    Blocking generator used by the WSGI route; see utils/async_answer.py for the asyncio variant.
+    """
+    return sse_utils.encode_sse(answer_question_events(
+        question_for_prompt=question_for_prompt,
+        question_for_search=question_for_search,
+        channel_data=channel_data,
+        video_ids=video_ids,
+        user_id=user_id,
+        access_token=access_token,
+        tone=tone,
+        on_complete=on_complete,
+        conversation_id=conversation_id,
+        active_community_id=active_community_id,
+        user_status=user_status,
+        is_manager=is_manager,
+        image_base64=image_base64,
+        image_mime_type=image_mime_type,
+        integration_source=integration_source
+    ))
 
     
 def _get_openai_answer_non_stream(prompt: str, model: str, api_key: str, **kwargs):
     """Gets a single, non-streamed response. Supports native Gemini logic and OpenAI-compatible APIs."""
+    provider = kwargs.get('provider', '').lower()
+    if provider == 'gemini' or 'gemini' in model.lower():
+        provider = 'gemini'
+    elif 'groq' in (kwargs.get('base_url') or ''):
+        provider = 'groq'
+    else:
+        provider = 'openai'
     try:
-        provider = kwargs.get('provider', '').lower()
         temperature = kwargs.get('temperature', 0.2) # Lower temp for factual extraction
         max_tokens = kwargs.get('max_tokens', 100)
+        rate_limiter.acquire(provider, api_key)
         
-        if provider == 'gemini' or 'gemini' in model.lower():
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
+        if provider == 'gemini':
+            genai = provider_clients.configure_gemini(api_key)
             model_name = f"models/{model}" if not model.startswith('models/') else model
             gemini_model = genai.GenerativeModel(model_name)
             
@@ -1040,9 +1368,8 @@ def _get_openai_answer_non_stream(prompt: str, model: str, api_key: str, **kwarg
             response = gemini_model.generate_content(prompt, generation_config=gemini_config)
             return response.text if response.text else ""
             
-        import openai
         base_url = kwargs.get('base_url')
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        client = provider_clients.get_openai_client(api_key, base_url)
         response = client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
@@ -1058,6 +1385,8 @@ def _get_openai_answer_non_stream(prompt: str, model: str, api_key: str, **kwarg
             content = response.choices[0]['message']['content']
         return content or ""
     except Exception as e:
+        if rate_limiter.is_rate_limit_error(e):
+            rate_limiter.report_throttled(provider, api_key)
         logging.error(f"Failed to get non-stream response: {e}", exc_info=True)
         return ""
     
@@ -1184,44 +1513,3 @@ def extract_creator_soul(text_sample: str) -> str:
         return soul_profile.strip()
     
     return ""
-
-def _get_transcript_summary(text: str) -> str:
-    """
-    Uses a fast LLM to generate a concise summary of a given text.
-    This is an internal utility and doesn't need to be persona-driven.
-    """
-    print("Generating internal summary from transcript...")
-    try:
-        # We use a fast and efficient model for this internal task.
-        # Groq's Llama3 8B is excellent for summarization.
-        provider = "groq"
-        model = "llama-3.1-8b-instant"
-        api_key = _get_api_key(provider)
-        
-        if not api_key:
-            logging.error("No API key found for internal summarizer (Groq).")
-            return "I couldn't generate a summary at the moment."
-            
-        prompt = f"Please provide a concise, one-paragraph summary of the following video transcript excerpt. Focus on the main topics. Do not start with 'The video is about...'. Just provide the summary.\n\nTranscript:\n\"\"\"\n{text}\n\"\"\""
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "max_tokens": 250,
-        }
-
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        
-        summary = response.json()['choices'][0]['message']['content']
-        print("Internal summary generated successfully.")
-        return summary.strip()
-
-    except Exception as e:
-        logging.error(f"Error in _get_transcript_summary: {e}")
-        return "I was unable to create a summary for the video."
\ No newline at end of file
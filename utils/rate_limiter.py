@@ -0,0 +1,286 @@
+# In utils/rate_limiter.py
+"""
+Cluster-wide adaptive rate limiting for embedding and LLM provider requests.
+
+Each call site used to handle rate limits on its own: exponential sleeps in
+embed_batch_with_retry, _create_gemini_embedding and the transcript fetch
+retries. Nothing was shared between the Huey workers, the Gunicorn threads
+and the Discord service. A large channel ingest could therefore use up a
+provider's quota, and live answers would then hit a storm of 429s.
+
+Every provider request now takes a token from a bucket in Redis. The bucket
+is keyed by provider and a hash of the API key, so all processes share one
+budget per key:
+
+    ratelimit:<provider>:<key hash>   hash {tokens, ts, rate, cut}
+
+The bucket refills at `rate` tokens per second and holds at most
+RATE_LIMIT_BURST_SECONDS of refill. `rate` adapts AIMD-style:
+- A rate-limited response (report_throttled) halves it, down to
+  RATE_LIMIT_MIN_FRACTION of the configured rate, and empties the bucket so
+  every process backs off together.
+- While no 429s arrive, it grows back linearly to the configured rate.
+
+The configured rate is RATE_LIMIT_<PROVIDER>_RPS, with DEFAULT_RPS as the
+fallback.
+
+Two lanes share each bucket:
+
+    interactive   live answers and query embeddings (the default)
+    bulk          ingest: IngestPipeline embedding threads, ingest-time
+                  summaries, transcript downloads
+
+Bulk requests only take a token while the bucket holds more than
+RATE_LIMIT_BULK_RESERVE of its capacity, which keeps the rest for live
+traffic. When chats draw the bucket down to that reserve, ingest waits until
+they ease off. Interactive requests wait at most
+RATE_LIMIT_INTERACTIVE_MAX_WAIT seconds and then go ahead anyway, so a
+starved bucket can slow an answer down but never fail it.
+
+The lane is a per-thread setting (bulk_lane(), set_lane()), so the provider
+functions don't need a new parameter. Without Redis, each process keeps the
+same buckets in memory.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', 2.0))  # bucket capacity, in seconds of refill
+RATE_LIMIT_BULK_RESERVE = float(os.environ.get('RATE_LIMIT_BULK_RESERVE', 0.3))  # fraction of the bucket bulk can't touch
+RATE_LIMIT_MIN_FRACTION = float(os.environ.get('RATE_LIMIT_MIN_FRACTION', 0.05))  # floor for the adapted rate
+RATE_LIMIT_RECOVERY_SECONDS = float(os.environ.get('RATE_LIMIT_RECOVERY_SECONDS', 60))  # min -> full rate without 429s
+RATE_LIMIT_CUT_COOLDOWN = 1.0  # seconds; a burst of 429s from requests already in flight counts as one
+RATE_LIMIT_INTERACTIVE_MAX_WAIT = float(os.environ.get('RATE_LIMIT_INTERACTIVE_MAX_WAIT', 2.0))
+RATE_LIMIT_BULK_MAX_WAIT = float(os.environ.get('RATE_LIMIT_BULK_MAX_WAIT', 300.0))
+
+# Requests per second per API key; override with RATE_LIMIT_<PROVIDER>_RPS (0 disables the limit).
+DEFAULT_RPS = {
+    'openai': 50,
+    'gemini': 25,
+    'groq': 10,
+    'youtube': 2,
+}
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+try:
+    redis_client = redis.from_url(os.environ.get('REDIS_URL'))
+except Exception:
+    redis_client = None
+
+# KEYS[1] bucket; ARGV: max rate, burst seconds, reserve fraction, min rate, recovery per second.
+# Returns the seconds to wait before retrying, "0" when a token was taken.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local max_rate = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local ts = tonumber(state[2]) or now
+local elapsed = math.max(0, now - ts)
+local rate = math.min(max_rate, (tonumber(state[3]) or max_rate) + elapsed * tonumber(ARGV[5]))
+rate = math.max(rate, tonumber(ARGV[4]))
+local capacity = math.max(1, rate * tonumber(ARGV[2]))
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + elapsed * rate)
+local floor = capacity * tonumber(ARGV[3])
+local wait = 0
+if tokens - 1 >= floor then
+  tokens = tokens - 1
+else
+  wait = (floor + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# KEYS[1] bucket; ARGV: max rate, min rate, cooldown seconds. Halves the rate and empties the bucket.
+_CUT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'rate', 'cut')
+if now - (tonumber(state[2]) or 0) < tonumber(ARGV[3]) then
+  return tostring(tonumber(state[1]) or tonumber(ARGV[1]))
+end
+local rate = math.max(tonumber(ARGV[2]), (tonumber(state[1]) or tonumber(ARGV[1])) / 2)
+redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', now, 'rate', rate, 'cut', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(rate)
+"""
+
+_take_script = redis_client.register_script(_TAKE_SCRIPT) if redis_client else None
+_cut_script = redis_client.register_script(_CUT_SCRIPT) if redis_client else None
+
+_thread_state = threading.local()
+_local_buckets = {}  # used when Redis is unavailable: key -> {tokens, ts, rate, cut}
+_local_lock = threading.Lock()
+
+
+def current_lane() -> str:
+    return getattr(_thread_state, 'lane', INTERACTIVE)
+
+
+def set_lane(lane: str) -> None:
+    """Sets the lane for provider requests made from this thread (e.g. ingest worker threads)."""
+    _thread_state.lane = lane
+
+
+@contextmanager
+def bulk_lane():
+    previous = current_lane()
+    set_lane(BULK)
+    try:
+        yield
+    finally:
+        set_lane(previous)
+
+
+def is_rate_limit_error(error) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in ("rate limit", "429", "too many requests", "quota", "resource exhausted", "resourceexhausted"))
+
+
+def provider_rps(provider: str) -> float:
+    return float(os.environ.get(f'RATE_LIMIT_{provider.upper()}_RPS', DEFAULT_RPS.get(provider, 0)))
+
+
+def _bucket_key(provider: str, api_key: Optional[str]) -> str:
+    key_hash = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+    return f"ratelimit:{provider}:{key_hash}"
+
+
+def _script_args(max_rate: float, lane: str):
+    reserve = RATE_LIMIT_BULK_RESERVE if lane == BULK else 0.0
+    min_rate = max_rate * RATE_LIMIT_MIN_FRACTION
+    recovery = (max_rate - min_rate) / max(RATE_LIMIT_RECOVERY_SECONDS, 1e-6)
+    return [max_rate, RATE_LIMIT_BURST_SECONDS, reserve, min_rate, recovery]
+
+
+def _take_local(key: str, max_rate: float, lane: str) -> float:
+    _, burst_seconds, reserve, min_rate, recovery = _script_args(max_rate, lane)
+    now = time.monotonic()
+    with _local_lock:
+        bucket = _local_buckets.get(key)
+        if bucket is None:
+            bucket = _local_buckets[key] = {'tokens': max_rate * burst_seconds, 'ts': now, 'rate': max_rate, 'cut': 0.0}
+        elapsed = max(0.0, now - bucket['ts'])
+        rate = max(min_rate, min(max_rate, bucket['rate'] + elapsed * recovery))
+        capacity = max(1.0, rate * burst_seconds)
+        tokens = min(capacity, bucket['tokens'] + elapsed * rate)
+        floor = capacity * reserve
+        wait = 0.0
+        if tokens - 1 >= floor:
+            tokens -= 1
+        else:
+            wait = (floor + 1 - tokens) / rate
+        bucket.update(tokens=tokens, ts=now, rate=rate)
+        return wait
+
+
+def _cut_local(key: str, max_rate: float) -> float:
+    now = time.monotonic()
+    with _local_lock:
+        bucket = _local_buckets.setdefault(key, {'tokens': 0.0, 'ts': now, 'rate': max_rate, 'cut': 0.0})
+        if now - bucket['cut'] >= RATE_LIMIT_CUT_COOLDOWN:
+            bucket.update(tokens=0.0, ts=now, rate=max(max_rate * RATE_LIMIT_MIN_FRACTION, bucket['rate'] / 2), cut=now)
+        return bucket['rate']
+
+
+def _try_take(key: str, max_rate: float, lane: str) -> float:
+    """Takes a token if one is available to this lane; otherwise returns the seconds to wait."""
+    if _take_script is not None:
+        try:
+            return float(_take_script(keys=[key], args=_script_args(max_rate, lane)))
+        except redis.RedisError as e:
+            logger.warning(f"[RATE_LIMIT] Redis unavailable, limiting per process: {e}")
+    return _take_local(key, max_rate, lane)
+
+
+def _max_wait(lane: str) -> float:
+    return RATE_LIMIT_BULK_MAX_WAIT if lane == BULK else RATE_LIMIT_INTERACTIVE_MAX_WAIT
+
+
+def acquire(provider: str, api_key: Optional[str] = None, lane: Optional[str] = None) -> float:
+    """Blocks until the provider/key bucket grants a request in this lane; returns the seconds waited."""
+    max_rate = provider_rps(provider)
+    if not RATE_LIMIT_ENABLED or max_rate <= 0:
+        return 0.0
+    lane = lane or current_lane()
+    key = _bucket_key(provider, api_key)
+    start = time.monotonic()
+    deadline = start + _max_wait(lane)
+    while True:
+        wait = _try_take(key, max_rate, lane)
+        now = time.monotonic()
+        if wait <= 0:
+            break
+        if now >= deadline:
+            logger.warning(f"[RATE_LIMIT] {provider} {lane} request waited {now - start:.1f}s for quota; sending anyway.")
+            break
+        time.sleep(min(wait, deadline - now))
+    waited = time.monotonic() - start
+    if waited >= 0.5:
+        print(f"[RATE_LIMIT] {provider} {lane} request waited {waited:.2f}s for quota.")
+    return waited
+
+
+async def acquire_async(provider: str, api_key: Optional[str] = None, lane: Optional[str] = None) -> float:
+    """acquire() for the event loop: the bucket check runs in the thread pool and the wait is an asyncio sleep."""
+    max_rate = provider_rps(provider)
+    if not RATE_LIMIT_ENABLED or max_rate <= 0:
+        return 0.0
+    lane = lane or INTERACTIVE
+    key = _bucket_key(provider, api_key)
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    deadline = start + _max_wait(lane)
+    while True:
+        wait = await loop.run_in_executor(None, _try_take, key, max_rate, lane)
+        now = time.monotonic()
+        if wait <= 0 or now >= deadline:
+            break
+        await asyncio.sleep(min(wait, deadline - now))
+    return time.monotonic() - start
+
+
+def report_throttled(provider: str, api_key: Optional[str] = None) -> None:
+    """Records a rate-limited response: halves the key's rate and empties its bucket, cluster-wide."""
+    max_rate = provider_rps(provider)
+    if not RATE_LIMIT_ENABLED or max_rate <= 0:
+        return
+    key = _bucket_key(provider, api_key)
+    rate = None
+    if _cut_script is not None:
+        try:
+            rate = float(_cut_script(keys=[key], args=[max_rate, max_rate * RATE_LIMIT_MIN_FRACTION, RATE_LIMIT_CUT_COOLDOWN]))
+        except redis.RedisError as e:
+            logger.warning(f"[RATE_LIMIT] Redis unavailable, limiting per process: {e}")
+    if rate is None:
+        rate = _cut_local(key, max_rate)
+    logger.warning(f"[RATE_LIMIT] {provider} rate limited; sending at {rate:.2f} req/s until it recovers.")
+
+
+@contextmanager
+def limit(provider: str, api_key: Optional[str] = None, lane: Optional[str] = None):
+    """Acquires before the request; reports a throttle if the request raises a rate-limit error."""
+    acquire(provider, api_key, lane)
+    try:
+        yield
+    except Exception as e:
+        if is_rate_limit_error(e):
+            report_throttled(provider, api_key)
+        raise
@@ -0,0 +1,232 @@
+# In utils/rerank_utils.py
+"""
+Micro-batching for the cross-encoder reranker.
+
+Every Gunicorn thread / Huey worker used to call CrossEncoder.predict on its own
+~55 pairs, so concurrent requests fought for the CPU with many small batches.
+RerankBatcher queues pairs from concurrent callers and flushes them as one
+padded batch when either RERANK_BATCH_MAX_SIZE pairs are waiting or
+RERANK_BATCH_WINDOW_MS has elapsed since the first queued request. Each caller
+gets back exactly its own scores.
+
+The same batcher can run in-process (shared by the threads of one worker) or
+behind rerank_service.py as a separate local process shared by every worker;
+RemoteReranker is the client for the latter. Requests and replies travel as
+JSON (send_bytes/recv_bytes), never pickle, so a peer that reaches
+RERANK_SERVICE_ADDRESS can at most ask for scores. Set RERANK_SERVICE_AUTHKEY
+to also require the multiprocessing HMAC handshake; there is no default key.
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RERANK_BATCH_MAX_SIZE = int(os.environ.get('RERANK_BATCH_MAX_SIZE', 256))  # pairs per flush
+RERANK_BATCH_WINDOW_MS = float(os.environ.get('RERANK_BATCH_WINDOW_MS', 8))
+RERANK_SERVICE_ADDRESS = os.environ.get('RERANK_SERVICE_ADDRESS')  # e.g. "127.0.0.1:6011"
+RERANK_SERVICE_AUTHKEY = os.environ.get('RERANK_SERVICE_AUTHKEY', '').encode('utf-8') or None  # optional HMAC handshake
+RERANK_SERVICE_TIMEOUT = float(os.environ.get('RERANK_SERVICE_TIMEOUT', 10))  # seconds
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def _send(conn, message) -> None:
+    conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+
+def _recv(conn):
+    return json.loads(conn.recv_bytes().decode('utf-8'))
+
+
+def _valid_pairs(payload) -> bool:
+    return isinstance(payload, list) and all(
+        isinstance(pair, list) and len(pair) == 2 and all(isinstance(text, str) for text in pair)
+        for pair in payload
+    )
+
+
+class RerankBatcher:
+    """Coalesces score requests from many threads into batched predict calls."""
+
+    def __init__(self, predict_fn: Callable[[List[List[str]]], Sequence[float]],
+                 max_batch_size: int = RERANK_BATCH_MAX_SIZE,
+                 window_ms: float = RERANK_BATCH_WINDOW_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'pairs': 0,
+            'flushes': 0,
+            'max_batch_pairs': 0,
+            'max_queue_depth': 0,
+            'predict_seconds': 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name='rerank-batcher', daemon=True)
+        self._worker.start()
+
+    def score(self, pairs: List[List[str]], timeout: Optional[float] = None) -> List[float]:
+        """Blocks until this caller's pairs have been scored as part of a batch."""
+        if not pairs:
+            return []
+        future: Future = Future()
+        self._queue.put((pairs, future))
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self._metrics['requests'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], depth)
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            pair_count = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while pair_count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                pair_count += len(item[0])
+            self._flush(pending, pair_count)
+
+    def _flush(self, pending, pair_count: int):
+        all_pairs = [pair for pairs, _ in pending for pair in pairs]
+        start = time.perf_counter()
+        try:
+            scores = list(self.predict_fn(all_pairs))
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+
+        offset = 0
+        for pairs, future in pending:
+            future.set_result([float(s) for s in scores[offset:offset + len(pairs)]])
+            offset += len(pairs)
+
+        with self._metrics_lock:
+            self._metrics['pairs'] += pair_count
+            self._metrics['flushes'] += 1
+            self._metrics['max_batch_pairs'] = max(self._metrics['max_batch_pairs'], pair_count)
+            self._metrics['predict_seconds'] += elapsed
+        print(f"[RERANK_BATCH] Scored {pair_count} pairs from {len(pending)} requests in {elapsed:.4f}s")
+
+    def get_metrics(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['avg_batch_pairs'] = round(metrics['pairs'] / metrics['flushes'], 2) if metrics['flushes'] else 0.0
+        metrics['avg_requests_per_flush'] = round(metrics['requests'] / metrics['flushes'], 2) if metrics['flushes'] else 0.0
+        return metrics
+
+
+class RemoteReranker:
+    """Client for rerank_service.py. Keeps one connection per calling thread."""
+
+    def __init__(self, address: str = RERANK_SERVICE_ADDRESS, authkey: bytes = RERANK_SERVICE_AUTHKEY,
+                 timeout: float = RERANK_SERVICE_TIMEOUT):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _request(self, command: str, payload=None):
+        try:
+            conn = self._connection()
+            _send(conn, [command, payload])
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Rerank service did not answer within {self.timeout}s")
+            status, result = _recv(conn)
+        except Exception:
+            self._reset()
+            raise
+        if status != 'ok':
+            raise RuntimeError(f"Rerank service error: {result}")
+        return result
+
+    def score(self, pairs: List[List[str]]) -> List[float]:
+        if not pairs:
+            return []
+        return self._request('score', [list(pair) for pair in pairs])
+
+    def get_metrics(self) -> dict:
+        return self._request('metrics')
+
+
+def serve(batcher: RerankBatcher, address: str, authkey: bytes = RERANK_SERVICE_AUTHKEY):
+    """Runs the rerank service loop: one handler thread per client connection, one shared batcher."""
+    listener = Listener(parse_address(address), authkey=authkey)
+    logger.info(f"Rerank service listening on {address}")
+    if authkey is None:
+        logger.warning("RERANK_SERVICE_AUTHKEY is not set; any client that can reach the rerank service can use it.")
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    command, payload = _recv(conn)
+                except (EOFError, OSError):
+                    return
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Rerank service dropped a malformed request: {e}")
+                    return
+                try:
+                    if command == 'score' and _valid_pairs(payload):
+                        _send(conn, ['ok', batcher.score(payload)])
+                    elif command == 'metrics':
+                        _send(conn, ['ok', batcher.get_metrics()])
+                    else:
+                        _send(conn, ['error', f"Unknown or malformed command: {command}"])
+                except Exception as e:
+                    logger.error(f"Rerank request failed: {e}", exc_info=True)
+                    try:
+                        _send(conn, ['error', str(e)])
+                    except OSError:
+                        return
+
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.warning(f"Rerank service rejected a connection: {e}")
+            continue
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
@@ -24,6 +24,8 @@ import json
 import os
 import re
 
+from utils import provider_clients
+
 logger = logging.getLogger(__name__)
 
 
@@ -137,8 +139,7 @@ def _call_llm(prompt: str, provider: str, model: str, api_key: str, base_url: st
     """
     try:
         if provider == 'gemini':
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
+            genai = provider_clients.configure_gemini(api_key)
             model_name = f"models/{model}" if not model.startswith('models/') else model
             gemini_model = genai.GenerativeModel(model_name)
             config = genai.types.GenerationConfig(temperature=0.4, max_output_tokens=350)
@@ -153,16 +154,15 @@ def _call_llm(prompt: str, provider: str, model: str, api_key: str, base_url: st
                 'temperature': 0.4,
                 'max_tokens': 350,
             }
-            resp = requests.post(
+            resp = provider_clients.get_http_session().post(
                 'https://api.groq.com/openai/v1/chat/completions',
-                headers=headers, json=payload, timeout=20
+                headers=headers, json=payload, timeout=provider_clients.request_timeout(20)
             )
             resp.raise_for_status()
             return resp.json()['choices'][0]['message']['content']
 
         # Fallback: OpenAI-compatible endpoint
-        import openai
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        client = provider_clients.get_openai_client(api_key, base_url)
         response = client.chat.completions.create(
             model=model,
             messages=[{'role': 'user', 'content': prompt}],
@@ -0,0 +1,150 @@
+# In utils/sse_utils.py
+"""
+Server-sent-event encoding for answer streams.
+
+The answer pipeline produces typed events (answer_api.AnswerEvent, a
+(kind, payload) named tuple): sources, delta, updated_query_string, error and
+done. They map to the frames the web client already parses:
+
+    sources / updated_query_string   data: {"<kind>": payload}
+    delta                            data: {"answer": "..."}
+    error                            data: <payload>     e.g. {"error": "JWT_EXPIRED"}
+    done                             data: [DONE]
+
+Integrations consume the events directly (answer_api.answer). For the
+browser, encode_sse / encode_sse_async turn them into `data:` frames, coalescing
+answer deltas: providers emit a few characters hundreds of times per answer, and
+each frame is a separate write/flush. A delta is flushed at once when the
+previous frame is older than SSE_COALESCE_MS, otherwise it is buffered until
+the window closes, SSE_COALESCE_CHARS accumulate, or another event arrives.
+The async encoder also flushes on the timer and sends `: ping` comments every
+SSE_HEARTBEAT_SECONDS so proxies keep idle streams open.
+"""
+
+import os
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Iterable, Iterator, Any
+
+from .answer_api import AnswerEvent, EVENT_DELTA, EVENT_ERROR, EVENT_DONE
+
+SSE_COALESCE_MS = float(os.environ.get('SSE_COALESCE_MS', 40))
+SSE_COALESCE_CHARS = int(os.environ.get('SSE_COALESCE_CHARS', 200))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+
+DONE_FRAME = "data: [DONE]\n\n"
+HEARTBEAT_FRAME = ": ping\n\n"
+# Answer frames are the hot path: only the delta itself goes through the JSON encoder.
+_ANSWER_PREFIX = 'data: {"answer": '
+_FRAME_SUFFIX = '}\n\n'
+
+
+def encode_event(kind: str, payload: Any) -> str:
+    if kind == EVENT_DELTA:
+        return _ANSWER_PREFIX + json.dumps(payload) + _FRAME_SUFFIX
+    if kind == EVENT_DONE:
+        return DONE_FRAME
+    if kind == EVENT_ERROR:
+        return f"data: {json.dumps(payload)}\n\n"
+    return f"data: {json.dumps({kind: payload})}\n\n"
+
+
+def encode_sse(events: Iterable[AnswerEvent], window_ms: float = SSE_COALESCE_MS, max_chars: int = SSE_COALESCE_CHARS) -> Iterator[str]:
+    """
+    Blocking encoder. It only runs when an event arrives, so a buffered delta waits for
+    the next event (or the end of the stream) at most; keep the window small.
+    """
+    window = window_ms / 1000.0
+    buffered = []
+    buffered_chars = 0
+    last_flush = 0.0
+
+    for kind, payload in events:
+        if kind == EVENT_DELTA:
+            if not payload:
+                continue
+            buffered.append(payload)
+            buffered_chars += len(payload)
+            now = time.perf_counter()
+            if buffered_chars >= max_chars or now - last_flush >= window:
+                yield encode_event(EVENT_DELTA, ''.join(buffered))
+                buffered, buffered_chars, last_flush = [], 0, now
+            continue
+        if buffered:
+            yield encode_event(EVENT_DELTA, ''.join(buffered))
+            buffered, buffered_chars = [], 0
+        yield encode_event(kind, payload)
+        last_flush = time.perf_counter()
+
+    if buffered:
+        yield encode_event(EVENT_DELTA, ''.join(buffered))
+
+
+async def encode_sse_async(
+    events: AsyncIterator[AnswerEvent],
+    window_ms: float = SSE_COALESCE_MS,
+    max_chars: int = SSE_COALESCE_CHARS,
+    heartbeat_seconds: float = SSE_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """Event-loop encoder: time-based flushes and heartbeats without waiting for the next event."""
+    window = window_ms / 1000.0
+    buffered = []
+    buffered_chars = 0
+    last_write = time.perf_counter()
+    buffer_started = 0.0
+    pending = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            now = time.perf_counter()
+            if buffered:
+                timeout = max(0.0, buffer_started + window - now)
+            else:
+                timeout = max(0.0, heartbeat_seconds - (now - last_write))
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                if buffered:
+                    yield encode_event(EVENT_DELTA, ''.join(buffered))
+                    buffered, buffered_chars = [], 0
+                else:
+                    yield HEARTBEAT_FRAME
+                last_write = time.perf_counter()
+                continue
+
+            task, pending = pending, None
+            try:
+                kind, payload = task.result()
+            except StopAsyncIteration:
+                break
+
+            if kind == EVENT_DELTA:
+                if not payload:
+                    continue
+                if not buffered:
+                    buffer_started = time.perf_counter()
+                buffered.append(payload)
+                buffered_chars += len(payload)
+                now = time.perf_counter()
+                # The first delta after a pause goes out immediately; bursts are held for the window.
+                if buffered_chars >= max_chars or (len(buffered) == 1 and now - last_write >= window):
+                    yield encode_event(EVENT_DELTA, ''.join(buffered))
+                    buffered, buffered_chars, last_write = [], 0, now
+                continue
+
+            if buffered:
+                yield encode_event(EVENT_DELTA, ''.join(buffered))
+                buffered, buffered_chars = [], 0
+            yield encode_event(kind, payload)
+            last_write = time.perf_counter()
+
+        if buffered:
+            yield encode_event(EVENT_DELTA, ''.join(buffered))
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await events.aclose()
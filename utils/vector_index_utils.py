@@ -0,0 +1,103 @@
+# In utils/vector_index_utils.py
+"""
+Tooling for per-channel partial HNSW indexes (see channel_vector_indexes.sql).
+
+Once a channel crosses VECTOR_INDEX_MIN_ROWS chunks it gets its own partial
+HNSW index `WHERE channel_id = <id>`, and match_embeddings routes that channel's
+queries to it. Smaller channels are served by an exact scan over their rows.
+
+If SUPABASE_DB_URL (a direct Postgres DSN) is configured, indexes are built
+with CREATE INDEX CONCURRENTLY so ingestion keeps writing while the graph is
+built. Otherwise the ensure_channel_hnsw_index RPC builds it in one call.
+"""
+
+import os
+import logging
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from .supabase_client import get_supabase_admin_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_MIN_ROWS = int(os.environ.get('VECTOR_INDEX_MIN_ROWS', 20000))
+HNSW_M = int(os.environ.get('VECTOR_INDEX_HNSW_M', 16))
+HNSW_EF_CONSTRUCTION = int(os.environ.get('VECTOR_INDEX_HNSW_EF_CONSTRUCTION', 64))
+
+
+def channel_index_name(channel_id: int) -> str:
+    return f"idx_embeddings_hnsw_ch_{int(channel_id)}"
+
+
+def _ensure_with_dsn(channel_id: int, min_rows: int, dsn: str) -> str:
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM public.channel_vector_indexes WHERE channel_id = %s", (channel_id,))
+            if cur.fetchone():
+                return 'exists'
+
+            cur.execute("SELECT COUNT(*) FROM public.embeddings WHERE channel_id = %s", (channel_id,))
+            row_count = cur.fetchone()[0]
+            if row_count < min_rows:
+                return 'below_threshold'
+
+            index_name = channel_index_name(channel_id)
+            logger.info(f"[VECTOR_INDEX] Building {index_name} CONCURRENTLY for channel {channel_id} ({row_count} rows)...")
+            cur.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON public.embeddings "
+                f"USING hnsw (embedding vector_cosine_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}) "
+                f"WHERE channel_id = {int(channel_id)}"
+            )
+            cur.execute(
+                "INSERT INTO public.channel_vector_indexes (channel_id, index_name, row_count) VALUES (%s, %s, %s) "
+                "ON CONFLICT (channel_id) DO UPDATE SET row_count = EXCLUDED.row_count",
+                (channel_id, index_name, row_count)
+            )
+            cur.execute("ANALYZE public.embeddings")
+            return 'created'
+    finally:
+        conn.close()
+
+
+def ensure_channel_vector_index(channel_id: int, min_rows: int = VECTOR_INDEX_MIN_ROWS) -> Optional[str]:
+    """
+    Creates the channel's partial HNSW index if it has crossed `min_rows` chunks.
+    Returns 'exists', 'below_threshold', 'created', or None on failure.
+    """
+    try:
+        dsn = os.environ.get('SUPABASE_DB_URL')
+        if dsn:
+            result = _ensure_with_dsn(channel_id, min_rows, dsn)
+        else:
+            response = get_supabase_admin_client().rpc('ensure_channel_hnsw_index', {
+                'p_channel_id': channel_id,
+                'p_min_rows': min_rows
+            }).execute()
+            result = response.data
+        if result == 'created':
+            logger.info(f"[VECTOR_INDEX] Created partial HNSW index for channel {channel_id}.")
+        return result
+    except Exception as e:
+        logger.error(f"[VECTOR_INDEX] Could not ensure vector index for channel {channel_id}: {e}", exc_info=True)
+        return None
+
+
+def drop_channel_vector_index(channel_id: int) -> bool:
+    try:
+        get_supabase_admin_client().rpc('drop_channel_hnsw_index', {'p_channel_id': channel_id}).execute()
+        return True
+    except Exception as e:
+        logger.error(f"[VECTOR_INDEX] Could not drop vector index for channel {channel_id}: {e}", exc_info=True)
+        return False
+
+
+def get_channel_index_status(min_rows: int = 0) -> List[dict]:
+    """Returns [{'channel_id', 'row_count', 'has_index'}] for channels with at least `min_rows` chunks."""
+    response = get_supabase_admin_client().rpc('get_channel_embedding_counts', {'p_min_rows': min_rows}).execute()
+    return response.data or []
@@ -0,0 +1,180 @@
+# In utils/video_summaries.py
+"""
+Per-video summaries for the "latest video" intent.
+
+get_routed_context used to answer "what's your latest video about?" by reading
+the video's first chunks from `embeddings` and summarising them with a second
+LLM call before the answer itself could start. Summaries are now written when
+videos are ingested: process_channel_task and sync_channel_task summarise the
+VIDEO_SUMMARY_COUNT newest videos from their transcripts and store the text as
+`summary` on the video's entry in channels.videos. The router reads it from
+channel_data, which it already has, so there's no extra LLM call or query.
+
+Channels ingested before this change have no summaries. For those, the router
+uses the opening transcript chunks as context and queues
+summarize_latest_video_task to backfill the summary for later questions. The
+backfill patches only that video's entry (set_video_summary, see
+video_summary_migration.sql), so videos a concurrent sync adds are kept.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from cachetools import TTLCache
+
+from . import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SUMMARY_COUNT = int(os.environ.get('VIDEO_SUMMARY_COUNT', 3))  # newest videos summarised per ingest/sync
+VIDEO_SUMMARY_CHARS = int(os.environ.get('VIDEO_SUMMARY_CHARS', 3600))  # about the first three 1200-char chunks
+SUMMARY_PROVIDER = "groq"
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+
+# Channels with a backfill already queued, so a burst of questions queues it once.
+_queued_backfills = TTLCache(maxsize=4096, ttl=600)
+_queue_lock = threading.Lock()
+_set_summary_rpc_available = True
+
+
+def latest_video(videos: List[dict]) -> Optional[dict]:
+    if not videos:
+        return None
+    return max(videos, key=lambda v: v.get('upload_date') or '')
+
+
+def summarize_text(text: str) -> Optional[str]:
+    """One-paragraph summary of a transcript excerpt from a small, fast model. None on failure."""
+    from .qa_utils import _get_api_key
+    from . import provider_clients
+
+    api_key = _get_api_key(SUMMARY_PROVIDER)
+    if not api_key:
+        logging.error("No API key found for the video summarizer (Groq).")
+        return None
+
+    prompt = f"Please provide a concise, one-paragraph summary of the following video transcript excerpt. Focus on the main topics. Do not start with 'The video is about...'. Just provide the summary.\n\nTranscript:\n\"\"\"\n{text}\n\"\"\""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": SUMMARY_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,
+        "max_tokens": 250,
+    }
+    try:
+        rate_limiter.acquire(SUMMARY_PROVIDER, api_key)
+        response = provider_clients.get_http_session().post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload, timeout=provider_clients.request_timeout())
+        if response.status_code == 429:
+            rate_limiter.report_throttled(SUMMARY_PROVIDER, api_key)
+        response.raise_for_status()
+        summary = response.json()['choices'][0]['message']['content'].strip()
+        return summary or None
+    except Exception as e:
+        logging.error(f"Error summarizing video transcript: {e}")
+        return None
+
+
+def add_summaries(video_data: List[dict], transcripts: List[dict], count: int = VIDEO_SUMMARY_COUNT) -> int:
+    """
+    Sets `summary` on the newest `count` entries of video_data (in place) from the matching
+    transcripts. Entries that already have one are kept. Returns how many were added.
+    """
+    texts = {t['video_id']: t.get('transcript') or '' for t in transcripts}
+    newest = sorted(video_data, key=lambda v: v.get('upload_date') or '', reverse=True)[:count]
+    todo = [v for v in newest if not v.get('summary') and texts.get(v['video_id'])]
+    if not todo:
+        return 0
+    def summarize(video):
+        # Ingest-time work: yields the provider quota to live answers
+        with rate_limiter.bulk_lane():
+            return summarize_text(texts[video['video_id']][:VIDEO_SUMMARY_CHARS])
+
+    with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+        summaries = list(pool.map(summarize, todo))
+    added = 0
+    for video, summary in zip(todo, summaries):
+        if summary:
+            video['summary'] = summary
+            added += 1
+    logger.info(f"[VIDEO_SUMMARY] Summarised {added}/{len(todo)} newest videos")
+    return added
+
+
+def fetch_opening_text(video_id: str, supabase=None) -> str:
+    if supabase is None:
+        from .supabase_client import get_supabase_admin_client
+        supabase = get_supabase_admin_client()
+    response = supabase.table('embeddings').select('metadata').eq('video_id', video_id).order('metadata->>chunk_index', desc=False).limit(3).execute()
+    return " ".join(row['metadata']['chunk_text'] for row in (getattr(response, 'data', None) or []))
+
+
+def backfill_latest(channel_id, supabase=None) -> Optional[str]:
+    """Summarises a channel's latest video from its stored chunks if it has no summary yet."""
+    if supabase is None:
+        from .supabase_client import get_supabase_admin_client
+        supabase = get_supabase_admin_client()
+    res = supabase.table('channels').select('videos').eq('id', channel_id).maybe_single().execute()
+    videos = (res.data or {}).get('videos') if res else None
+    latest = latest_video(videos or [])
+    if not latest or latest.get('summary'):
+        return latest.get('summary') if latest else None
+
+    text = fetch_opening_text(latest.get('video_id'), supabase)
+    with rate_limiter.bulk_lane():
+        summary = summarize_text(text[:VIDEO_SUMMARY_CHARS]) if text else None
+    if not summary:
+        return None
+    store_summary(channel_id, latest.get('video_id'), summary, supabase)
+    logger.info(f"[VIDEO_SUMMARY] Backfilled latest video summary for channel {channel_id} ({latest.get('video_id')})")
+    return summary
+
+
+def store_summary(channel_id, video_id: str, summary: str, supabase) -> None:
+    """
+    Sets `summary` on one entry of channels.videos without rewriting entries added since
+    the caller read the row. Atomic via the set_video_summary RPC; without it, the row is
+    re-read just before the update so the race window is a single round trip.
+    """
+    global _set_summary_rpc_available
+    if _set_summary_rpc_available:
+        try:
+            supabase.rpc('set_video_summary', {
+                'p_channel_id': channel_id,
+                'p_video_id': video_id,
+                'p_summary': summary,
+            }).execute()
+            return
+        except Exception as e:
+            if 'set_video_summary' in str(e) or 'PGRST202' in str(e):
+                logger.warning("[VIDEO_SUMMARY] set_video_summary RPC is not installed (run video_summary_migration.sql). Patching in process.")
+                _set_summary_rpc_available = False
+            else:
+                raise
+
+    res = supabase.table('channels').select('videos').eq('id', channel_id).maybe_single().execute()
+    videos = (res.data or {}).get('videos') if res else None
+    for video in videos or []:
+        if video.get('video_id') == video_id:
+            video['summary'] = summary
+            supabase.table('channels').update({'videos': videos}).eq('id', channel_id).execute()
+            return
+
+
+def queue_backfill(channel_id) -> None:
+    if channel_id is None:
+        return
+    with _queue_lock:
+        if channel_id in _queued_backfills:
+            return
+        _queued_backfills[channel_id] = True
+    try:
+        from tasks import summarize_latest_video_task
+        summarize_latest_video_task(channel_id)
+    except Exception as e:
+        logger.warning(f"[VIDEO_SUMMARY] Could not queue summary backfill for channel {channel_id}: {e}")
@@ -17,6 +17,7 @@ import yt_dlp
 import google.generativeai as genai
 
 import redis
+from utils import rate_limiter
 
 try:
     redis_client = redis.from_url(os.environ.get('REDIS_URL'))
@@ -215,11 +216,14 @@ def get_transcript(video_id: str) -> Optional[str]:
         """Helper to fetch transcript with exponential backoff retry."""
         for attempt in range(max_retries):
             try:
+                # One 'youtube' bucket paces transcript downloads across every worker (only ingest uses it)
+                rate_limiter.acquire('youtube', lane=rate_limiter.BULK)
                 fetched = transcript_obj.fetch()
                 return "\n".join([segment['text'] if isinstance(segment, dict) else segment.text for segment in fetched])
             except Exception as e:
                 error_str = str(e).lower()
                 if 'too many requests' in error_str or 'blocked' in error_str or '429' in error_str:
+                    rate_limiter.report_throttled('youtube')
                     wait_time = (2 ** attempt) * 2  # 2, 4, 8 seconds
                     log.warning(f"[{video_id}] Rate limited on attempt {attempt + 1}, waiting {wait_time}s...")
                     time.sleep(wait_time)
@@ -475,9 +479,11 @@ def _extract_subtitle_text(subtitle_data: List[Dict], video_id: str = '?', video
 
     return lines
 
+@rate_limiter.bulk_lane()
 def _fetch_transcript_worker(info_dict: Dict) -> Optional[Dict]:
     """
     Internal worker function for fetching a single transcript in a parallel thread.
+    Runs in the bulk lane: the lane is per thread, and pool threads don't inherit the task's.
     """
     video_id = info_dict.get('id')
     snippet = info_dict.get('snippet', {})
@@ -517,11 +523,14 @@ def get_transcripts_from_channel(
     target_video_count: int = 50,
     min_duration_seconds: int = 61,
     max_videos_to_scan: int = 500,
-    progress_callback = None
+    progress_callback = None,
+    on_transcript = None
 ) -> Tuple[List[Dict], str, int, List[Dict]]:
     """
     Intelligently finds and processes videos from a channel.
     NOW RETURNS: (successful_transcripts, thumbnail, subs_count, failed_long_form_videos)
+    on_transcript, if given, is called with each transcript as soon as it is fetched
+    (e.g. IngestPipeline.put), so it can be embedded while the rest download.
     """
     start_time = time.perf_counter()
 
@@ -618,6 +627,7 @@ def get_transcripts_from_channel(
                 result = future.result()
                 if result:
                     final_results.append(result)
+                    if on_transcript: on_transcript(result)
         
         completed_count = batch_start + len(batch)
         if progress_callback:
@@ -644,11 +654,13 @@ def get_transcripts_from_channel(
 def get_transcripts_from_urls(
     youtube_api_client,
     video_urls: List[str],
-    min_duration_seconds: int = 61
+    min_duration_seconds: int = 61,
+    on_transcript = None
 ) -> List[Dict]:
     """
     Processes a specific list of video URLs, filters them for long-form content,
     and fetches their transcripts. Ideal for sync tasks.
+    on_transcript is called with each transcript as soon as it is fetched.
     """
     print(f"--- Processing {len(video_urls)} URLs to find long-form content ---")
     video_ids = [match.group(1) for url in video_urls if (match := re.search(r"v=([a-zA-Z0-9_-]+)", url))]
@@ -690,6 +702,7 @@ def get_transcripts_from_urls(
             result = future.result()
             if result:
                 final_results.append(result)
+                if on_transcript: on_transcript(result)
             time.sleep(0.2)
     
     return final_results
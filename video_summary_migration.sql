@@ -0,0 +1,33 @@
+-- ============================================================================
+-- YoppyChat AI — Atomic latest-video summary backfill
+--
+-- Run this in the Supabase SQL Editor.
+--
+-- utils/video_summaries.backfill_latest stores a summary on one entry of
+-- channels.videos. Writing the whole array back from an earlier read would
+-- drop videos that sync_channel_task added while the summary was generated,
+-- so set_video_summary patches the matching entry inside a single UPDATE.
+-- Until this is applied, the code re-reads the row and patches it in process.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.set_video_summary (
+  p_channel_id bigint,
+  p_video_id text,
+  p_summary text
+)
+RETURNS boolean
+LANGUAGE sql
+AS $$
+  UPDATE public.channels c
+  SET videos = (
+    SELECT jsonb_agg(
+             CASE WHEN t.v->>'video_id' = p_video_id
+                  THEN t.v || jsonb_build_object('summary', p_summary)
+                  ELSE t.v END
+             ORDER BY t.ord)
+    FROM jsonb_array_elements(c.videos) WITH ORDINALITY AS t(v, ord)
+  )
+  WHERE c.id = p_channel_id
+    AND c.videos @> jsonb_build_array(jsonb_build_object('video_id', p_video_id))
+  RETURNING true;
+$$;